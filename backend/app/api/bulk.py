@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+BULK_MAX_ROWS = 50000
+BULK_BATCH_SIZE = 1000
+# SQLite ma limit parametrów w zapytaniu; IN (...) dzielimy na porcje
+IN_CHUNK_SIZE = 500
+
+
+class BulkRowError(BaseModel):
+    """Błąd pojedynczego rekordu w imporcie masowym."""
+    row: int = Field(..., description="Indeks rekordu (od 0)")
+    name: Optional[str] = None
+    errors: List[Any]
+
+
+def chunks(seq: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def row_errors(exc: ValidationError) -> List[Dict[str, Any]]:
+    """Błędy walidacji w formie serializowalnej do JSON (bez obiektów wyjątków w ctx)."""
+    return [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in exc.errors()]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from ..change_feed import ChangeFeed, get_change_feed, make_cursor, parse_cursor
+from ..deps import get_db
+
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+STREAM_BATCH = 500
+KEEPALIVE_SECONDS = 15.0
+
+
+class ChangeEvent(BaseModel):
+    version: int
+    entity: str
+    op: str
+    id: Optional[int] = None
+    fields: Optional[List[str]] = None
+    values: Optional[Dict[str, Any]] = None
+
+
+class ChangeBatch(BaseModel):
+    cursor: str
+    reset: bool
+    events: List[ChangeEvent]
+
+
+def sse_message(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def stream_changes(
+    feed: ChangeFeed,
+    since: Optional[int],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    keepalive: float = KEEPALIVE_SECONDS,
+) -> AsyncIterator[str]:
+    """SSE messages from `since` onwards: a `reset` when the cursor cannot be resumed, then `change` events."""
+    waiter = feed.subscribe()
+    try:
+        while True:
+            waiter.clear()
+            reset, events, version = feed.read(since, STREAM_BATCH)
+            if reset:
+                yield sse_message("reset", {"cursor": make_cursor(version)}, make_cursor(version))
+            for event in events:
+                yield sse_message("change", event, make_cursor(event["version"]))
+            since = version
+            if await is_disconnected():
+                return
+            if len(events) >= STREAM_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(waiter.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        feed.unsubscribe(waiter)
+
+
+@router.get("", response_model=ChangeBatch)
+def read_changes(
+    since: Optional[str] = Query(None, description="Cursor from a previous response (omit to get the current cursor)"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """Changes after `since`. `reset=true` means the cursor is too old (or from a previous process): reload everything."""
+    feed = get_change_feed(db)
+    version = parse_cursor(since)
+    reset, events, cursor = feed.read(version, limit)
+    return ChangeBatch(cursor=make_cursor(cursor), reset=reset and since is not None, events=events)
+
+
+@router.get("/stream")
+async def stream(
+    request: Request,
+    since: Optional[str] = Query(None, description="Cursor to resume from (default: now)"),
+    last_event_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """Server-Sent Events stream of changes; browsers resume via Last-Event-ID after reconnecting."""
+    feed = get_change_feed(db)
+    cursor = since or last_event_id
+    version = parse_cursor(cursor) if cursor else feed.version
+    return StreamingResponse(
+        stream_changes(feed, version, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
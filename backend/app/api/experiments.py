@@ -1,12 +1,19 @@
 from enum import Enum
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from sqlalchemy.orm import Session
 
+from ..compute import metrics, run_limited
 from ..deps import get_db
+from ..experiment_compute import doe_points, point_rows
 from ..models.variable import Variable
+from .fast_json import fast_response
+from .run_hashing import request_hash
+from .selection import SelectionSpec, select_variables
+from .runs import PersistedRunResponse, RunType, find_reusable_run, store_run, to_persisted_response
 
 
 class DoEMethod(str, Enum):
@@ -14,18 +21,36 @@ class DoEMethod(str, Enum):
     lhs = "lhs"
 
 
+class PointsLayout(str, Enum):
+    rows = "rows"
+    columns = "columns"
+
+
+class PointColumns(BaseModel):
+    variable_ids: List[int]
+    values: List[List[float]] = Field(..., description="n_points x len(variable_ids) matrix")
+
+
 class DoERequest(BaseModel):
-    variable_ids: List[int] = Field(..., min_length=1, description="IDs of variables included in DOE")
+    variable_ids: Optional[List[int]] = Field(None, min_length=1, description="IDs of variables included in DOE")
+    selection: Optional[SelectionSpec] = Field(None, description="Select the variables from the graph instead")
     n_points: int = Field(20, ge=1, le=5000, description="Number of DOE points to generate")
     method: DoEMethod = Field(DoEMethod.sobol, description="Sampling method")
     seed: int | None = Field(None, description="Optional RNG seed")
 
+    @model_validator(mode="after")
+    def _variables_or_selection(self) -> "DoERequest":
+        if (self.variable_ids is None) == (self.selection is None):
+            raise ValueError("exactly one of variable_ids and selection is required")
+        return self
+
 
 class DoEResponse(BaseModel):
     method: DoEMethod
     n_points: int
     variable_ids: List[int]
     points: List[Dict[str, Any]] = Field(default_factory=list, description="List of experiment points")
+    columns: Optional[PointColumns] = Field(None, description="Points as a matrix (layout=columns; points is empty)")
     meta: Dict[str, Any] = Field(default_factory=dict)
 
 
@@ -43,9 +68,32 @@ class DoEInsightResponse(BaseModel):
 router = APIRouter(prefix="/experiments", tags=["experiments"])
 
 
-@router.post("/doe", response_model=DoEResponse)
-def run_doe(req: DoERequest, db: Session = Depends(get_db)) -> DoEResponse:
-    """Generate safe DOE points within strict variable domain constraints."""
+@router.get("/metrics")
+def compute_metrics() -> Dict[str, Any]:
+    """Admission counters and queue-wait / compute timings of the DOE and optimize endpoints."""
+    return metrics()
+
+
+@router.post("/doe", response_model=Union[DoEResponse, PersistedRunResponse])
+def run_doe(
+    req: DoERequest,
+    response: Response,
+    reuse: bool = Query(True, description="Return a stored run for an identical seeded request"),
+    persist: bool = Query(False, description="Save the result as a run and return only its id + summary"),
+    title: Optional[str] = Query(None, max_length=255, description="Run title (with persist=true)"),
+    layout: PointsLayout = Query(PointsLayout.rows, description="columns: points as one matrix (compact, faster)"),
+    db: Session = Depends(get_db),
+) -> Union[DoEResponse, PersistedRunResponse]:
+    """Generate safe DOE points within strict variable domain constraints.
+
+    The payload is built here, so it is serialized directly (fast_json) instead
+    of being re-validated against DoEResponse.
+    """
+
+    selection_meta = None
+    if req.selection is not None:
+        ids, selection_meta = select_variables(db, req.selection)
+        req = req.model_copy(update={"variable_ids": ids})
 
     if len(set(req.variable_ids)) != len(req.variable_ids):
         raise HTTPException(
@@ -79,52 +127,78 @@ def run_doe(req: DoERequest, db: Session = Depends(get_db)) -> DoEResponse:
             detail={"unsafe_variable_ids": unsafe, "reason": "min_value and max_value are required"},
         )
 
-    bounds = [(float(v.min_value), float(v.max_value)) for v in ordered]
+    domain = {str(v.id): {"min": v.min_value, "max": v.max_value, "unit": v.unit} for v in ordered}
+
+    # Seeded requests are deterministic: an identical request over unchanged bounds
+    # can be answered from the run history instead of being recomputed.
+    request_json = req.model_dump(mode="json")
+    req_hash = request_hash(RunType.doe.value, request_json, domain)
+    if reuse and req.seed is not None:
+        stored = find_reusable_run(db, RunType.doe, req_hash)
+        reused = checked_doe_result(stored.response_json) if stored is not None else None
+        if reused is not None:
+            response.headers["X-Run-Reused"] = str(stored.id)
+            if persist:
+                return to_persisted_response(
+                    store_run(db, RunType.doe, title, request_json, reused, req_hash=req_hash)
+                )
+            return doe_response(reused, layout, response)
 
-    points: List[Dict[str, Any]] = []
-
-    if req.method == DoEMethod.sobol:
-        from scipy.stats import qmc
-
-        d = len(bounds)
-        sampler = qmc.Sobol(d=d, scramble=True, seed=req.seed)
-        # SciPy Sobol supports arbitrary n via .random()
-        unit = sampler.random(n=req.n_points)
-
-        for row in unit:
-            p: Dict[str, Any] = {}
-            for (v, u, (lo, hi)) in zip(ordered, row, bounds):
-                val = lo + (hi - lo) * float(u)
-                p[str(v.id)] = val
-            points.append(p)
-
-    elif req.method == DoEMethod.lhs:
-        from scipy.stats import qmc
-
-        d = len(bounds)
-        sampler = qmc.LatinHypercube(d=d, seed=req.seed)
-        unit = sampler.random(n=req.n_points)
-
-        for row in unit:
-            p: Dict[str, Any] = {}
-            for (v, u, (lo, hi)) in zip(ordered, row, bounds):
-                val = lo + (hi - lo) * float(u)
-                p[str(v.id)] = val
-            points.append(p)
-
-    else:
-        raise HTTPException(status_code=422, detail="Unknown DOE method")
-
-    return DoEResponse(
-        method=req.method,
-        n_points=req.n_points,
-        variable_ids=req.variable_ids,
-        points=points,
-        meta={
+    bounds = [(float(v.min_value), float(v.max_value)) for v in ordered]
+    keys = [str(v.id) for v in ordered]
+    # give the connection back to the pool while waiting for / running the computation
+    db.close()
+    values = run_limited("doe", response, doe_points, req.method.value, bounds, req.n_points, req.seed)
+
+    result = {
+        "method": req.method.value,
+        "n_points": req.n_points,
+        "variable_ids": req.variable_ids,
+        "points": [],
+        "meta": {
             "variable_order": [v.id for v in ordered],
-            "domain": {str(v.id): {"min": v.min_value, "max": v.max_value, "unit": v.unit} for v in ordered},
+            "domain": domain,
+            **({"selection": selection_meta} if selection_meta is not None else {}),
         },
-    )
+    }
+
+    if persist or layout == PointsLayout.rows:
+        result["points"] = point_rows(keys, values)
+    if persist:
+        # Write the run straight from the in-memory result; the client gets only id + summary.
+        run = store_run(db, RunType.doe, title, request_json, result, req_hash=req_hash)
+        return to_persisted_response(run)
+
+    if layout == PointsLayout.columns:
+        result["columns"] = {"variable_ids": req.variable_ids, "values": values}
+    return fast_response(result, response)
+
+
+def checked_doe_result(stored: Any) -> Optional[Dict[str, Any]]:
+    """Stored DOE result validated as DoEResponse (rows layout, every point complete), else None.
+
+    Stored payloads are validated once on reuse; only results computed in the
+    request itself skip validation. An invalid one is recomputed instead.
+    """
+    try:
+        result = DoEResponse.model_validate(stored)
+    except ValidationError:
+        return None
+    keys = [str(vid) for vid in result.variable_ids]
+    for p in result.points:
+        if not all(isinstance(p.get(k), (int, float)) and not isinstance(p.get(k), bool) for k in keys):
+            return None
+    return result.model_dump(mode="json", exclude={"columns"})
+
+
+def doe_response(stored: Dict[str, Any], layout: PointsLayout, response: Response) -> Response:
+    """Checked stored DOE result (checked_doe_result) in the requested layout."""
+    if layout == PointsLayout.rows:
+        return fast_response(stored, response)
+    keys = [str(vid) for vid in stored["variable_ids"]]
+    values = np.array([[p[k] for k in keys] for p in stored["points"]], dtype=float).reshape(-1, len(keys))
+    columns = {"variable_ids": stored["variable_ids"], "values": values}
+    return fast_response({**stored, "points": [], "columns": columns}, response)
 
 
 @router.post("/doe/insight", response_model=DoEInsightResponse)
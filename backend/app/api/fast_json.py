@@ -0,0 +1,45 @@
+"""JSON responses for large payloads the server built itself.
+
+Returning a FastJSONResponse from a handler bypasses the response_model
+re-validation and the jsonable_encoder pass; the content is serialized in
+one go by orjson when it is installed (numpy arrays are written straight
+from their buffers) or by pydantic-core otherwise. The response_model of the
+route still documents the payload.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+import pydantic_core
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:  # optional: faster, and serializes numpy arrays without converting them to lists
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _fallback(value: Any) -> Any:
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes of dicts, lists, scalars, datetimes, enums and numpy arrays."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return pydantic_core.to_json(content, fallback=_fallback)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """FastJSONResponse of `content`, keeping headers set on the handler's injected `response`."""
+    headers = dict(response.headers) if response is not None else None
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import json
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from ..deps import get_db
+from ..graph_index import CAUSAL_TYPES, get_graph_index
+from ..graph_layout import get_layout, layout_payload
+from ..graph_paths import get_path_graph
+from ..graph_rankings import BETWEENNESS_SAMPLES, get_rankings
+from ..models.relationship import Relationship, RelationshipDirection, RelationshipShape, RelationshipType
+from ..models.variable import Variable, VariableSource, VariableType
+from ..versions import GRAPH_TABLES, current_version, etag_matches, make_etag, state_for
+from .relationships import RelationshipRead
+
+
+router = APIRouter(prefix="/graph", tags=["graph"])
+
+
+# Enum values are sent once; rows carry their index in these lists.
+ENUM_CODES: Dict[str, List[str]] = {
+    "variable_type": [e.value for e in VariableType],
+    "source": [e.value for e in VariableSource],
+    "relationship_type": [e.value for e in RelationshipType],
+    "direction": [e.value for e in RelationshipDirection],
+    "shape": [e.value for e in RelationshipShape],
+}
+
+VARIABLE_COLUMNS = [
+    "id", "name", "symbol", "variable_type", "source", "min_value", "max_value", "unit",
+    "confidence", "layer_level", "parent_variable_id",
+]
+RELATIONSHIP_COLUMNS = ["id", "source_variable_id", "target_variable_id", "relationship_type", "direction", "shape", "confidence"]
+
+
+class GraphTable(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+
+
+class GraphSnapshot(BaseModel):
+    version: int
+    enums: Dict[str, List[str]]
+    variables: GraphTable
+    relationships: GraphTable
+
+
+class TraversalDirection(str, Enum):
+    upstream = "upstream"
+    downstream = "downstream"
+
+
+class ReachedVariable(BaseModel):
+    id: int
+    depth: int
+
+
+class ReachabilityResponse(BaseModel):
+    root: int
+    direction: TraversalDirection
+    max_depth: int
+    version: int
+    nodes: List[ReachedVariable]
+    relationships: List[RelationshipRead]
+
+
+class CyclicComponent(BaseModel):
+    variable_ids: List[int]
+    relationship_ids: List[int]
+
+
+class GraphValidation(BaseModel):
+    version: int
+    relationship_types: List[RelationshipType]
+    acyclic: bool
+    cycles: List[CyclicComponent]
+
+
+class LayoutNode(BaseModel):
+    id: int
+    x: float
+    y: float
+    layer_level: int
+
+
+class GraphLayout(BaseModel):
+    version: int
+    incremental: bool
+    width: float
+    height: float
+    nodes: List[LayoutNode]
+
+
+class StrongestPath(BaseModel):
+    confidence: float
+    variable_ids: List[int]
+    relationships: List[RelationshipRead]
+
+
+class StrongestPaths(BaseModel):
+    version: int
+    source_id: int
+    target_id: int
+    paths: List[StrongestPath]
+
+
+class RankingMetric(str, Enum):
+    influence = "influence"
+    out_degree = "out_degree"
+    reach = "reach"
+    betweenness = "betweenness"
+
+
+class VariableRanking(BaseModel):
+    id: int
+    influence: float
+    out_degree: float
+    reach: Optional[int] = None
+    betweenness: Optional[float] = None
+
+
+class GraphRankings(BaseModel):
+    version: int
+    target_id: Optional[int]
+    sort: RankingMetric
+    total: int
+    items: List[VariableRanking]
+
+
+def _codes(enum_cls: Any) -> Dict[Any, int]:
+    return {member: i for i, member in enumerate(enum_cls)}
+
+
+def build_graph_snapshot(db: Session, version: int) -> Dict[str, Any]:
+    """Every active variable and every active relationship between active variables."""
+    vt, vs = _codes(VariableType), _codes(VariableSource)
+    rt, rd, rs = _codes(RelationshipType), _codes(RelationshipDirection), _codes(RelationshipShape)
+
+    var_rows = [
+        [r.id, r.name, r.symbol, vt[r.variable_type], vs[r.source], r.min_value, r.max_value, r.unit,
+         r.confidence, r.layer_level, r.parent_variable_id]
+        for r in db.execute(
+            select(
+                Variable.id, Variable.name, Variable.symbol, Variable.variable_type, Variable.source,
+                Variable.min_value, Variable.max_value, Variable.unit, Variable.confidence,
+                Variable.layer_level, Variable.parent_variable_id,
+            )
+            .where(Variable.is_active == True)
+            .order_by(Variable.id)
+        )
+    ]
+
+    src, tgt = aliased(Variable), aliased(Variable)
+    rel_rows = [
+        [r.id, r.source_variable_id, r.target_variable_id, rt[r.relationship_type], rd[r.direction],
+         rs[r.shape], r.confidence]
+        for r in db.execute(
+            select(
+                Relationship.id, Relationship.source_variable_id, Relationship.target_variable_id,
+                Relationship.relationship_type, Relationship.direction, Relationship.shape,
+                Relationship.confidence,
+            )
+            .join(src, src.id == Relationship.source_variable_id)
+            .join(tgt, tgt.id == Relationship.target_variable_id)
+            .where(Relationship.is_active == True, src.is_active == True, tgt.is_active == True)
+            .order_by(Relationship.id)
+        )
+    ]
+
+    return {
+        "version": version,
+        "enums": ENUM_CODES,
+        "variables": {"columns": VARIABLE_COLUMNS, "rows": var_rows},
+        "relationships": {"columns": RELATIONSHIP_COLUMNS, "rows": rel_rows},
+    }
+
+
+@router.get("", response_model=GraphSnapshot)
+def get_graph(
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """Whole active graph in one compact payload (ETag = graph version, 304 when unchanged)."""
+    version = current_version(db, *GRAPH_TABLES)
+    etag = make_etag("graph", version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    state = state_for(db)
+    cached = state.cache.get("graph_snapshot")
+    if cached is None or cached[0] != version:
+        # the version is read before the queries, so a snapshot is never older than its label
+        body = json.dumps(build_graph_snapshot(db, version), separators=(",", ":")).encode("utf-8")
+        cached = (version, body)
+        state.cache["graph_snapshot"] = cached
+
+    return Response(content=cached[1], media_type="application/json", headers=headers)
+
+
+@router.get("/layout", response_model=GraphLayout)
+def get_graph_layout(
+    x_gap: float = Query(260.0, gt=0, description="Horizontal distance between nodes"),
+    y_gap: float = Query(180.0, gt=0, description="Vertical distance between rows"),
+    max_row: int = Query(12, ge=1, le=1000, description="Wider layers wrap into several rows"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """Layered node positions: one band per layer_level, order inside a band reduces edge crossings."""
+    version = current_version(db, *GRAPH_TABLES)
+    params = (x_gap, y_gap, max_row)
+    variant = f"{x_gap:g}x{y_gap:g}x{max_row}"
+    etag = make_etag("graph-layout", version, variant)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    layout = get_layout(db)
+    body = layout.bodies.get(params)
+    if body is None:
+        body = json.dumps(layout_payload(layout, *params), separators=(",", ":")).encode("utf-8")
+        layout.bodies[params] = body
+    headers["ETag"] = make_etag("graph-layout", layout.version, variant)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/paths", response_model=StrongestPaths)
+def get_strongest_paths(
+    source_id: int = Query(..., description="Start of the chain"),
+    target_id: int = Query(..., description="End of the chain"),
+    k: int = Query(3, ge=1, le=50, description="Number of alternative paths"),
+    relationship_type: Optional[List[RelationshipType]] = Query(
+        None, description="Types to follow (default: drives, influences; correlates_with is followed both ways)"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Most credible chains source -> target: the k simple paths with the highest product of confidences."""
+    index, path_graph = get_path_graph(db, relationship_type)
+    for variable_id in (source_id, target_id):
+        if not index.is_active_variable(variable_id):
+            raise HTTPException(status_code=404, detail=f"Variable with id {variable_id} not found")
+
+    paths = path_graph.chains(source_id, target_id, k)
+    return StrongestPaths(
+        version=index.version,
+        source_id=source_id,
+        target_id=target_id,
+        paths=[
+            StrongestPath(confidence=conf, variable_ids=ids, relationships=index.records_by_id(rel_ids))
+            for conf, ids, rel_ids in paths
+        ],
+    )
+
+
+def _column(rankings: Dict[str, np.ndarray], metric: str, rows: np.ndarray) -> List[Any]:
+    """Values of `metric` at `rows`, or None per row when it was not computed."""
+    values = rankings.get(metric)
+    return [None] * rows.size if values is None else values[rows].tolist()
+
+
+@router.get("/rankings", response_model=GraphRankings)
+def get_graph_rankings(
+    target_id: Optional[int] = Query(None, description="KPI to rank influence towards (default: global influence)"),
+    relationship_type: Optional[List[RelationshipType]] = Query(None, description="Only use these types"),
+    sort: RankingMetric = Query(RankingMetric.influence),
+    limit: int = Query(50, ge=1, le=10000),
+    reach_depth: int = Query(3, ge=1, le=10, description="Hops counted by `reach`"),
+    samples: int = Query(BETWEENNESS_SAMPLES, ge=1, le=4096, description="BFS sources sampled for betweenness"),
+    include: Optional[List[RankingMetric]] = Query(
+        None, description="Also compute reach / betweenness (always computed when sorting by them)"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Variables ranked by confidence-weighted influence, out-degree, reach or betweenness.
+
+    With `target_id` only variables with a path to the target are ranked (the target itself is left out).
+    reach and betweenness are null unless sorted by or listed in `include`.
+    """
+    if target_id is not None and not get_graph_index(db).is_active_variable(target_id):
+        raise HTTPException(status_code=404, detail=f"Variable with id {target_id} not found")
+
+    metrics = {"influence", "out_degree", sort.value, *(m.value for m in include or ())}
+    version, rankings = get_rankings(db, target_id, relationship_type, reach_depth, samples, metrics)
+    ids = rankings["id"]
+    candidates = np.ones(ids.size, dtype=bool)
+    if target_id is not None:
+        candidates = (rankings["influence"] > 0) & (ids != target_id)
+    rows = np.flatnonzero(candidates)
+    top = rows[np.lexsort((ids[rows], -rankings[sort.value][rows]))[:limit]]
+    return GraphRankings(
+        version=version,
+        target_id=target_id,
+        sort=sort,
+        total=rows.size,
+        items=[
+            VariableRanking(id=i, influence=inf, out_degree=deg, reach=r, betweenness=b)
+            for i, inf, deg, r, b in zip(
+                ids[top].tolist(),
+                rankings["influence"][top].tolist(),
+                rankings["out_degree"][top].tolist(),
+                _column(rankings, "reach", top),
+                _column(rankings, "betweenness", top),
+            )
+        ],
+    )
+
+
+@router.get("/validate", response_model=GraphValidation)
+def validate_graph(db: Session = Depends(get_db)):
+    """Strongly connected components of the drives/influences graph (linear time); any found is a cycle."""
+    index = get_graph_index(db)
+    cycles = [
+        CyclicComponent(variable_ids=vs, relationship_ids=rs) for vs, rs in index.cyclic_components()
+    ]
+    return GraphValidation(
+        version=index.version,
+        relationship_types=list(CAUSAL_TYPES),
+        acyclic=not cycles,
+        cycles=cycles,
+    )
+
+
+def _reachability(
+    db: Session,
+    variable_id: int,
+    direction: TraversalDirection,
+    max_depth: int,
+    relationship_type: Optional[List[RelationshipType]],
+) -> ReachabilityResponse:
+    index = get_graph_index(db)
+    if not index.is_active_variable(variable_id):
+        raise HTTPException(status_code=404, detail=f"Variable with id {variable_id} not found")
+
+    # edge slots are renumbered when the index compacts: resolve them under the same lock hold
+    with index.lock:
+        depth, slots = index.traverse(
+            variable_id,
+            upstream=direction == TraversalDirection.upstream,
+            max_depth=max_depth,
+            relationship_types=relationship_type,
+        )
+        relationships = index.relationship_records(slots)
+    nodes = sorted(depth.items(), key=lambda kv: (kv[1], kv[0]))
+    return ReachabilityResponse(
+        root=variable_id,
+        direction=direction,
+        max_depth=max_depth,
+        version=index.version,
+        nodes=[ReachedVariable(id=vid, depth=d) for vid, d in nodes],
+        relationships=relationships,
+    )
+
+
+@router.get("/variables/{variable_id}/upstream", response_model=ReachabilityResponse)
+def get_upstream(
+    variable_id: int,
+    max_depth: int = Query(3, ge=1, le=100, description="Maximum number of hops"),
+    relationship_type: Optional[List[RelationshipType]] = Query(None, description="Only follow these types"),
+    db: Session = Depends(get_db),
+):
+    """Variables that can affect `variable_id` (against edge direction), with hop counts and the subgraph."""
+    return _reachability(db, variable_id, TraversalDirection.upstream, max_depth, relationship_type)
+
+
+@router.get("/variables/{variable_id}/downstream", response_model=ReachabilityResponse)
+def get_downstream(
+    variable_id: int,
+    max_depth: int = Query(3, ge=1, le=100, description="Maximum number of hops"),
+    relationship_type: Optional[List[RelationshipType]] = Query(None, description="Only follow these types"),
+    db: Session = Depends(get_db),
+):
+    """Impact set of `variable_id` (along edge direction), with hop counts and the subgraph."""
+    return _reachability(db, variable_id, TraversalDirection.downstream, max_depth, relationship_type)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from ..versions import current_version, etag_matches, is_replica, last_modified, make_etag, state_for
+
+
+# Limity cache serializowanych stron (na bazę danych)
+PAGE_CACHE_ENTRIES = 512
+PAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+_CACHE_KEY = "http_pages"
+
+
+class PageCache:
+    """LRU serializowanych odpowiedzi JSON, kluczowane wersją tabel i parametrami zapytania."""
+
+    def __init__(self, max_entries: int = PAGE_CACHE_ENTRIES, max_bytes: int = PAGE_CACHE_BYTES) -> None:
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[Tuple[Any, ...], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[bytes]:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[Any, ...], body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = body
+            self.size += len(body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+def page_cache(db: Session) -> PageCache:
+    state = state_for(db)
+    with state.lock:
+        return state.cache.setdefault(_CACHE_KEY, PageCache())
+
+
+class ConditionalGet:
+    """
+    Warunkowy GET dla odpowiedzi zależnych od wersji tabel (versions.py).
+
+    - ETag = wersja tabel, Last-Modified = czas ostatniego zapisu do nich
+    - If-None-Match (lub If-Modified-Since, gdy brak If-None-Match) -> 304 bez zapytań do bazy
+    - serializowane strony trzymane w PageCache pod kluczem (wersja, ścieżka, parametry)
+    - sesja na replice: strona może być starsza niż wersja, więc odpowiedź z bazy
+      nie trafia do cache i nie dostaje ETag/Last-Modified (304 i strony z cache
+      zbudowane na bazie głównej są nadal serwowane)
+    """
+
+    def __init__(self, request: Request, db: Session, kind: str, *tables: str) -> None:
+        # wersja czytana przed zapytaniami: zapisana strona nigdy nie jest starsza niż jej klucz
+        self.version = current_version(db, *tables)
+        modified = last_modified(db, *tables)
+        etag = make_etag(kind, self.version)
+        self.cache = page_cache(db)
+        self.key = (kind, self.version, request.url.path, tuple(sorted(request.query_params.multi_items())))
+        self.headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(_announced(modified), usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        self.not_modified = _not_modified(request, etag, modified)
+        self.replica = is_replica(db)
+
+    def cached(self) -> Optional[Response]:
+        """Odpowiedź 304 albo strona z cache; None, gdy trzeba ją zbudować."""
+        if self.not_modified:
+            return Response(status_code=304, headers=self.headers)
+        body = self.cache.get(self.key)
+        if body is None:
+            return None
+        return Response(content=body, media_type="application/json", headers=self.headers)
+
+    def respond(self, model: BaseModel) -> Response:
+        body = model.model_dump_json().encode("utf-8")
+        if self.replica:
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+        self.cache.put(self.key, body)
+        return Response(content=body, media_type="application/json", headers=self.headers)
+
+
+def _announced(modified: datetime) -> datetime:
+    """
+    Last-Modified do wysłania: czas zapisu (pełne sekundy) albo sekundę wcześniej.
+
+    Kolejny zapis w tej samej sekundzie miałby ten sam znacznik, więc klient
+    rewalidujący samym If-Modified-Since dostałby fałszywe 304. Dopóki bieżąca
+    sekunda nie minęła, ogłaszamy sekundę wcześniejszą (najwyżej jedno 200 więcej).
+    """
+    if modified >= datetime.now(timezone.utc).replace(microsecond=0):
+        return modified - timedelta(seconds=1)
+    return modified
+
+
+def _not_modified(request: Request, etag: str, modified: Any) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return modified <= since
@@ -74,3 +74,38 @@ def score_point(point: Dict[str, Any], obj: ObjectiveSpec) -> float:
         return -abs(x - t)
 
     raise ValueError(f"Unsupported objective kind: {obj.kind}")
+
+
+def score_matrix(points: Any, keys: List[str], obj: ObjectiveSpec) -> Any:
+    """Vectorized `score_point` over the rows of a (n, d) array whose columns follow `keys`."""
+    import numpy as np
+
+    X = np.asarray(points, dtype=float)
+    col = {k: i for i, k in enumerate(keys)}
+
+    if obj.kind in (ObjectiveKind.maximize_variable, ObjectiveKind.minimize_variable):
+        if obj.variable_id is None:
+            raise ValueError("objective.variable_id is required")
+        x = X[:, col[str(obj.variable_id)]]
+        if obj.kind == ObjectiveKind.maximize_variable:
+            return float(obj.weight) * x
+        return -float(obj.weight) * x
+
+    if obj.kind == ObjectiveKind.linear:
+        if not obj.terms:
+            raise ValueError("objective.terms must be non-empty")
+        idx = [col[str(t.variable_id)] for t in obj.terms]
+        w = np.array([float(t.weight) for t in obj.terms])
+        return X[:, idx] @ w
+
+    if obj.kind == ObjectiveKind.target:
+        if obj.variable_id is None:
+            raise ValueError("objective.variable_id is required")
+        if obj.target is None:
+            raise ValueError("objective.target is required")
+        d = X[:, col[str(obj.variable_id)]] - float(obj.target)
+        if obj.loss == "squared":
+            return -(d ** 2)
+        return -np.abs(d)
+
+    raise ValueError(f"Unsupported objective kind: {obj.kind}")
@@ -1,13 +1,19 @@
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from sqlalchemy.orm import Session
 
+from ..compute import run_limited
 from ..deps import get_db
+from ..experiment_compute import random_search
 from ..models.variable import Variable
 from .objectives import ObjectiveSpec, ObjectiveKind
+from .fast_json import fast_response
+from .run_hashing import request_hash
+from .selection import SelectionSpec, select_variables
+from .runs import PersistedRunResponse, RunType, find_reusable_run, store_run, to_persisted_response
 
 
 class OptimizeMethod(str, Enum):
@@ -15,7 +21,9 @@ class OptimizeMethod(str, Enum):
 
 
 class OptimizeRequest(BaseModel):
-    variable_ids: List[int] = Field(..., min_length=1)
+    variable_ids: Optional[List[int]] = Field(None, min_length=1)
+    # graph-selected inputs; variables used by the objective are added to them
+    selection: Optional[SelectionSpec] = None
     n_iter: int = Field(30, ge=1, le=5000)
     method: OptimizeMethod = Field(OptimizeMethod.random)
     seed: Optional[int] = None
@@ -23,6 +31,12 @@ class OptimizeRequest(BaseModel):
     initial_points: List[Dict[str, float]] = Field(default_factory=list)
     max_initial_points: int = Field(200, ge=0, le=5000)
 
+    @model_validator(mode="after")
+    def _variables_or_selection(self) -> "OptimizeRequest":
+        if (self.variable_ids is None) == (self.selection is None):
+            raise ValueError("exactly one of variable_ids and selection is required")
+        return self
+
 
 class OptimizeResponse(BaseModel):
     method: OptimizeMethod
@@ -48,8 +62,32 @@ class OptimizeInsightResponse(BaseModel):
 router = APIRouter(prefix="/experiments", tags=["experiments"])
 
 
-@router.post("/optimize", response_model=OptimizeResponse)
-def optimize(req: OptimizeRequest, db: Session = Depends(get_db)) -> OptimizeResponse:
+def checked_optimize_result(stored: Any) -> Optional[Dict[str, Any]]:
+    """Stored optimize result validated as OptimizeResponse, else None (recomputed instead)."""
+    try:
+        return OptimizeResponse.model_validate(stored).model_dump(mode="json")
+    except ValidationError:
+        return None
+
+
+@router.post("/optimize", response_model=Union[OptimizeResponse, PersistedRunResponse])
+def optimize(
+    req: OptimizeRequest,
+    response: Response,
+    reuse: bool = Query(True, description="Return a stored run for an identical seeded request"),
+    persist: bool = Query(False, description="Save the result as a run and return only its id + summary"),
+    title: Optional[str] = Query(None, max_length=255, description="Run title (with persist=true)"),
+    db: Session = Depends(get_db),
+) -> Union[OptimizeResponse, PersistedRunResponse]:
+    selection_meta = None
+    if req.selection is not None:
+        ids, selection_meta = select_variables(db, req.selection)
+        objective_ids = [req.objective.variable_id] + [t.variable_id for t in req.objective.terms]
+        for vid in objective_ids:
+            if vid is not None and vid not in ids:
+                ids.append(vid)
+        req = req.model_copy(update={"variable_ids": ids})
+
     if len(set(req.variable_ids)) != len(req.variable_ids):
         raise HTTPException(status_code=422, detail="variable_ids must be unique")
 
@@ -73,10 +111,6 @@ def optimize(req: OptimizeRequest, db: Session = Depends(get_db)) -> OptimizeRes
             detail={"unsafe_variable_ids": unsafe, "reason": "min_value and max_value are required"},
         )
 
-    import random
-
-    rng = random.Random(req.seed)
-
     # Objective validation
     if req.objective.kind in (ObjectiveKind.maximize_variable, ObjectiveKind.minimize_variable, ObjectiveKind.target):
         if req.objective.variable_id not in req.variable_ids:
@@ -106,38 +140,32 @@ def optimize(req: OptimizeRequest, db: Session = Depends(get_db)) -> OptimizeRes
     else:
         raise HTTPException(status_code=422, detail={"reason": "unsupported objective kind", "kind": str(req.objective.kind)})
 
+    domain = {str(v.id): {"min": v.min_value, "max": v.max_value, "unit": v.unit} for v in ordered}
+
+    # Seeded random search is deterministic (see OptimizeRequest.seed): reuse a stored result.
+    request_json = req.model_dump(mode="json")
+    req_hash = request_hash(RunType.optimize.value, request_json, domain)
+    if reuse and req.seed is not None:
+        stored = find_reusable_run(db, RunType.optimize, req_hash)
+        reused = checked_optimize_result(stored.response_json) if stored is not None else None
+        if reused is not None:
+            response.headers["X-Run-Reused"] = str(stored.id)
+            if persist:
+                return to_persisted_response(
+                    store_run(db, RunType.optimize, title, request_json, reused, req_hash=req_hash)
+                )
+            return fast_response(reused, response)
+
     bounds = [(float(v.min_value), float(v.max_value)) for v in ordered]
     bounds_by_id = {str(v.id): (float(v.min_value), float(v.max_value)) for v in ordered}
 
-    from .objectives import score_point as score_by_objective
-
-    def score_point(p: Dict[str, Any]) -> float:
-        # Objective scoring (deterministic)
-        if req.objective.kind == ObjectiveKind.linear and req.objective.normalize == "domain":
-            # normalize x to [0,1] using the strict domain bounds
-            p_norm: Dict[str, Any] = dict(p)
-            for t in req.objective.terms:
-                key = str(t.variable_id)
-                lo, hi = bounds_by_id[key]
-                # hi==lo shouldn't happen due to safe domain, but avoid div-by-zero
-                if hi == lo:
-                    p_norm[key] = 0.0
-                else:
-                    p_norm[key] = (float(p[key]) - lo) / (hi - lo)
-            return float(score_by_objective(p_norm, req.objective))
-
-        return float(score_by_objective(p, req.objective))
-
-    history: List[Dict[str, Any]] = []
-    best_score = float("-inf")
-    best_point: Dict[str, Any] = {}
-
     # Optional initial points (e.g., from DOE)
     if req.max_initial_points == 0:
         initial_iter = []
     else:
         initial_iter = req.initial_points[: req.max_initial_points]
 
+    initial_points: List[Dict[str, Any]] = []
     for p_in in initial_iter:
         p: Dict[str, Any] = {}
         for v in ordered:
@@ -152,40 +180,40 @@ def optimize(req: OptimizeRequest, db: Session = Depends(get_db)) -> OptimizeRes
                     detail={"reason": "initial_points out of domain", "variable_id": v.id, "value": x, "min": lo, "max": hi},
                 )
             p[key] = x
-        history.append(p)
-        s = score_point(p)
-        if s > best_score:
-            best_score = s
-            best_point = p
-
-    # Random search iterations (stub)
-    for _ in range(req.n_iter):
-        p = {str(v.id): (lo + (hi - lo) * rng.random()) for (v, (lo, hi)) in zip(ordered, bounds)}
-        history.append(p)
-        s = score_point(p)
-        if s > best_score:
-            best_score = s
-            best_point = p
-
-    return OptimizeResponse(
-        method=req.method,
-        n_iter=req.n_iter,
-        variable_ids=req.variable_ids,
-        best_point=best_point,
-        history=history,
-        meta={
-            "objective": req.objective.model_dump(),
+        initial_points.append(p)
+
+    # Scoring + random search iterations (stub) run in the compute pool
+    keys = [str(v.id) for v in ordered]
+    # give the connection back to the pool while waiting for / running the computation
+    db.close()
+    history, best_point, best_score = run_limited(
+        "optimize", response, random_search, keys, bounds, req.n_iter, req.seed, req.objective, initial_points
+    )
+
+    # built from validated inputs: serialized as is (fast_json), not re-validated as OptimizeResponse
+    result = {
+        "method": req.method.value,
+        "n_iter": req.n_iter,
+        "variable_ids": req.variable_ids,
+        "best_point": best_point,
+        "history": history,
+        "meta": {
+            "objective": req.objective.model_dump(mode="json"),
             "best_score": best_score,
             "initial_points": len(initial_iter),
             "max_initial_points": req.max_initial_points,
             "n_iter": req.n_iter,
             "variable_order": [v.id for v in ordered],
-            "domain": {
-                str(v.id): {"min": v.min_value, "max": v.max_value, "unit": v.unit}
-                for v in ordered
-            },
+            "domain": domain,
+            **({"selection": selection_meta} if selection_meta is not None else {}),
         },
-    )
+    }
+
+    if persist:
+        run = store_run(db, RunType.optimize, title, request_json, result, req_hash=req_hash)
+        return to_persisted_response(run)
+
+    return fast_response(result, response)
 
 
 @router.post("/optimize/insight", response_model=OptimizeInsightResponse)
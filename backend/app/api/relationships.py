@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from pydantic import BaseModel, Field, field_validator, ConfigDict, ValidationError
+from typing import Any, Dict, Optional, List, Set, Tuple, Union
 from datetime import datetime
+from enum import Enum
 
-from ..models.relationship import Relationship, RelationshipType, RelationshipDirection, RelationshipShape
+from ..db_base import is_unique_violation
+from ..models.relationship import ACTIVE_PAIR_INDEX, Relationship, RelationshipType, RelationshipDirection, RelationshipShape
 from ..models.variable import Variable
-from ..deps import get_db
+from ..deps import get_async_db, get_async_read_db, get_db
+from ..graph_index import CAUSAL_TYPES, GraphIndex, acyclic_guard, acyclic_guard_async, get_graph_index_async
+from ..versions import GRAPH_TABLES, RELATIONSHIPS, Change, bump, row_values
+from .http_cache import ConditionalGet
+from .bulk import BULK_BATCH_SIZE, BULK_MAX_ROWS, IN_CHUNK_SIZE, BulkRowError, chunks, row_errors
 
 
 # ============== Pydantic Schemas ==============
@@ -76,6 +85,12 @@ class RelationshipDetailRead(RelationshipRead):
     """Model do odczytu relacji ze szczegółami zmiennych."""
     source_variable_name: Optional[str] = None
     target_variable_name: Optional[str] = None
+    source_variable_unit: Optional[str] = None
+    target_variable_unit: Optional[str] = None
+    source_variable_min_value: Optional[float] = None
+    source_variable_max_value: Optional[float] = None
+    target_variable_min_value: Optional[float] = None
+    target_variable_max_value: Optional[float] = None
 
 
 class RelationshipList(BaseModel):
@@ -86,6 +101,19 @@ class RelationshipList(BaseModel):
     limit: int
 
 
+class RelationshipDetailList(BaseModel):
+    """Model listy relacji ze szczegółami zmiennych (include=variables)."""
+    items: List[RelationshipDetailRead]
+    total: int
+    skip: int
+    limit: int
+
+
+class RelationshipInclude(str, Enum):
+    """Dodatkowe dane dołączane do relacji."""
+    VARIABLES = "variables"
+
+
 class RelationshipFilter(BaseModel):
     """Model filtrowania relacji."""
     source_variable_id: Optional[int] = None
@@ -94,6 +122,19 @@ class RelationshipFilter(BaseModel):
     direction: Optional[RelationshipDirection] = None
 
 
+class RelationshipBulkRequest(BaseModel):
+    """Model importu wielu relacji (rekordy walidowane pojedynczo, z raportem błędów)."""
+    items: List[Dict[str, Any]] = Field(..., max_length=BULK_MAX_ROWS, description="Rekordy w formacie RelationshipCreate")
+    all_or_nothing: bool = Field(False, description="Nie zapisuj niczego, jeśli którykolwiek rekord jest błędny")
+    enforce_acyclic: bool = Field(False, description="Odrzucaj relacje drives/influences zamykające cykl")
+
+
+class RelationshipBulkResult(BaseModel):
+    """Wynik importu masowego relacji."""
+    created_ids: List[int]
+    errors: List[BulkRowError]
+
+
 # ============== Router ==============
 
 router = APIRouter(prefix="/relationships", tags=["relationships"])
@@ -101,61 +142,219 @@ router = APIRouter(prefix="/relationships", tags=["relationships"])
 
 # ============== Helper Functions ==============
 
-def check_variable_exists(db: Session, variable_id: int, active_only: bool = True) -> bool:
+async def check_variable_exists(db: AsyncSession, variable_id: int, active_only: bool = True) -> bool:
     """Sprawdza czy zmienna istnieje."""
-    query = db.query(Variable).filter(Variable.id == variable_id)
+    query = select(Variable.id).where(Variable.id == variable_id)
     if active_only:
-        query = query.filter(Variable.is_active == True)
-    return query.first() is not None
+        query = query.where(Variable.is_active == True)
+    return await db.scalar(query) is not None
+
+
+def with_variables(query):
+    """Dołącza zmienne źródłową i docelową do zapytania o relacje (JOIN w tym samym zapytaniu)."""
+    return query.options(joinedload(Relationship.source_variable), joinedload(Relationship.target_variable))
+
+
+def to_detail(db_rel: Relationship) -> RelationshipDetailRead:
+    """RelationshipDetailRead z załadowanych zmiennych (bez dodatkowych zapytań po with_variables)."""
+    result = RelationshipDetailRead.model_validate(db_rel)
+    for prefix, var in (("source", db_rel.source_variable), ("target", db_rel.target_variable)):
+        if var is None:
+            continue
+        setattr(result, f"{prefix}_variable_name", var.name)
+        setattr(result, f"{prefix}_variable_unit", var.unit)
+        setattr(result, f"{prefix}_variable_min_value", var.min_value)
+        setattr(result, f"{prefix}_variable_max_value", var.max_value)
+    return result
+
+
+async def commit_or_409(db: AsyncSession, source_id: int, target_id: int) -> None:
+    """Commit; druga aktywna relacja dla tej samej pary (indeks unikalny) -> 409."""
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, Relationship.__table__, ACTIVE_PAIR_INDEX):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Relationship from variable {source_id} to {target_id} already exists"
+            )
+        raise
+
+
+def cycle_message(cycle: List[int]) -> str:
+    return "Relationship would create a cycle: " + " -> ".join(str(v) for v in cycle)
+
+
+def check_acyclic_or_409(index: GraphIndex, source_id: int, target_id: int) -> None:
+    """Rzuca 409 ze ścieżką cyklu, jeśli krawędź source -> target zamknęłaby cykl przyczynowy."""
+    cycle = index.check_acyclic([(source_id, target_id)])[0]
+    if cycle is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"reason": "cycle", "message": cycle_message(cycle), "cycle": cycle}
+        )
+
+
+def bulk_create_relationships(
+    db: Session,
+    rows: List[Dict[str, Any]],
+    all_or_nothing: bool = False,
+    enforce_acyclic: bool = False,
+) -> RelationshipBulkResult:
+    """
+    Tworzy wiele relacji w jednej transakcji.
+
+    - Istnienie zmiennych: jedno zapytanie (IN) zamiast dwóch na relację
+    - Duplikaty: jedno zapytanie zbiorowe o aktywne pary (source, target) + kontrola w obrębie paczki
+    - Self-reference odrzucane przez walidację modelu
+    - enforce_acyclic: relacje drives/influences sprawdzane kolejno pod kątem cykli (z uwzględnieniem
+      wcześniejszych rekordów paczki), bez przebudowy grafu
+    """
+    errors: List[BulkRowError] = []
+    valid: List[Tuple[int, RelationshipCreate]] = []
+
+    for i, raw in enumerate(rows):
+        try:
+            valid.append((i, RelationshipCreate.model_validate(raw)))
+        except ValidationError as e:
+            errors.append(BulkRowError(row=i, errors=row_errors(e)))
+
+    # Aktywne zmienne, do których odwołują się relacje
+    referenced = sorted({v for _, r in valid for v in (r.source_variable_id, r.target_variable_id)})
+    active_ids: Set[int] = set()
+    for chunk in chunks(referenced, IN_CHUNK_SIZE):
+        active_ids.update(db.scalars(select(Variable.id).where(Variable.id.in_(chunk), Variable.is_active == True)))
+
+    # Istniejące aktywne pary (source, target)
+    pairs = sorted({(r.source_variable_id, r.target_variable_id) for _, r in valid})
+    existing_pairs: Set[Tuple[int, int]] = set()
+    for chunk in chunks(pairs, IN_CHUNK_SIZE):
+        existing_pairs.update(
+            (row.source_variable_id, row.target_variable_id)
+            for row in db.execute(
+                select(Relationship.source_variable_id, Relationship.target_variable_id).where(
+                    tuple_(Relationship.source_variable_id, Relationship.target_variable_id).in_(chunk),
+                    Relationship.is_active == True,
+                )
+            )
+        )
+
+    to_insert: List[Dict[str, Any]] = []
+    insert_rows: List[int] = []
+    batch_pairs: Dict[Tuple[int, int], int] = {}
+    for i, rel in valid:
+        pair = (rel.source_variable_id, rel.target_variable_id)
+        row_errs: List[str] = []
+        if rel.source_variable_id not in active_ids:
+            row_errs.append(f"Source variable with id {rel.source_variable_id} not found")
+        if rel.target_variable_id not in active_ids:
+            row_errs.append(f"Target variable with id {rel.target_variable_id} not found")
+        if pair in existing_pairs:
+            row_errs.append(f"Relationship from variable {pair[0]} to {pair[1]} already exists")
+        elif pair in batch_pairs:
+            row_errs.append(f"Duplicate relationship in batch (first at row {batch_pairs[pair]})")
+        if row_errs:
+            errors.append(BulkRowError(row=i, errors=row_errs))
+            continue
+        batch_pairs[pair] = i
+        to_insert.append(rel.model_dump())
+        insert_rows.append(i)
+
+    with acyclic_guard(db, enabled=enforce_acyclic) as index:
+        if index is not None:
+            causal = [k for k, d in enumerate(to_insert) if d["relationship_type"] in CAUSAL_TYPES]
+            cycles = index.check_acyclic(
+                [(to_insert[k]["source_variable_id"], to_insert[k]["target_variable_id"]) for k in causal]
+            )
+            rejected: Set[int] = set()
+            for k, cycle in zip(causal, cycles):
+                if cycle is not None:
+                    rejected.add(k)
+                    errors.append(BulkRowError(row=insert_rows[k], errors=[cycle_message(cycle)]))
+            to_insert = [d for k, d in enumerate(to_insert) if k not in rejected]
+
+        errors.sort(key=lambda e: e.row)
+        if errors and all_or_nothing:
+            return RelationshipBulkResult(created_ids=[], errors=errors)
+
+        created_ids: List[int] = []
+        try:
+            for batch in chunks(to_insert, BULK_BATCH_SIZE):
+                result = db.execute(
+                    insert(Relationship).returning(Relationship.id, sort_by_parameter_order=True),
+                    batch,
+                )
+                created_ids.extend(result.scalars().all())
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Bulk import conflicts with concurrent changes: {e.orig}"
+            )
+
+        if to_insert:
+            bump(db, RELATIONSHIPS)
+
+    return RelationshipBulkResult(created_ids=created_ids, errors=errors)
 
 
 # ============== CRUD Endpoints ==============
 
 @router.post("", response_model=RelationshipRead, status_code=status.HTTP_201_CREATED)
-def create_relationship(rel: RelationshipCreate, db: Session = Depends(get_db)):
+async def create_relationship(
+    rel: RelationshipCreate,
+    enforce_acyclic: bool = Query(False, description="Reject drives/influences relationships that close a cycle"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Tworzy nową relację między zmiennymi.
     
-    - Sprawdza istnienie obu zmiennych
-    - Zapobiega duplikatom (ta sama para source->target)
+    - Sprawdza istnienie obu zmiennych (jedno zapytanie)
+    - Duplikaty (aktywna para source->target) odrzuca indeks unikalny -> 409
     - Waliduje self-reference
+    - enforce_acyclic: odrzuca (409) relacje drives/influences zamykające cykl, zwracając jego ścieżkę
     """
     # Sprawdź czy zmienne istnieją
-    if not check_variable_exists(db, rel.source_variable_id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Source variable with id {rel.source_variable_id} not found"
-        )
-    
-    if not check_variable_exists(db, rel.target_variable_id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Target variable with id {rel.target_variable_id} not found"
-        )
-    
-    # Sprawdź czy relacja już istnieje (zapobieganie duplikatom)
-    existing = db.query(Relationship).filter(
-        Relationship.source_variable_id == rel.source_variable_id,
-        Relationship.target_variable_id == rel.target_variable_id,
-        Relationship.is_active == True
-    ).first()
-    
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Relationship from variable {rel.source_variable_id} to {rel.target_variable_id} already exists"
+    active = set(await db.scalars(
+        select(Variable.id).where(
+            Variable.id.in_([rel.source_variable_id, rel.target_variable_id]),
+            Variable.is_active == True
         )
+    ))
+    for role, variable_id in (("Source", rel.source_variable_id), ("Target", rel.target_variable_id)):
+        if variable_id not in active:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{role} variable with id {variable_id} not found"
+            )
     
     # Utwórz relację
-    db_rel = Relationship(**rel.model_dump())
-    db.add(db_rel)
-    db.commit()
-    db.refresh(db_rel)
+    async with acyclic_guard_async(db, enabled=enforce_acyclic and rel.relationship_type in CAUSAL_TYPES) as index:
+        if index is not None:
+            check_acyclic_or_409(index, rel.source_variable_id, rel.target_variable_id)
+        db_rel = Relationship(**rel.model_dump())
+        db.add(db_rel)
+        await commit_or_409(db, rel.source_variable_id, rel.target_variable_id)
+        await db.refresh(db_rel)
+        bump(db, RELATIONSHIPS, changes=[Change(RELATIONSHIPS, "create", db_rel.id, row_values(db_rel))])
     return db_rel
 
 
-@router.get("", response_model=RelationshipList)
-def list_relationships(
+@router.post("/bulk", response_model=RelationshipBulkResult)
+def bulk_import_relationships(payload: RelationshipBulkRequest, db: Session = Depends(get_db)):
+    """
+    Masowy import relacji (np. mapy przyczynowej) z raportem błędów per rekord.
+    """
+    return bulk_create_relationships(
+        db, payload.items, all_or_nothing=payload.all_or_nothing, enforce_acyclic=payload.enforce_acyclic
+    )
+
+
+@router.get("", response_model=Union[RelationshipList, RelationshipDetailList])
+async def list_relationships(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
     include_inactive: bool = Query(False, description="Include soft-deleted relationships"),
@@ -164,56 +363,83 @@ def list_relationships(
     relationship_type: Optional[RelationshipType] = Query(None, description="Filter by relationship type"),
     direction: Optional[RelationshipDirection] = Query(None, description="Filter by direction"),
     shape: Optional[RelationshipShape] = Query(None, description="Filter by shape"),
-    db: Session = Depends(get_db)
+    include: Optional[RelationshipInclude] = Query(None, description="variables: add endpoint names, units and domains"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Lista relacji z opcjonalnym filtrowaniem i paginacją.
+
+    include=variables zwraca wiersze RelationshipDetailRead; zmienne są dołączane JOIN-em
+    w zapytaniu o stronę (stała liczba zapytań niezależnie od rozmiaru strony).
+
+    ETag/Last-Modified wg wersji tabeli relacji (z include=variables także zmiennych).
     """
-    query = db.query(Relationship)
+    tables = GRAPH_TABLES if include == RelationshipInclude.VARIABLES else (RELATIONSHIPS,)
+    conditional = ConditionalGet(request, db, "relationships", *tables)
+    cached = conditional.cached()
+    if cached is not None:
+        return cached
+
+    query = select(Relationship)
     
     # Filtrowanie
     if not include_inactive:
-        query = query.filter(Relationship.is_active == True)
+        query = query.where(Relationship.is_active == True)
     if source_variable_id is not None:
-        query = query.filter(Relationship.source_variable_id == source_variable_id)
+        query = query.where(Relationship.source_variable_id == source_variable_id)
     if target_variable_id is not None:
-        query = query.filter(Relationship.target_variable_id == target_variable_id)
+        query = query.where(Relationship.target_variable_id == target_variable_id)
     if relationship_type:
-        query = query.filter(Relationship.relationship_type == relationship_type)
+        query = query.where(Relationship.relationship_type == relationship_type)
     if direction:
-        query = query.filter(Relationship.direction == direction)
+        query = query.where(Relationship.direction == direction)
     if shape:
-        query = query.filter(Relationship.shape == shape)
+        query = query.where(Relationship.shape == shape)
     
     # Liczba wszystkich rekordów
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Pobierz dane z paginacją
-    items = query.offset(skip).limit(limit).all()
-    
-    return RelationshipList(
+    if include == RelationshipInclude.VARIABLES:
+        items = (await db.scalars(with_variables(query).offset(skip).limit(limit))).all()
+        return conditional.respond(RelationshipDetailList(
+            items=[to_detail(r) for r in items],
+            total=total,
+            skip=skip,
+            limit=limit
+        ))
+
+    items = (await db.scalars(query.offset(skip).limit(limit))).all()
+    
+    return conditional.respond(RelationshipList(
         items=items,
         total=total,
         skip=skip,
         limit=limit
-    )
+    ))
 
 
 @router.get("/{relationship_id}", response_model=RelationshipDetailRead)
-def get_relationship(
+async def get_relationship(
     relationship_id: int,
+    request: Request,
     include_inactive: bool = Query(False, description="Include soft-deleted relationship"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Pobiera pojedynczą relację po ID ze szczegółami zmiennych.
+    Pobiera pojedynczą relację po ID ze szczegółami zmiennych (jedno zapytanie z JOIN).
     """
-    query = db.query(Relationship).filter(Relationship.id == relationship_id)
+    conditional = ConditionalGet(request, db, "relationship", *GRAPH_TABLES)
+    cached = conditional.cached()
+    if cached is not None:
+        return cached
+
+    query = with_variables(select(Relationship)).where(Relationship.id == relationship_id)
     
     if not include_inactive:
-        query = query.filter(Relationship.is_active == True)
+        query = query.where(Relationship.is_active == True)
     
-    db_rel = query.first()
+    db_rel = await db.scalar(query)
     
     if not db_rel:
         raise HTTPException(
@@ -221,32 +447,24 @@ def get_relationship(
             detail=f"Relationship with id {relationship_id} not found"
         )
     
-    # Pobierz nazwy zmiennych dla szczegółów
-    source_var = db.query(Variable).filter(Variable.id == db_rel.source_variable_id).first()
-    target_var = db.query(Variable).filter(Variable.id == db_rel.target_variable_id).first()
-    
-    # Utwórz odpowiedź z szczegółami
-    result = RelationshipDetailRead.model_validate(db_rel)
-    result.source_variable_name = source_var.name if source_var else None
-    result.target_variable_name = target_var.name if target_var else None
-    
-    return result
+    return conditional.respond(to_detail(db_rel))
 
 
 @router.patch("/{relationship_id}", response_model=RelationshipRead)
-def update_relationship(
+async def update_relationship(
     relationship_id: int,
     rel_update: RelationshipUpdate,
-    db: Session = Depends(get_db)
+    enforce_acyclic: bool = Query(False, description="Reject a type change that closes a drives/influences cycle"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Aktualizuje relację (częściowa aktualizacja - PATCH).
     """
     # Pobierz relację
-    db_rel = db.query(Relationship).filter(
+    db_rel = await db.scalar(select(Relationship).where(
         Relationship.id == relationship_id,
         Relationship.is_active == True
-    ).first()
+    ))
     
     if not db_rel:
         raise HTTPException(
@@ -256,19 +474,30 @@ def update_relationship(
     
     # Aktualizuj pola
     update_data = rel_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_rel, field, value)
-    
-    db.commit()
-    db.refresh(db_rel)
+    changed = [field for field, value in update_data.items() if getattr(db_rel, field) != value]
+    becomes_causal = (
+        update_data.get("relationship_type") in CAUSAL_TYPES and db_rel.relationship_type not in CAUSAL_TYPES
+    )
+    async with acyclic_guard_async(db, enabled=enforce_acyclic and becomes_causal) as index:
+        if index is not None:
+            check_acyclic_or_409(index, db_rel.source_variable_id, db_rel.target_variable_id)
+        for field, value in update_data.items():
+            setattr(db_rel, field, value)
+
+        await db.commit()
+        await db.refresh(db_rel)
+        bump(
+            db, RELATIONSHIPS,
+            changes=[Change(RELATIONSHIPS, "update", db_rel.id, row_values(db_rel), fields=changed)]
+        )
     return db_rel
 
 
 @router.delete("/{relationship_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_relationship(
+async def delete_relationship(
     relationship_id: int,
     hard_delete: bool = Query(False, description="Permanently delete instead of soft delete"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Usuwa relację (soft delete lub hard delete).
@@ -276,7 +505,7 @@ def delete_relationship(
     Soft delete ustawia is_active=False.
     Hard delete całkowicie usuwa rekord z bazy.
     """
-    db_rel = db.query(Relationship).filter(Relationship.id == relationship_id).first()
+    db_rel = await db.get(Relationship, relationship_id)
     
     if not db_rel:
         raise HTTPException(
@@ -285,26 +514,30 @@ def delete_relationship(
         )
     
     if hard_delete:
-        db.delete(db_rel)
+        await db.delete(db_rel)
+        change = Change(RELATIONSHIPS, "purge", relationship_id)
     else:
         db_rel.is_active = False
+        change = Change(RELATIONSHIPS, "delete", relationship_id, row_values(db_rel), fields=["is_active"])
     
-    db.commit()
+    await db.commit()
+    bump(db, RELATIONSHIPS, changes=[change])
     return None
 
 
 @router.post("/{relationship_id}/restore", response_model=RelationshipRead)
-def restore_relationship(
+async def restore_relationship(
     relationship_id: int,
-    db: Session = Depends(get_db)
+    enforce_acyclic: bool = Query(False, description="Reject a restore that closes a drives/influences cycle"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Przywraca usuniętą relację (soft restore).
     """
-    db_rel = db.query(Relationship).filter(
+    db_rel = await db.scalar(select(Relationship).where(
         Relationship.id == relationship_id,
         Relationship.is_active == False
-    ).first()
+    ))
     
     if not db_rel:
         raise HTTPException(
@@ -312,88 +545,119 @@ def restore_relationship(
             detail=f"Deleted relationship with id {relationship_id} not found"
         )
     
-    db_rel.is_active = True
-    db.commit()
-    db.refresh(db_rel)
+    async with acyclic_guard_async(db, enabled=enforce_acyclic and db_rel.relationship_type in CAUSAL_TYPES) as index:
+        if index is not None:
+            check_acyclic_or_409(index, db_rel.source_variable_id, db_rel.target_variable_id)
+        db_rel.is_active = True
+        await commit_or_409(db, db_rel.source_variable_id, db_rel.target_variable_id)
+        await db.refresh(db_rel)
+        bump(
+            db, RELATIONSHIPS,
+            changes=[Change(RELATIONSHIPS, "restore", db_rel.id, row_values(db_rel), fields=["is_active"])]
+        )
     return db_rel
 
 
 # ============== Additional Endpoints ==============
 
 @router.get("/variable/{variable_id}/outgoing", response_model=List[RelationshipRead])
-def get_outgoing_relationships(
+async def get_outgoing_relationships(
     variable_id: int,
     include_inactive: bool = Query(False, description="Include soft-deleted relationships"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Pobiera wszystkie relacji wychodzące z danej zmiennej.
+
+    Aktywne relacje są serwowane z indeksu grafu w pamięci (bez zapytań do bazy).
     """
+    if not include_inactive:
+        index = await get_graph_index_async(db)
+        if not index.is_active_variable(variable_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Variable with id {variable_id} not found"
+            )
+        return index.outgoing(variable_id)
+
     # Sprawdź czy zmienna istnieje
-    if not check_variable_exists(db, variable_id, active_only=not include_inactive):
+    if not await check_variable_exists(db, variable_id, active_only=False):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Variable with id {variable_id} not found"
         )
     
-    query = db.query(Relationship).filter(
+    query = select(Relationship).where(
         Relationship.source_variable_id == variable_id
     )
     
-    if not include_inactive:
-        query = query.filter(Relationship.is_active == True)
-    
-    return query.all()
+    return (await db.scalars(query)).all()
 
 
 @router.get("/variable/{variable_id}/incoming", response_model=List[RelationshipRead])
-def get_incoming_relationships(
+async def get_incoming_relationships(
     variable_id: int,
     include_inactive: bool = Query(False, description="Include soft-deleted relationships"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Pobiera wszystkie relacji przychodzące do danej zmiennej.
+
+    Aktywne relacje są serwowane z indeksu grafu w pamięci (bez zapytań do bazy).
     """
+    if not include_inactive:
+        index = await get_graph_index_async(db)
+        if not index.is_active_variable(variable_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Variable with id {variable_id} not found"
+            )
+        return index.incoming(variable_id)
+
     # Sprawdź czy zmienna istnieje
-    if not check_variable_exists(db, variable_id, active_only=not include_inactive):
+    if not await check_variable_exists(db, variable_id, active_only=False):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Variable with id {variable_id} not found"
         )
     
-    query = db.query(Relationship).filter(
+    query = select(Relationship).where(
         Relationship.target_variable_id == variable_id
     )
     
-    if not include_inactive:
-        query = query.filter(Relationship.is_active == True)
-    
-    return query.all()
+    return (await db.scalars(query)).all()
 
 
 @router.get("/variable/{variable_id}/all", response_model=List[RelationshipRead])
-def get_all_variable_relationships(
+async def get_all_variable_relationships(
     variable_id: int,
     include_inactive: bool = Query(False, description="Include soft-deleted relationships"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Pobiera wszystkie relacji (wychodzące i przychodzące) dla danej zmiennej.
+
+    Aktywne relacje są serwowane z indeksu grafu w pamięci (bez zapytań do bazy).
     """
+    if not include_inactive:
+        index = await get_graph_index_async(db)
+        if not index.is_active_variable(variable_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Variable with id {variable_id} not found"
+            )
+        return index.incident(variable_id)
+
     # Sprawdź czy zmienna istnieje
-    if not check_variable_exists(db, variable_id, active_only=not include_inactive):
+    if not await check_variable_exists(db, variable_id, active_only=False):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Variable with id {variable_id} not found"
         )
     
-    query = db.query(Relationship).filter(
+    query = select(Relationship).where(
         (Relationship.source_variable_id == variable_id) |
         (Relationship.target_variable_id == variable_id)
     )
     
-    if not include_inactive:
-        query = query.filter(Relationship.is_active == True)
-    
-    return query.all()
+    return (await db.scalars(query)).all()
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field, ValidationError
+from scipy.stats import ks_2samp
+
+from .objectives import ObjectiveSpec, score_matrix
+
+
+class InvalidRun(ValueError):
+    """A stored run whose snapshot cannot be compared (runs may hold arbitrary client JSON)."""
+
+    def __init__(self, run_id: int, reason: str) -> None:
+        super().__init__(f"run {run_id}: {reason}")
+        self.run_id = run_id
+        self.reason = reason
+
+
+class _Bounds(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class _StoredMeta(BaseModel):
+    variable_order: Optional[List[int]] = None
+    objective: Optional[ObjectiveSpec] = None
+    best_score: Optional[float] = None
+    domain: Optional[Dict[str, _Bounds]] = None
+
+
+class _StoredRun(BaseModel):
+    """The parts of a DOE/optimize response the comparison reads, with their types."""
+    variable_ids: List[int] = Field(default_factory=list)
+    meta: Optional[_StoredMeta] = None
+    points: Optional[List[Dict[str, float]]] = None
+    history: Optional[List[Dict[str, float]]] = None
+    best_point: Optional[Dict[str, float]] = None
+
+
+def _validated(run_id: int, kind: str, response: Any) -> Dict[str, Any]:
+    """`response` checked and normalized for the comparison; raises InvalidRun."""
+    try:
+        data = _StoredRun.model_validate(response).model_dump()
+    except ValidationError as e:
+        err = e.errors()[0]
+        raise InvalidRun(run_id, f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}") from None
+    keys = _variable_keys(data)
+    field = "history" if kind == "optimize" else "points"
+    for i, point in enumerate(data[field] or []):
+        missing = next((k for k in keys if k not in point), None)
+        if missing is not None:
+            raise InvalidRun(run_id, f"{field}.{i}: missing variable {missing}")
+    objective = (data["meta"] or {}).get("objective")
+    if kind == "optimize" and objective is not None:
+        try:
+            score_matrix(np.empty((0, len(keys))), keys, ObjectiveSpec.model_validate(objective))
+        except (KeyError, ValueError) as e:
+            raise InvalidRun(run_id, f"meta.objective does not fit the run variables ({e})") from None
+    return data
+
+
+def _variable_keys(response: Dict[str, Any]) -> List[str]:
+    order = (response.get("meta") or {}).get("variable_order") or response.get("variable_ids") or []
+    return [str(v) for v in order]
+
+
+def _points_matrix(points: Sequence[Dict[str, Any]], keys: List[str]) -> np.ndarray:
+    """(n, d) float array from a list of point dicts, without per-row intermediate lists."""
+    if not points or not keys:
+        return np.empty((len(points), len(keys)))
+    flat = np.fromiter(
+        chain.from_iterable((p[k] for k in keys) for p in points),
+        dtype=float,
+        count=len(points) * len(keys),
+    )
+    return flat.reshape(len(points), len(keys))
+
+
+def _bound(d: Any, key: str) -> float:
+    v = d.get(key) if isinstance(d, dict) else None
+    return np.nan if v is None else float(v)
+
+
+def _domain_arrays(response: Dict[str, Any], keys: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    domain = (response.get("meta") or {}).get("domain") or {}
+    lo = np.array([_bound(domain.get(k), "min") for k in keys])
+    hi = np.array([_bound(domain.get(k), "max") for k in keys])
+    return lo, hi
+
+
+def _downsample(values: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick `n` evenly spaced samples (always keeping the first and last)."""
+    if values.size == 0:
+        return np.empty(0, dtype=int), values
+    idx = np.unique(np.linspace(0, values.size - 1, num=min(n, values.size)).round().astype(int))
+    return idx, values[idx]
+
+
+def _convergence(response: Dict[str, Any], keys: List[str], n: int) -> Optional[Dict[str, Any]]:
+    meta = response.get("meta") or {}
+    history = response.get("history") or []
+    if not history or not meta.get("objective"):
+        return None
+
+    obj = ObjectiveSpec.model_validate(meta["objective"])
+    X = _points_matrix(history, keys)
+    if obj.normalize == "domain":
+        lo, hi = _domain_arrays(response, keys)
+        width = np.where(hi > lo, hi - lo, 1.0)
+        X = np.where(hi > lo, (X - lo) / width, 0.0)
+
+    best_so_far = np.maximum.accumulate(score_matrix(X, keys, obj))
+    idx, values = _downsample(best_so_far, n)
+    return {
+        "iterations": (idx + 1).tolist(),
+        "progress": (idx / max(best_so_far.size - 1, 1)).tolist(),
+        "best_so_far": values.tolist(),
+    }
+
+
+def compare_runs(runs: Sequence[Tuple[int, str, Dict[str, Any]]], curve_points: int = 50) -> Dict[str, Any]:
+    """Compare stored runs against the first run of each type (the baseline).
+
+    - optimize: best-point deltas per shared variable, best-score deltas and
+      best-so-far convergence curves downsampled to `curve_points`
+    - doe: distribution shift of points per shared variable (mean/std change,
+      mean shift in units of domain width, two-sample KS statistic)
+
+    Raises InvalidRun for a snapshot of the wrong shape.
+    """
+    # stored snapshots are untrusted: checked up front (InvalidRun names the run)
+    runs = [(rid, kind, _validated(rid, kind, resp)) for rid, kind, resp in runs]
+    optimize = [(rid, resp) for rid, kind, resp in runs if kind == "optimize"]
+    doe = [(rid, resp) for rid, kind, resp in runs if kind == "doe"]
+
+    out: Dict[str, Any] = {
+        "run_ids": [rid for rid, _, _ in runs],
+        "run_types": {str(rid): kind for rid, kind, _ in runs},
+        "optimize": None,
+        "doe": None,
+    }
+
+    if optimize:
+        base_id, base = optimize[0]
+        base_keys = _variable_keys(base)
+        base_obj = (base.get("meta") or {}).get("objective")
+        base_best = base.get("best_point") or {}
+        base_score = (base.get("meta") or {}).get("best_score")
+
+        best_scores: Dict[str, Any] = {}
+        score_deltas: Dict[str, Any] = {}
+        point_deltas: Dict[str, Dict[str, float]] = {}
+        curves: Dict[str, Any] = {}
+        same_objective: Dict[str, bool] = {}
+
+        for rid, resp in optimize:
+            meta = resp.get("meta") or {}
+            keys = _variable_keys(resp)
+            best = resp.get("best_point") or {}
+            score = meta.get("best_score")
+
+            best_scores[str(rid)] = score
+            score_deltas[str(rid)] = None if score is None or base_score is None else float(score) - float(base_score)
+            same_objective[str(rid)] = meta.get("objective") == base_obj
+
+            shared = [k for k in keys if k in best and k in base_best]
+            if shared:
+                delta = np.array([float(best[k]) for k in shared]) - np.array([float(base_best[k]) for k in shared])
+                point_deltas[str(rid)] = dict(zip(shared, delta.tolist()))
+            else:
+                point_deltas[str(rid)] = {}
+
+            curves[str(rid)] = _convergence(resp, keys, curve_points)
+
+        out["optimize"] = {
+            "baseline_id": base_id,
+            "variable_order": base_keys,
+            "best_score": best_scores,
+            "best_score_delta": score_deltas,
+            "same_objective": same_objective,
+            "best_point_delta": point_deltas,
+            "convergence": curves,
+        }
+
+    if doe:
+        base_id, base = doe[0]
+        base_keys = _variable_keys(base)
+        base_X = _points_matrix(base.get("points") or [], base_keys)
+        lo, hi = _domain_arrays(base, base_keys)
+        width = np.where(hi > lo, hi - lo, np.nan)
+
+        shift: Dict[str, Any] = {}
+        for rid, resp in doe:
+            keys = _variable_keys(resp)
+            shared = [k for k in base_keys if k in keys]
+            if not shared or base_X.shape[0] == 0 or not resp.get("points"):
+                shift[str(rid)] = {}
+                continue
+
+            cols = [base_keys.index(k) for k in shared]
+            A = base_X[:, cols]
+            B = _points_matrix(resp["points"], shared)
+
+            mean_delta = B.mean(axis=0) - A.mean(axis=0)
+            std_a, std_b = A.std(axis=0), B.std(axis=0)
+            ks = np.atleast_1d(ks_2samp(A, B, axis=0).statistic)
+            normalized = mean_delta / width[cols]
+
+            shift[str(rid)] = {
+                k: {
+                    "mean": float(mb),
+                    "std": float(sb),
+                    "mean_delta": float(md),
+                    "mean_delta_domain": None if np.isnan(nd) else float(nd),
+                    "std_ratio": float(sb / sa) if sa > 0 else None,
+                    "ks_statistic": float(kss),
+                }
+                for k, mb, sb, sa, md, nd, kss in zip(
+                    shared, B.mean(axis=0), std_b, std_a, mean_delta, normalized, ks
+                )
+            }
+
+        out["doe"] = {"baseline_id": base_id, "variable_order": base_keys, "shift": shift}
+
+    return out
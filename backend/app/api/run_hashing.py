@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, Mapping, Optional
+
+
+def canonical_json(obj: Any) -> str:
+    """Stable JSON encoding (sorted keys, no whitespace) used as hash input."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _sha256(obj: Any) -> str:
+    return hashlib.sha256(canonical_json(obj).encode("utf-8")).hexdigest()
+
+
+def domain_fingerprint(domain: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Reduce a `meta.domain` mapping to the bounds that affect results.
+
+    Units and other display fields are dropped, so renaming a unit does not
+    invalidate stored runs, while any change of min/max does.
+    """
+    out: Dict[str, Any] = {}
+    for key, d in (domain or {}).items():
+        if not isinstance(d, Mapping):
+            continue
+        out[str(key)] = [d.get("min"), d.get("max")]
+    return out
+
+
+def request_hash(run_type: str, request: Mapping[str, Any], domain: Optional[Mapping[str, Any]]) -> str:
+    """Content address of a computation: canonical request + variable bounds at compute time."""
+    return _sha256({"run_type": run_type, "request": request, "domain": domain_fingerprint(domain)})
+
+
+def content_hash(
+    run_type: str,
+    title: Optional[str],
+    request: Mapping[str, Any],
+    response: Mapping[str, Any],
+) -> str:
+    """Content address of a stored run body (used to skip storing duplicates)."""
+    return _sha256({"run_type": run_type, "title": title, "request": request, "response": response})
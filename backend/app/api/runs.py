@@ -1,14 +1,21 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from pydantic import BaseModel, Field
+from sqlalchemy import exists, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..deps import get_db
-from ..models.experiment_run import ExperimentRun, ExperimentRunType
+from ..deps import get_async_db, get_async_read_db, get_read_db
+from ..models.experiment_run import ExperimentRun, ExperimentRunType, ExperimentRunVariable
+from .fast_json import FastJSONResponse
+from .objectives import ObjectiveKind
+from .run_compare import InvalidRun, compare_runs as compute_comparison
+from .run_hashing import content_hash
 
 
 router = APIRouter(prefix="/runs", tags=["runs"])
@@ -19,6 +26,16 @@ class RunType(str, Enum):
     optimize = "optimize"
 
 
+class RunSortField(str, Enum):
+    created_at = "created_at"
+    best_score = "best_score"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
 class CreateRunRequest(BaseModel):
     run_type: RunType
     title: Optional[str] = None
@@ -32,10 +49,27 @@ class RunResponse(BaseModel):
     title: Optional[str]
     request_json: Dict[str, Any]
     response_json: Dict[str, Any]
+    objective_kind: Optional[str] = None
+    best_score: Optional[float] = None
     created_at: str
     updated_at: str
 
 
+class PersistedRunResponse(BaseModel):
+    """Returned by experiment endpoints called with persist=true (no full payload)."""
+    run_id: int
+    run_type: RunType
+    title: Optional[str]
+    summary: Dict[str, Any] = Field(default_factory=dict)
+
+
+class RunCompareResponse(BaseModel):
+    run_ids: List[int]
+    run_types: Dict[str, RunType]
+    optimize: Optional[Dict[str, Any]] = None
+    doe: Optional[Dict[str, Any]] = None
+
+
 class DeleteRunResponse(BaseModel):
     ok: bool = True
 
@@ -47,74 +81,310 @@ class RunListResponse(BaseModel):
     limit: int
 
 
+def _to_payload(r: ExperimentRun) -> Dict[str, Any]:
+    """RunResponse fields as plain JSON data (stored payloads are already valid JSON)."""
+    return {
+        "id": r.id,
+        "run_type": r.run_type.value,
+        "title": r.title,
+        "request_json": r.request_json or {},
+        "response_json": r.response_json or {},
+        "objective_kind": r.objective_kind,
+        "best_score": r.best_score,
+        "created_at": r.created_at.isoformat().replace("+00:00", "Z"),
+        "updated_at": r.updated_at.isoformat().replace("+00:00", "Z"),
+    }
+
+
 def _to_response(r: ExperimentRun) -> RunResponse:
-    return RunResponse(
-        id=r.id,
-        run_type=RunType(r.run_type.value),
+    return RunResponse(**_to_payload(r))
+
+
+def summarize_run(run_type: RunType, response_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Small digest of a run result (what the UI needs without the full points/history)."""
+    meta = response_json.get("meta") or {}
+    summary: Dict[str, Any] = {
+        "method": response_json.get("method"),
+        "variable_ids": response_json.get("variable_ids", []),
+    }
+    if run_type == RunType.doe:
+        summary["n_points"] = len(response_json.get("points") or [])
+    else:
+        summary["n_iter"] = response_json.get("n_iter")
+        summary["history_length"] = len(response_json.get("history") or [])
+        summary["best_point"] = response_json.get("best_point", {})
+        summary["best_score"] = meta.get("best_score")
+    return summary
+
+
+def to_persisted_response(r: ExperimentRun) -> PersistedRunResponse:
+    run_type = RunType(r.run_type.value)
+    return PersistedRunResponse(
+        run_id=r.id,
+        run_type=run_type,
         title=r.title,
-        request_json=r.request_json or {},
-        response_json=r.response_json or {},
-        created_at=r.created_at.isoformat().replace("+00:00", "Z"),
-        updated_at=r.updated_at.isoformat().replace("+00:00", "Z"),
+        summary=summarize_run(run_type, r.response_json or {}),
     )
 
 
-@router.post("", response_model=RunResponse)
-def create_run(payload: CreateRunRequest, db: Session = Depends(get_db)) -> RunResponse:
-    obj = ExperimentRun(
-        run_type=ExperimentRunType(payload.run_type.value),
-        title=payload.title,
-        request_json=payload.request_json,
-        response_json=payload.response_json,
-        is_active=True,
+def extract_index_fields(
+    request_json: Dict[str, Any], response_json: Dict[str, Any]
+) -> Tuple[List[int], Optional[str], Optional[float]]:
+    """Project (variable_ids, objective kind, best score) out of the run snapshots.
+
+    Snapshots posted to POST /runs are arbitrary JSON: fields of an unexpected
+    shape are left out of the index instead of failing the request.
+    """
+    meta = response_json.get("meta")
+    if not isinstance(meta, dict):
+        meta = {}
+
+    raw_ids = response_json.get("variable_ids") or request_json.get("variable_ids")
+    if not isinstance(raw_ids, list):
+        raw_ids = []
+    variable_ids: List[int] = []
+    for vid in raw_ids:
+        try:
+            variable_ids.append(int(vid))
+        except (TypeError, ValueError):
+            continue
+
+    objective = request_json.get("objective") or meta.get("objective") or {}
+    kind = objective.get("kind") if isinstance(objective, dict) else None
+    if not isinstance(kind, str) or len(kind) > 32:
+        kind = None
+
+    best_score = meta.get("best_score")
+    try:
+        best_score = float(best_score) if best_score is not None else None
+    except (TypeError, ValueError):
+        best_score = None
+    if best_score is not None and best_score != best_score:  # NaN is not sortable
+        best_score = None
+
+    return list(dict.fromkeys(variable_ids)), (kind or None), best_score
+
+
+def find_reusable_run(db: Session, run_type: RunType, req_hash: str) -> Optional[ExperimentRun]:
+    """Latest active run the server computed from the same canonical request and variable bounds.
+
+    Runs posted to POST /runs are never returned: their bodies are client data.
+    """
+    return (
+        db.query(ExperimentRun)
+        .filter(
+            ExperimentRun.request_hash == req_hash,
+            ExperimentRun.computed == True,
+            ExperimentRun.run_type == ExperimentRunType(run_type.value),
+            ExperimentRun.is_active == True,
+        )
+        .order_by(ExperimentRun.id.desc())
+        .first()
+    )
+
+
+def _run_for_key(db: Session, idempotency_key: Optional[str], c_hash: str) -> Optional[ExperimentRun]:
+    """The run already stored under `idempotency_key`; 409 if it was deleted or the payload differs."""
+    existing = db.query(ExperimentRun).filter(ExperimentRun.idempotency_key == idempotency_key).first()
+    if existing is None:
+        return None
+    if not existing.is_active:
+        raise HTTPException(
+            status_code=409,
+            detail={"reason": "Idempotency-Key belongs to a deleted run", "run_id": existing.id},
+        )
+    if existing.content_hash != c_hash:
+        raise HTTPException(
+            status_code=409,
+            detail={"reason": "Idempotency-Key was already used with a different payload", "run_id": existing.id},
+        )
+    return existing
+
+
+def store_run(
+    db: Session,
+    run_type: RunType,
+    title: Optional[str],
+    request_json: Dict[str, Any],
+    response_json: Dict[str, Any],
+    req_hash: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+) -> ExperimentRun:
+    """Persist a run unless an identical active body already exists (that one is returned).
+
+    `req_hash` is passed only by the experiment endpoints for results they computed
+    themselves; it marks the run as computed (reusable). Client posted runs get none.
+    """
+    computed = req_hash is not None
+    c_hash = content_hash(run_type.value, title, request_json, response_json)
+
+    if idempotency_key is not None:
+        existing = _run_for_key(db, idempotency_key, c_hash)
+        if existing is not None:
+            return existing
+
+    duplicate = (
+        db.query(ExperimentRun)
+        .filter(
+            ExperimentRun.content_hash == c_hash,
+            ExperimentRun.computed == computed,
+            ExperimentRun.is_active == True,
+        )
+        .order_by(ExperimentRun.id.asc())
     )
-    db.add(obj)
-    db.commit()
+    if idempotency_key is not None:
+        # the key is recorded on the returned row, so only rows without one qualify
+        duplicate = duplicate.filter(ExperimentRun.idempotency_key.is_(None))
+    duplicate = duplicate.first()
+    if duplicate is not None and idempotency_key is None:
+        return duplicate
+
+    if duplicate is not None:
+        duplicate.idempotency_key = idempotency_key
+        obj = duplicate
+    else:
+        variable_ids, objective_kind, best_score = extract_index_fields(request_json, response_json)
+        obj = ExperimentRun(
+            run_type=ExperimentRunType(run_type.value),
+            title=title,
+            request_json=request_json,
+            response_json=response_json,
+            request_hash=req_hash,
+            content_hash=c_hash,
+            computed=computed,
+            idempotency_key=idempotency_key,
+            objective_kind=objective_kind,
+            best_score=best_score,
+            variable_links=[ExperimentRunVariable(variable_id=vid) for vid in variable_ids],
+            is_active=True,
+        )
+        db.add(obj)
+    try:
+        db.commit()
+    except IntegrityError:
+        # concurrent retry with the same Idempotency-Key won the insert
+        db.rollback()
+        existing = _run_for_key(db, idempotency_key, c_hash)
+        if existing is None:
+            raise HTTPException(status_code=409, detail={"reason": "Idempotency-Key conflict"})
+        return existing
     db.refresh(obj)
+    return obj
+
+
+@router.post("", response_model=RunResponse)
+async def create_run(
+    payload: CreateRunRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_async_db),
+) -> RunResponse:
+    """Store a run.
+
+    Not always a new row: a body identical to an active run returns that run (200, same id),
+    and a retry with the same `Idempotency-Key` returns the run stored under the key.
+    The key is recorded on whichever run is returned. 409 when the key was used with a
+    different body or belongs to a deleted run.
+    """
+    # store_run is shared with the sync experiment endpoints; run_sync keeps it on this connection
+    obj = await db.run_sync(
+        store_run,
+        payload.run_type,
+        payload.title,
+        payload.request_json,
+        payload.response_json,
+        idempotency_key=idempotency_key,
+    )
     return _to_response(obj)
 
 
 @router.get("", response_model=RunListResponse)
-def list_runs(
+async def list_runs(
     run_type: Optional[RunType] = None,
+    variable_id: Optional[List[int]] = Query(None, description="Only runs including all of these variables"),
+    objective_kind: Optional[ObjectiveKind] = None,
+    min_best_score: Optional[float] = None,
+    max_best_score: Optional[float] = None,
+    sort_by: RunSortField = RunSortField.created_at,
+    order: SortOrder = SortOrder.desc,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
-) -> RunListResponse:
-    q = db.query(ExperimentRun).filter(ExperimentRun.is_active == True)
+    db: AsyncSession = Depends(get_async_read_db),
+) -> FastJSONResponse:
+    q = select(ExperimentRun).where(ExperimentRun.is_active == True)
     if run_type is not None:
-        q = q.filter(ExperimentRun.run_type == ExperimentRunType(run_type.value))
+        q = q.where(ExperimentRun.run_type == ExperimentRunType(run_type.value))
+    for vid in dict.fromkeys(variable_id or []):
+        # one (variable_id, run_id) index probe per requested variable
+        q = q.where(
+            exists().where(
+                ExperimentRunVariable.run_id == ExperimentRun.id,
+                ExperimentRunVariable.variable_id == vid,
+            )
+        )
+    if objective_kind is not None:
+        q = q.where(ExperimentRun.objective_kind == objective_kind.value)
+    if min_best_score is not None:
+        q = q.where(ExperimentRun.best_score >= min_best_score)
+    if max_best_score is not None:
+        q = q.where(ExperimentRun.best_score <= max_best_score)
+
+    column = ExperimentRun.best_score if sort_by == RunSortField.best_score else ExperimentRun.created_at
+    ordering = column.asc() if order == SortOrder.asc else column.desc()
+    if sort_by == RunSortField.best_score:
+        ordering = ordering.nulls_last()
+
+    total = await db.scalar(select(func.count()).select_from(q.subquery()))
+    items = (await db.scalars(q.order_by(ordering, ExperimentRun.id.desc()).offset(skip).limit(limit))).all()
+
+    # stored run payloads can be large: serialized directly, not re-validated as RunListResponse
+    return FastJSONResponse({"items": [_to_payload(r) for r in items], "total": total, "skip": skip, "limit": limit})
 
-    total = q.count()
-    items = q.order_by(ExperimentRun.created_at.desc()).offset(skip).limit(limit).all()
 
-    return RunListResponse(
-        items=[_to_response(r) for r in items],
-        total=total,
-        skip=skip,
-        limit=limit,
+@router.get("/compare", response_model=RunCompareResponse)
+def compare_runs(
+    ids: str = Query(..., pattern=r"^\d+(,\d+)+$", description="Comma separated run ids; the first is the baseline"),
+    curve_points: int = Query(50, ge=2, le=1000, description="Points per downsampled convergence curve"),
+    db: Session = Depends(get_read_db),
+) -> RunCompareResponse:
+    """Server-side comparison of stored runs (best points, scores, convergence, DOE shift)."""
+    run_ids = list(dict.fromkeys(int(x) for x in ids.split(",")))
+    if len(run_ids) < 2:
+        raise HTTPException(status_code=422, detail="at least two distinct run ids are required")
+
+    rows = (
+        db.query(ExperimentRun.id, ExperimentRun.run_type, ExperimentRun.response_json)
+        .filter(ExperimentRun.id.in_(run_ids), ExperimentRun.is_active == True)
+        .all()
     )
+    by_id = {row.id: row for row in rows}
+    missing = [rid for rid in run_ids if rid not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail={"missing_run_ids": missing})
+
+    try:
+        result = compute_comparison(
+            [(rid, by_id[rid].run_type.value, by_id[rid].response_json or {}) for rid in run_ids],
+            curve_points=curve_points,
+        )
+    except InvalidRun as e:
+        raise HTTPException(status_code=422, detail={"reason": e.reason, "run_id": e.run_id})
+    return RunCompareResponse(**result)
 
 
 @router.get("/{run_id}", response_model=RunResponse)
-def get_run(run_id: int, db: Session = Depends(get_db)) -> RunResponse:
-    obj = db.query(ExperimentRun).filter(ExperimentRun.id == run_id, ExperimentRun.is_active == True).first()
+async def get_run(run_id: int, db: AsyncSession = Depends(get_async_read_db)) -> FastJSONResponse:
+    obj = await db.scalar(select(ExperimentRun).where(ExperimentRun.id == run_id, ExperimentRun.is_active == True))
     if obj is None:
-        from fastapi import HTTPException
-
         raise HTTPException(status_code=404, detail="run not found")
-    return _to_response(obj)
+    return FastJSONResponse(_to_payload(obj))
 
 
 @router.delete("/{run_id}", response_model=DeleteRunResponse)
-def delete_run(run_id: int, db: Session = Depends(get_db)) -> DeleteRunResponse:
-    obj = db.query(ExperimentRun).filter(ExperimentRun.id == run_id, ExperimentRun.is_active == True).first()
+async def delete_run(run_id: int, db: AsyncSession = Depends(get_async_db)) -> DeleteRunResponse:
+    obj = await db.scalar(select(ExperimentRun).where(ExperimentRun.id == run_id, ExperimentRun.is_active == True))
     if obj is None:
-        from fastapi import HTTPException
-
         raise HTTPException(status_code=404, detail="run not found")
 
     obj.is_active = False
-    db.add(obj)
-    db.commit()
+    await db.commit()
     return DeleteRunResponse(ok=True)
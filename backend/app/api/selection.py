@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..graph_index import CAUSAL_TYPES, get_graph_index
+from ..graph_rankings import get_influence
+from ..models.relationship import RelationshipType
+from ..models.variable import Variable, VariableType
+
+
+# Variable types that can be set in an experiment (KPIs are outputs, constants are fixed)
+CONTROLLABLE_TYPES = (VariableType.ENGINEERING_PROCESS_METRIC, VariableType.SUBJECTIVE_FACTOR)
+
+
+class SelectionSpec(BaseModel):
+    """Pick experiment inputs from the relationship graph instead of listing variable_ids."""
+
+    target_id: int = Field(..., ge=1, description="KPI / output variable the inputs should drive")
+    max_depth: int = Field(3, ge=1, le=20, description="Maximum number of hops upstream of the target")
+    max_variables: int = Field(5, ge=1, le=50, description="Maximum number of selected inputs")
+    relationship_types: Optional[List[RelationshipType]] = Field(
+        None, description="Relationship types to follow (default: drives, influences)"
+    )
+    variable_types: Optional[List[VariableType]] = Field(
+        None, description="Variable types that count as inputs (default: process metrics, subjective factors)"
+    )
+
+
+def select_variables(db: Session, spec: SelectionSpec) -> Tuple[List[int], Dict[str, Any]]:
+    """Top upstream inputs of `spec.target_id` with a safe (min + max) domain, strongest first.
+
+    Candidates come from a BFS over the in-memory graph index and are ordered by
+    influence towards the target (personalized PageRank, cached per graph version),
+    then by distance. Returns (variable ids, meta describing the selection).
+    """
+    types = list(spec.relationship_types or CAUSAL_TYPES)
+    index = get_graph_index(db)
+    if not index.is_active_variable(spec.target_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"missing_variable_ids": [spec.target_id]},
+        )
+    hops, _ = index.traverse(spec.target_id, upstream=True, max_depth=spec.max_depth, relationship_types=types)
+    hops.pop(spec.target_id, None)
+
+    allowed = list(spec.variable_types or CONTROLLABLE_TYPES)
+    rows = []
+    if hops:
+        rows = db.execute(
+            select(Variable.id, Variable.min_value, Variable.max_value).where(
+                Variable.id.in_(list(hops)),
+                Variable.is_active == True,
+                Variable.variable_type.in_(allowed),
+            )
+        ).all()
+    safe = [r.id for r in rows if r.min_value is not None and r.max_value is not None]
+    unsafe = sorted(r.id for r in rows if r.min_value is None or r.max_value is None)
+
+    version, scores = get_influence(db, spec.target_id, types)
+    safe.sort(key=lambda vid: (-scores.get(vid, 0.0), hops[vid], vid))
+    selected = safe[: spec.max_variables]
+    if not selected:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "reason": "no upstream variables with min_value and max_value",
+                "target_id": spec.target_id,
+                "unsafe_variable_ids": unsafe,
+            },
+        )
+    meta = {
+        "target_id": spec.target_id,
+        "graph_version": version,
+        "candidates": len(safe),
+        "skipped_unsafe_ids": unsafe,
+        "selected": [{"id": vid, "hops": hops[vid], "influence": scores.get(vid, 0.0)} for vid in selected],
+    }
+    return selected, meta
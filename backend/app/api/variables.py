@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional, List
+import codecs
+import csv
+import json
+from collections import ChainMap
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy import Text, and_, cast, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from pydantic import BaseModel, Field, field_validator, ConfigDict, ValidationError
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, List, Set, Tuple
 from datetime import datetime
 
-from ..models.variable import Variable, VariableType, VariableSource
-from ..deps import get_db
+from ..db_base import is_unique_violation
+from ..models.variable import ACTIVE_NAME_INDEX, Variable, VariableType, VariableSource
+from ..deps import get_async_db, get_async_read_db, get_db, get_read_db
+from ..variable_search import get_search_index, pg_search
+from ..versions import VARIABLES, RELATIONSHIPS, Change, bump, row_values
+from .http_cache import ConditionalGet
+from .bulk import BULK_BATCH_SIZE, BULK_MAX_ROWS, IN_CHUNK_SIZE, BulkRowError, chunks, row_errors
 
 
 # ============== Pydantic Schemas ==============
@@ -87,36 +99,566 @@ class VariableList(BaseModel):
     limit: int
 
 
+class VariableTreeNode(VariableRead):
+    """Węzeł drzewa hierarchii zmiennych (parent_variable_id)."""
+    depth: int
+    subtree_size: int = Field(1, description="Liczba zmiennych w poddrzewie (łącznie z węzłem)")
+    children: List["VariableTreeNode"] = Field(default_factory=list)
+
+
+class VariableTree(BaseModel):
+    """Całe drzewo hierarchii aktywnych zmiennych."""
+    roots: List[VariableTreeNode]
+    total: int
+    orphan_ids: List[int] = Field(..., description="Korzenie, których rodzic jest usunięty")
+    cyclic_ids: List[int] = Field(..., description="Zmienne w cyklu rodzicielskim (nieosiągalne z żadnego korzenia)")
+
+
+class VariableSearchHit(VariableRead):
+    """Wynik wyszukiwania z oceną trafności."""
+    score: float
+
+
+class VariableSearchResult(BaseModel):
+    """Wyniki wyszukiwania posortowane malejąco po trafności."""
+    query: str
+    items: List[VariableSearchHit]
+
+
+class VariableBatchItem(VariableUpdate):
+    """Częściowa aktualizacja jednej zmiennej w PATCH /variables/batch."""
+    id: int
+
+
+class VariableBatchRequest(BaseModel):
+    """Wiele częściowych aktualizacji zmiennych w jednej transakcji."""
+    items: List[VariableBatchItem] = Field(..., min_length=1, max_length=BULK_MAX_ROWS)
+    all_or_nothing: bool = Field(False, description="Nie zapisuj niczego, jeśli którakolwiek aktualizacja jest błędna")
+
+
+class VariableBatchResult(BaseModel):
+    """Zaktualizowane zmienne (w kolejności żądania) i błędy odrzuconych rekordów."""
+    items: List[VariableRead]
+    errors: List[BulkRowError]
+
+
+class VariableBulkRequest(BaseModel):
+    """Model importu wielu zmiennych (rekordy walidowane pojedynczo, z raportem błędów)."""
+    items: List[Dict[str, Any]] = Field(..., max_length=BULK_MAX_ROWS, description="Rekordy w formacie VariableCreate")
+    upsert: bool = Field(False, description="Aktualizuj istniejące zmienne o tej samej nazwie")
+    all_or_nothing: bool = Field(False, description="Nie zapisuj niczego, jeśli którykolwiek rekord jest błędny")
+
+
+class VariableBulkResult(BaseModel):
+    """Wynik importu masowego."""
+    created_ids: List[int]
+    updated_ids: List[int]
+    errors: List[BulkRowError]
+
+
 # ============== Router ==============
 
 router = APIRouter(prefix="/variables", tags=["variables"])
 
 
+# ============== Helper Functions ==============
+
+def _id_segment(column) -> Any:
+    return literal("/") + cast(column, Text) + literal("/")
+
+
+def variable_tree_cte(root_id: Optional[int] = None, max_depth: Optional[int] = None):
+    """
+    Rekurencyjne CTE (id, depth, path) hierarchii aktywnych zmiennych.
+
+    - root_id=None: korzenie to zmienne bez aktywnego rodzica
+    - path ("/1/5/9/") chroni przed zapętleniem na cyklach parent_variable_id
+    """
+    if root_id is None:
+        parent = aliased(Variable)
+        anchor_filter = and_(
+            Variable.is_active == True,
+            or_(
+                Variable.parent_variable_id.is_(None),
+                ~exists().where(parent.id == Variable.parent_variable_id, parent.is_active == True),
+            ),
+        )
+    else:
+        anchor_filter = and_(Variable.id == root_id, Variable.is_active == True)
+
+    tree = (
+        select(
+            Variable.id.label("id"),
+            literal(0).label("depth"),
+            cast(_id_segment(Variable.id), Text).label("path"),
+        )
+        .where(anchor_filter)
+        .cte("variable_tree", recursive=True)
+    )
+    child = aliased(Variable)
+    step = select(
+        child.id,
+        tree.c.depth + 1,
+        cast(tree.c.path + cast(child.id, Text) + literal("/"), Text),
+    ).where(
+        child.parent_variable_id == tree.c.id,
+        child.is_active == True,
+        ~tree.c.path.contains(_id_segment(child.id)),
+    )
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    return tree.union_all(step)
+
+
+def build_variable_tree(rows: Iterable[Tuple[Variable, int]]) -> List[VariableTreeNode]:
+    """Składa węzły (posortowane po głębokości) w zagnieżdżoną strukturę i liczy rozmiary poddrzew."""
+    nodes: Dict[int, VariableTreeNode] = {}
+    order: List[VariableTreeNode] = []
+    roots: List[VariableTreeNode] = []
+    for var, depth in rows:
+        node = VariableTreeNode.model_validate({**row_values(var), "depth": depth})
+        parent = nodes.get(var.parent_variable_id) if depth > 0 else None
+        (parent.children if parent is not None else roots).append(node)
+        nodes[var.id] = node
+        order.append(node)
+    for node in reversed(order):
+        node.subtree_size = 1 + sum(c.subtree_size for c in node.children)
+    return roots
+
+
+def ancestor_ids(db: Session, variable_id: int) -> List[int]:
+    """Zmienna i wszyscy jej przodkowie (jedno rekurencyjne zapytanie, odporne na istniejące cykle)."""
+    chain = (
+        select(
+            Variable.id.label("id"),
+            Variable.parent_variable_id.label("parent_id"),
+            cast(_id_segment(Variable.id), Text).label("path"),
+        )
+        .where(Variable.id == variable_id)
+        .cte("variable_ancestors", recursive=True)
+    )
+    parent = aliased(Variable)
+    chain = chain.union_all(
+        select(
+            parent.id,
+            parent.parent_variable_id,
+            cast(chain.c.path + cast(parent.id, Text) + literal("/"), Text),
+        ).where(parent.id == chain.c.parent_id, ~chain.c.path.contains(_id_segment(parent.id)))
+    )
+    return list(db.scalars(select(chain.c.id)))
+
+
+def parent_links(db: Session, variable_ids: Iterable[int]) -> Dict[int, Optional[int]]:
+    """{id: parent_variable_id} dla podanych zmiennych i wszystkich ich przodków (rekurencyjnie, porcjami)."""
+    links: Dict[int, Optional[int]] = {}
+    for chunk in chunks(sorted(set(variable_ids)), IN_CHUNK_SIZE):
+        chain = (
+            select(
+                Variable.id.label("id"),
+                Variable.parent_variable_id.label("parent_id"),
+                cast(_id_segment(Variable.id), Text).label("path"),
+            )
+            .where(Variable.id.in_(chunk))
+            .cte("variable_ancestors", recursive=True)
+        )
+        parent = aliased(Variable)
+        chain = chain.union_all(
+            select(
+                parent.id,
+                parent.parent_variable_id,
+                cast(chain.c.path + cast(parent.id, Text) + literal("/"), Text),
+            ).where(parent.id == chain.c.parent_id, ~chain.c.path.contains(_id_segment(parent.id)))
+        )
+        links.update(db.execute(select(chain.c.id, chain.c.parent_id)).all())
+    return links
+
+
+def batch_update_variables(
+    db: Session,
+    items: List[VariableBatchItem],
+    all_or_nothing: bool = False,
+) -> VariableBatchResult:
+    """
+    Aktualizuje wiele zmiennych w jednej transakcji.
+
+    - Bieżące wiersze, rodzice i nazwy: zapytania zbiorowe (IN, porcjami) zamiast zapytań per rekord
+    - Cykle w hierarchii: jedno rekurencyjne zapytanie o przodków nowych rodziców, z nałożonymi
+      zmianami z paczki
+    - Zapis: jedno UPDATE wykonywane wsadowo (executemany), jeden bump wersji ze zmianami per wiersz
+    """
+    errors: List[BulkRowError] = []
+    ids = [item.id for item in items]
+
+    current: Dict[int, Variable] = {}
+    for chunk in chunks(sorted(set(ids)), IN_CHUNK_SIZE):
+        current.update(
+            (v.id, v) for v in db.scalars(select(Variable).where(Variable.id.in_(chunk), Variable.is_active == True))
+        )
+
+    parent_ids = sorted({i.parent_variable_id for i in items if i.parent_variable_id is not None})
+    active_parents: Set[int] = set()
+    for chunk in chunks(parent_ids, IN_CHUNK_SIZE):
+        active_parents.update(
+            db.scalars(select(Variable.id).where(Variable.id.in_(chunk), Variable.is_active == True))
+        )
+
+    valid: List[Tuple[int, VariableBatchItem, Dict[str, Any]]] = []
+    first_row: Dict[int, int] = {}
+    for row, item in enumerate(items):
+        db_var = current.get(item.id)
+        values = item.model_dump(exclude_unset=True, exclude={"id"})
+        row_errs: List[str] = []
+        if db_var is None:
+            row_errs.append(f"Variable with id {item.id} not found")
+        elif item.id in first_row:
+            row_errs.append(f"Duplicate variable id in batch (first at row {first_row[item.id]})")
+        else:
+            if item.parent_variable_id is not None:
+                if item.parent_variable_id == item.id:
+                    row_errs.append("Variable cannot be its own parent")
+                elif item.parent_variable_id not in active_parents:
+                    row_errs.append(f"Parent variable with id {item.parent_variable_id} not found")
+            new_min = item.min_value if item.min_value is not None else db_var.min_value
+            new_max = item.max_value if item.max_value is not None else db_var.max_value
+            if new_min is not None and new_max is not None and new_max <= new_min:
+                row_errs.append("max_value must be greater than min_value")
+        first_row.setdefault(item.id, row)
+        if row_errs:
+            errors.append(BulkRowError(row=row, name=item.name, errors=row_errs))
+            continue
+        valid.append((row, item, values))
+
+    # Nazwy: zajęte przez inne aktywne zmienne (także zmieniające nazwę w tej paczce -
+    # indeks unikalny jest sprawdzany wiersz po wierszu, więc zamiana nazw też byłaby konfliktem)
+    renamed = {item.id: values["name"] for _, item, values in valid if "name" in values}
+    taken: Dict[str, int] = {}
+    for chunk in chunks(sorted(set(renamed.values())), IN_CHUNK_SIZE):
+        taken.update(db.execute(
+            select(Variable.name, Variable.id).where(Variable.name.in_(chunk), Variable.is_active == True)
+        ).all())
+    claimed: Dict[str, int] = {}
+    checked: List[Tuple[int, VariableBatchItem, Dict[str, Any]]] = []
+    for row, item, values in valid:
+        name = values.get("name")
+        if name is not None:
+            owner = taken.get(name)
+            if owner is not None and owner != item.id:
+                errors.append(BulkRowError(row=row, name=name, errors=[f"Variable with name '{name}' already exists"]))
+                continue
+            if name in claimed:
+                errors.append(BulkRowError(
+                    row=row, name=name, errors=[f"Duplicate name in batch (first at row {claimed[name]})"]
+                ))
+                continue
+            claimed[name] = row
+        checked.append((row, item, values))
+
+    # Hierarchia: nowy rodzic nie może być potomkiem (uwzględniając inne zmiany rodziców z paczki)
+    new_parents = {item.id: values["parent_variable_id"] for _, item, values in checked if "parent_variable_id" in values}
+    links = ChainMap(new_parents, parent_links(db, [p for p in new_parents.values() if p is not None]))
+    valid = []
+    for row, item, values in checked:
+        if item.id in new_parents:
+            seen: Set[int] = set()
+            node = new_parents[item.id]
+            while node is not None and node not in seen and node != item.id:
+                seen.add(node)
+                node = links.get(node)
+            if node == item.id:
+                errors.append(BulkRowError(row=row, name=item.name, errors=[
+                    f"Variable {item.id} is an ancestor of {item.parent_variable_id}; "
+                    "setting it as parent would create a cycle"
+                ]))
+                continue
+        valid.append((row, item, values))
+
+    errors.sort(key=lambda e: e.row)
+    if (errors and all_or_nothing) or not valid:
+        return VariableBatchResult(items=[], errors=errors)
+
+    now = datetime.utcnow()
+    changed = {
+        item.id: [f for f, v in values.items() if getattr(current[item.id], f) != v] for _, item, values in valid
+    }
+    try:
+        db.execute(update(Variable), [{"id": item.id, **values, "updated_at": now} for _, item, values in valid])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_unique_violation(e, Variable.__table__, ACTIVE_NAME_INDEX):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Batch conflicts with concurrent changes: {e.orig}"
+            )
+        raise
+
+    updated_ids = [item.id for _, item, _ in valid]
+    updated: Dict[int, Variable] = {}
+    for chunk in chunks(updated_ids, IN_CHUNK_SIZE):
+        updated.update((v.id, v) for v in db.scalars(select(Variable).where(Variable.id.in_(chunk))))
+    bump(db, VARIABLES, changes=[
+        Change(VARIABLES, "update", i, row_values(updated[i]), fields=changed[i]) for i in updated_ids
+    ])
+    return VariableBatchResult(items=[updated[i] for i in updated_ids], errors=errors)
+
+
+def bulk_upsert_variables(
+    db: Session,
+    rows: Iterable[Dict[str, Any]],
+    upsert: bool = False,
+    all_or_nothing: bool = False,
+) -> VariableBulkResult:
+    """
+    Importuje wiele zmiennych w jednej transakcji.
+
+    - Walidacja wszystkich rekordów w jednym przebiegu (błędy per rekord)
+    - Konflikty nazw i rodzice sprawdzane zapytaniami zbiorowymi (IN)
+    - Wstawianie/aktualizacja wsadowa (executemany)
+    """
+    errors: List[BulkRowError] = []
+    valid: List[Tuple[int, VariableCreate]] = []
+    seen_names: Dict[str, int] = {}
+
+    for i, raw in enumerate(rows):
+        if i >= BULK_MAX_ROWS:
+            raise too_many_rows()
+        name = raw.get("name") if isinstance(raw, dict) else None
+        try:
+            var = VariableCreate.model_validate(raw)
+        except ValidationError as e:
+            errors.append(BulkRowError(row=i, name=name, errors=row_errors(e)))
+            continue
+        if var.name in seen_names:
+            errors.append(BulkRowError(
+                row=i, name=var.name,
+                errors=[f"Duplicate name in batch (first at row {seen_names[var.name]})"]
+            ))
+            continue
+        seen_names[var.name] = i
+        valid.append((i, var))
+
+    # Istniejące aktywne zmienne o tych nazwach (jedno zapytanie na porcję nazw)
+    existing: Dict[str, Any] = {}
+    for chunk in chunks(list(seen_names), IN_CHUNK_SIZE):
+        for row in db.execute(
+            select(Variable.id, Variable.name, Variable.min_value, Variable.max_value)
+            .where(Variable.name.in_(chunk), Variable.is_active == True)
+        ):
+            existing[row.name] = row
+
+    # Aktywni rodzice (jedno zapytanie na porcję id)
+    parent_ids = sorted({v.parent_variable_id for _, v in valid if v.parent_variable_id is not None})
+    active_parents = set()
+    for chunk in chunks(parent_ids, IN_CHUNK_SIZE):
+        active_parents.update(
+            db.scalars(select(Variable.id).where(Variable.id.in_(chunk), Variable.is_active == True))
+        )
+
+    to_insert: List[Tuple[int, Dict[str, Any]]] = []
+    to_update: List[Tuple[int, Dict[str, Any]]] = []
+    for i, var in valid:
+        if var.parent_variable_id is not None and var.parent_variable_id not in active_parents:
+            errors.append(BulkRowError(
+                row=i, name=var.name,
+                errors=[f"Parent variable with id {var.parent_variable_id} not found"]
+            ))
+            continue
+
+        current = existing.get(var.name)
+        if current is None:
+            to_insert.append((i, var.model_dump()))
+            continue
+        if not upsert:
+            errors.append(BulkRowError(
+                row=i, name=var.name, errors=[f"Variable with name '{var.name}' already exists"]
+            ))
+            continue
+
+        # Upsert: aktualizujemy tylko pola podane w rekordzie
+        values = var.model_dump(exclude_unset=True)
+        if values.get("parent_variable_id") == current.id:
+            errors.append(BulkRowError(row=i, name=var.name, errors=["Variable cannot be its own parent"]))
+            continue
+        new_min = values.get("min_value", current.min_value)
+        new_max = values.get("max_value", current.max_value)
+        if new_min is not None and new_max is not None and new_max <= new_min:
+            errors.append(BulkRowError(row=i, name=var.name, errors=["max_value must be greater than min_value"]))
+            continue
+        to_update.append((i, {"id": current.id, **values}))
+
+    # Hierarchia: jak w batch_update_variables - nowy rodzic nie może być potomkiem
+    # (nowe rekordy nie mają jeszcze potomków, więc sprawdzamy tylko aktualizacje)
+    new_parents = {values["id"]: values["parent_variable_id"] for _, values in to_update if "parent_variable_id" in values}
+    links = ChainMap(new_parents, parent_links(db, [p for p in new_parents.values() if p is not None]))
+    acyclic: List[Tuple[int, Dict[str, Any]]] = []
+    for i, values in to_update:
+        if values["id"] in new_parents:
+            seen: Set[int] = set()
+            node = new_parents[values["id"]]
+            while node is not None and node not in seen and node != values["id"]:
+                seen.add(node)
+                node = links.get(node)
+            if node == values["id"]:
+                errors.append(BulkRowError(row=i, name=values.get("name"), errors=[
+                    f"Variable {values['id']} is an ancestor of {values['parent_variable_id']}; "
+                    "setting it as parent would create a cycle"
+                ]))
+                continue
+        acyclic.append((i, values))
+    to_update = acyclic
+
+    if errors and all_or_nothing:
+        errors.sort(key=lambda e: e.row)
+        return VariableBulkResult(created_ids=[], updated_ids=[], errors=errors)
+
+    created_ids: List[int] = []
+    try:
+        for batch in chunks(to_insert, BULK_BATCH_SIZE):
+            result = db.execute(
+                insert(Variable).returning(Variable.id, sort_by_parameter_order=True),
+                [values for _, values in batch],
+            )
+            created_ids.extend(result.scalars().all())
+
+        now = datetime.utcnow()
+        for batch in chunks(to_update, BULK_BATCH_SIZE):
+            db.execute(update(Variable), [{**values, "updated_at": now} for _, values in batch])
+
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Bulk import conflicts with concurrent changes: {e.orig}"
+        )
+
+    if to_insert or to_update:
+        bump(db, VARIABLES)
+
+    errors.sort(key=lambda e: e.row)
+    return VariableBulkResult(
+        created_ids=created_ids,
+        updated_ids=[values["id"] for _, values in to_update],
+        errors=errors,
+    )
+
+
+async def _iter_body_lines(request: Request):
+    """Strumieniowo dekoduje ciało żądania na linie (CSV/NDJSON)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def too_many_rows() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Bulk import is limited to {BULK_MAX_ROWS} rows"
+    )
+
+
+def _csv_record(record: str, final: bool = False) -> Optional[List[str]]:
+    """Pola jednego rekordu CSV albo None, gdy pole w cudzysłowie trwa w kolejnej linii."""
+    lines = record.splitlines(keepends=True)
+    if not final:
+        try:
+            list(csv.reader(lines, strict=True))
+        except csv.Error as e:
+            if "unexpected end of data" in str(e):
+                return None
+    # Parsowanie jak csv.DictReader (tryb nieścisły)
+    return next(csv.reader(lines), [])
+
+
+async def _csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    """Rekordy CSV (pierwszy to nagłówek) parsowane w miarę napływu linii."""
+    header: Optional[List[str]] = None
+    record = ""
+    async for line in lines:
+        record += line
+        values = _csv_record(record)
+        if values is None:
+            continue
+        record = ""
+        if not values:
+            continue
+        if header is None:
+            header = [k.strip() for k in values]
+            continue
+        # Puste komórki traktujemy jak brak wartości (pole domyślne)
+        yield {k: v for k, v in zip(header, values) if k and v != ""}
+    values = _csv_record(record, final=True) if record else None
+    if values and header is not None:
+        yield {k: v for k, v in zip(header, values) if k and v != ""}
+
+
+async def _ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Any]:
+    i = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid JSON in row {i}: {e.msg}"
+            )
+        i += 1
+
+
+async def _body_rows(request: Request, content_type: str) -> List[Any]:
+    """Wiersze pliku z ciała żądania; 413 zaraz po wierszu BULK_MAX_ROWS, bez czytania reszty."""
+    parse = _csv_rows if content_type == "text/csv" else _ndjson_rows
+    rows: List[Any] = []
+    async for row in parse(_iter_body_lines(request)):
+        if len(rows) >= BULK_MAX_ROWS:
+            raise too_many_rows()
+        rows.append(row)
+    return rows
+
+
+async def commit_or_409(db: AsyncSession, name: str) -> None:
+    """Commit; naruszenie unikalności nazwy aktywnej zmiennej -> 409 (inne błędy bez zmian)."""
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, Variable.__table__, ACTIVE_NAME_INDEX):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Variable with name '{name}' already exists"
+            )
+        raise
+
+
+async def get_active_variable(db: AsyncSession, variable_id: int) -> Optional[Variable]:
+    return await db.scalar(select(Variable).where(Variable.id == variable_id, Variable.is_active == True))
+
+
 # ============== CRUD Endpoints ==============
+# Pojedyncze operacje CRUD i lista są asynchroniczne (AsyncSession, asyncpg/aiosqlite):
+# czekanie na bazę nie zajmuje wątków puli, z której korzystają endpointy obliczeniowe.
 
 @router.post("", response_model=VariableRead, status_code=status.HTTP_201_CREATED)
-def create_variable(var: VariableCreate, db: Session = Depends(get_db)):
+async def create_variable(var: VariableCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Tworzy nową zmienną.
     
-    - Sprawdza unikalność nazwy
+    - Unikalność nazwy wśród aktywnych pilnuje indeks częściowy (konflikt -> 409, bez zapytania wstępnego)
     - Waliduje constraint min < max
     - Obsługuje hierarchię (parent_variable_id)
     """
-    # Sprawdź czy nazwa już istnieje
-    existing = db.query(Variable).filter(Variable.name == var.name).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Variable with name '{var.name}' already exists"
-        )
-    
     # Sprawdź czy parent_variable_id istnieje (jeśli podane)
     if var.parent_variable_id is not None:
-        parent = db.query(Variable).filter(
-            Variable.id == var.parent_variable_id,
-            Variable.is_active == True
-        ).first()
+        parent = await get_active_variable(db, var.parent_variable_id)
         if not parent:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -126,65 +668,194 @@ def create_variable(var: VariableCreate, db: Session = Depends(get_db)):
     # Utwórz nową zmienną
     db_var = Variable(**var.model_dump())
     db.add(db_var)
-    db.commit()
-    db.refresh(db_var)
+    await commit_or_409(db, var.name)
+    await db.refresh(db_var)
+    bump(db, VARIABLES, changes=[Change(VARIABLES, "create", db_var.id, row_values(db_var))])
     return db_var
 
 
+@router.post("/bulk", response_model=VariableBulkResult)
+def bulk_import_variables(payload: VariableBulkRequest, db: Session = Depends(get_db)):
+    """
+    Masowy import zmiennych (JSON) z opcjonalnym upsertem po nazwie.
+
+    Poprawne rekordy są zapisywane w jednej transakcji, błędne raportowane per rekord.
+    """
+    return bulk_upsert_variables(db, payload.items, upsert=payload.upsert, all_or_nothing=payload.all_or_nothing)
+
+
+@router.post("/bulk/upload", response_model=VariableBulkResult)
+async def bulk_upload_variables(
+    request: Request,
+    upsert: bool = Query(False, description="Update existing variables with the same name"),
+    all_or_nothing: bool = Query(False, description="Write nothing if any row is invalid"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Masowy import zmiennych z pliku strumieniowanego w ciele żądania.
+
+    - `text/csv`: nagłówek z nazwami pól VariableCreate
+    - `application/x-ndjson`: jeden obiekt JSON na linię
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in ("text/csv", "application/x-ndjson", "application/jsonl"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Use text/csv or application/x-ndjson"
+        )
+
+    rows = await _body_rows(request, content_type)
+    return await db.run_sync(bulk_upsert_variables, rows, upsert, all_or_nothing)
+
+
 @router.get("", response_model=VariableList)
-def list_variables(
+async def list_variables(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
     include_inactive: bool = Query(False, description="Include soft-deleted variables"),
     variable_type: Optional[VariableType] = Query(None, description="Filter by variable type"),
     layer_level: Optional[int] = Query(None, ge=0, description="Filter by layer level"),
     parent_id: Optional[int] = Query(None, description="Filter by parent variable ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Lista zmiennych z opcjonalnym filtrowaniem i paginacją.
+
+    ETag/Last-Modified wg wersji tabeli zmiennych; If-None-Match -> 304 bez zapytań do bazy.
     """
-    query = db.query(Variable)
+    conditional = ConditionalGet(request, db, "variables", VARIABLES)
+    cached = conditional.cached()
+    if cached is not None:
+        return cached
+
+    query = select(Variable)
     
     # Filtrowanie
     if not include_inactive:
-        query = query.filter(Variable.is_active == True)
+        query = query.where(Variable.is_active == True)
     if variable_type:
-        query = query.filter(Variable.variable_type == variable_type)
+        query = query.where(Variable.variable_type == variable_type)
     if layer_level is not None:
-        query = query.filter(Variable.layer_level == layer_level)
+        query = query.where(Variable.layer_level == layer_level)
     if parent_id is not None:
-        query = query.filter(Variable.parent_variable_id == parent_id)
+        query = query.where(Variable.parent_variable_id == parent_id)
     
     # Liczba wszystkich rekordów (dla paginacji)
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Pobierz dane z paginacją
-    items = query.offset(skip).limit(limit).all()
+    items = (await db.scalars(query.offset(skip).limit(limit))).all()
     
-    return VariableList(
+    return conditional.respond(VariableList(
         items=items,
         total=total,
         skip=skip,
         limit=limit
+    ))
+
+
+@router.get("/search", response_model=VariableSearchResult)
+def search_variables(
+    q: str = Query(..., min_length=1, max_length=200, description="Search text (prefix of words is enough)"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+    fuzzy: bool = Query(True, description="Tolerate typos (trigram similarity)"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Wyszukiwanie aktywnych zmiennych po nazwie, symbolu i opisie, z rankingiem trafności.
+
+    - PostgreSQL: indeksy pg_trgm i pełnotekstowe (GIN)
+    - inne bazy: indeks odwrócony w pamięci procesu (aktualizowany przy zapisach)
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        hits = [
+            VariableSearchHit.model_validate({**row_values(var), "score": score})
+            for var, score in pg_search(db, q, limit=limit, fuzzy=fuzzy)
+        ]
+    else:
+        hits = [
+            VariableSearchHit.model_validate({**rec, "score": score})
+            for rec, score in get_search_index(db).search(q, limit=limit, fuzzy=fuzzy)
+        ]
+    return VariableSearchResult(query=q, items=hits)
+
+
+@router.get("/tree", response_model=VariableTree)
+def get_variable_tree(
+    max_depth: Optional[int] = Query(None, ge=0, description="Maximum depth below the roots"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Całe drzewo hierarchii aktywnych zmiennych w jednym zapytaniu (rekurencyjne CTE).
+
+    Korzenie to zmienne bez rodzica lub z usuniętym rodzicem (orphan_ids). Zmienne
+    w cyklu parent_variable_id nie należą do żadnego poddrzewa i są zwracane w cyclic_ids.
+    """
+    tree = variable_tree_cte(max_depth=max_depth)
+    rows = db.execute(
+        select(Variable, tree.c.depth)
+        .outerjoin(tree, tree.c.id == Variable.id)
+        .where(Variable.is_active == True)
+        .order_by(tree.c.depth, Variable.id)
+    ).all()
+
+    placed = [(var, depth) for var, depth in rows if depth is not None]
+    # bez limitu głębokości każda zmienna poza cyklem jest osiągalna z korzenia
+    cyclic_ids = [var.id for var, depth in rows if depth is None] if max_depth is None else []
+    orphan_ids = [var.id for var, depth in placed if depth == 0 and var.parent_variable_id is not None]
+    return VariableTree(
+        roots=build_variable_tree(placed),
+        total=len(placed),
+        orphan_ids=orphan_ids,
+        cyclic_ids=cyclic_ids,
     )
 
 
+@router.get("/{variable_id}/tree", response_model=VariableTreeNode)
+def get_variable_subtree(
+    variable_id: int,
+    max_depth: Optional[int] = Query(None, ge=0, description="Maximum depth below the variable"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Poddrzewo zmiennej (zmienna + wszyscy aktywni potomkowie) w jednym zapytaniu.
+    """
+    tree = variable_tree_cte(root_id=variable_id, max_depth=max_depth)
+    rows = db.execute(
+        select(Variable, tree.c.depth)
+        .join(tree, tree.c.id == Variable.id)
+        .order_by(tree.c.depth, Variable.id)
+    ).all()
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Variable with id {variable_id} not found"
+        )
+    return build_variable_tree(rows)[0]
+
+
 @router.get("/{variable_id}", response_model=VariableRead)
-def get_variable(
+async def get_variable(
     variable_id: int,
+    request: Request,
     include_inactive: bool = Query(False, description="Include soft-deleted variable"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Pobiera pojedynczą zmienną po ID.
+    Pobiera pojedynczą zmienną po ID (ETag/Last-Modified jak w liście).
     """
-    query = db.query(Variable).filter(Variable.id == variable_id)
+    conditional = ConditionalGet(request, db, "variable", VARIABLES)
+    cached = conditional.cached()
+    if cached is not None:
+        return cached
+
+    query = select(Variable).where(Variable.id == variable_id)
     
     if not include_inactive:
-        query = query.filter(Variable.is_active == True)
+        query = query.where(Variable.is_active == True)
     
-    db_var = query.first()
+    db_var = await db.scalar(query)
     
     if not db_var:
         raise HTTPException(
@@ -192,27 +863,35 @@ def get_variable(
             detail=f"Variable with id {variable_id} not found"
         )
     
-    return db_var
+    return conditional.respond(VariableRead.model_validate(db_var))
+
+
+@router.patch("/batch", response_model=VariableBatchResult)
+def batch_update(payload: VariableBatchRequest, db: Session = Depends(get_db)):
+    """
+    Częściowa aktualizacja wielu zmiennych (np. granic i confidence po kalibracji) w jednej transakcji.
+
+    Rekordy jak w PATCH /variables/{id} z dodatkowym polem id; błędne rekordy są raportowane
+    w errors (all_or_nothing=true: nic nie jest zapisywane).
+    """
+    return batch_update_variables(db, payload.items, all_or_nothing=payload.all_or_nothing)
 
 
 @router.patch("/{variable_id}", response_model=VariableRead)
-def update_variable(
+async def update_variable(
     variable_id: int,
     var_update: VariableUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Aktualizuje zmienną (częściowa aktualizacja - PATCH).
     
-    - Sprawdza unikalność nazwy (jeśli zmieniana)
+    - Zajęta nazwa (wśród aktywnych) -> 409 z indeksu unikalnego
     - Waliduje constraint min < max
     - Obsługuje zmianę rodzica
     """
     # Pobierz zmienną
-    db_var = db.query(Variable).filter(
-        Variable.id == variable_id,
-        Variable.is_active == True
-    ).first()
+    db_var = await get_active_variable(db, variable_id)
     
     if not db_var:
         raise HTTPException(
@@ -220,15 +899,6 @@ def update_variable(
             detail=f"Variable with id {variable_id} not found"
         )
     
-    # Sprawdź unikalność nazwy (jeśli zmieniana)
-    if var_update.name is not None and var_update.name != db_var.name:
-        existing = db.query(Variable).filter(Variable.name == var_update.name).first()
-        if existing:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=f"Variable with name '{var_update.name}' already exists"
-            )
-    
     # Sprawdź czy parent_variable_id istnieje (jeśli podane)
     if var_update.parent_variable_id is not None:
         # Zapobiegaj cyklowi (nie można być własnym przodkiem)
@@ -237,11 +907,14 @@ def update_variable(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="Variable cannot be its own parent"
             )
+        if variable_id in await db.run_sync(ancestor_ids, var_update.parent_variable_id):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Variable {variable_id} is an ancestor of {var_update.parent_variable_id}; "
+                       "setting it as parent would create a cycle"
+            )
         
-        parent = db.query(Variable).filter(
-            Variable.id == var_update.parent_variable_id,
-            Variable.is_active == True
-        ).first()
+        parent = await get_active_variable(db, var_update.parent_variable_id)
         if not parent:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -260,19 +933,21 @@ def update_variable(
     
     # Aktualizuj pola
     update_data = var_update.model_dump(exclude_unset=True)
+    changed = [field for field, value in update_data.items() if getattr(db_var, field) != value]
     for field, value in update_data.items():
         setattr(db_var, field, value)
     
-    db.commit()
-    db.refresh(db_var)
+    await commit_or_409(db, db_var.name)
+    await db.refresh(db_var)
+    bump(db, VARIABLES, changes=[Change(VARIABLES, "update", db_var.id, row_values(db_var), fields=changed)])
     return db_var
 
 
 @router.delete("/{variable_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_variable(
+async def delete_variable(
     variable_id: int,
     hard_delete: bool = Query(False, description="Permanently delete instead of soft delete"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Usuwa zmienną (soft delete lub hard delete).
@@ -280,7 +955,7 @@ def delete_variable(
     Soft delete ustawia is_active=False.
     Hard delete całkowicie usuwa rekord z bazy.
     """
-    db_var = db.query(Variable).filter(Variable.id == variable_id).first()
+    db_var = await db.get(Variable, variable_id)
     
     if not db_var:
         raise HTTPException(
@@ -289,26 +964,29 @@ def delete_variable(
         )
     
     if hard_delete:
-        db.delete(db_var)
+        await db.delete(db_var)
+        change = Change(VARIABLES, "purge", variable_id)
+        # Hard delete kasuje też relacje zmiennej (ON DELETE CASCADE)
+        tables = (VARIABLES, RELATIONSHIPS)
     else:
         db_var.is_active = False
+        change = Change(VARIABLES, "delete", variable_id, row_values(db_var), fields=["is_active"])
+        tables = (VARIABLES,)
     
-    db.commit()
+    await db.commit()
+    bump(db, *tables, changes=[change])
     return None
 
 
 @router.post("/{variable_id}/restore", response_model=VariableRead)
-def restore_variable(
+async def restore_variable(
     variable_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Przywraca usuniętą zmienną (soft restore).
     """
-    db_var = db.query(Variable).filter(
-        Variable.id == variable_id,
-        Variable.is_active == False
-    ).first()
+    db_var = await db.scalar(select(Variable).where(Variable.id == variable_id, Variable.is_active == False))
     
     if not db_var:
         raise HTTPException(
@@ -317,24 +995,22 @@ def restore_variable(
         )
     
     db_var.is_active = True
-    db.commit()
-    db.refresh(db_var)
+    await commit_or_409(db, db_var.name)
+    await db.refresh(db_var)
+    bump(db, VARIABLES, changes=[Change(VARIABLES, "restore", db_var.id, row_values(db_var), fields=["is_active"])])
     return db_var
 
 
 @router.get("/{variable_id}/children", response_model=List[VariableRead])
-def get_variable_children(
+async def get_variable_children(
     variable_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Pobiera wszystkie bezpośrednie dzieci zmiennej (zmienne podrzędne).
     """
     # Sprawdź czy zmienna istnieje
-    db_var = db.query(Variable).filter(
-        Variable.id == variable_id,
-        Variable.is_active == True
-    ).first()
+    db_var = await get_active_variable(db, variable_id)
     
     if not db_var:
         raise HTTPException(
@@ -342,9 +1018,9 @@ def get_variable_children(
             detail=f"Variable with id {variable_id} not found"
         )
     
-    children = db.query(Variable).filter(
+    children = (await db.scalars(select(Variable).where(
         Variable.parent_variable_id == variable_id,
         Variable.is_active == True
-    ).all()
+    ))).all()
     
     return children
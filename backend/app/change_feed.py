@@ -0,0 +1,155 @@
+"""In-process feed of committed variable/relationship changes.
+
+Every version bump (see versions.py) is turned into compact events
+{version, entity, op, id, fields, values} and appended to a bounded ring
+buffer per database. Clients read the feed from a cursor ("<boot>-<version>")
+and resume after a reconnect; when the cursor is older than the buffer, or
+comes from a previous process, they get a reset and must reload.
+
+Bulk writes carry no row-level changes and produce one "bulk" event per
+table, which also means "reload this table".
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .versions import BOOT_ID, BindState, Change, add_listener, state_for
+
+
+FEED_SIZE = 10000
+
+_CACHE_KEY = "change_feed"
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def make_cursor(version: int) -> str:
+    return f"{BOOT_ID}-{version}"
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Version of a cursor issued by this process (None = unknown, the client must reset)."""
+    if not cursor:
+        return None
+    boot, _, version = cursor.rpartition("-")
+    if boot != BOOT_ID or not version.isdigit():
+        return None
+    return int(version)
+
+
+def change_event(version: int, change: Change) -> Dict[str, Any]:
+    values = change.values
+    if values is not None and change.op in ("update", "delete", "restore") and change.fields is not None:
+        keep = set(change.fields) | {"updated_at"}
+        values = {k: v for k, v in values.items() if k in keep}
+    if change.op == "purge":
+        values = None
+    return {
+        "version": version,
+        "entity": change.table,
+        "op": change.op,
+        "id": change.id,
+        "fields": change.fields,
+        "values": None if values is None else {k: _plain(v) for k, v in values.items()},
+    }
+
+
+class ChangeFeed:
+    """Ring buffer of change events of one database, with async wake-ups for streams."""
+
+    def __init__(self, version: int, size: int = FEED_SIZE) -> None:
+        self.lock = threading.Lock()
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.version = version
+        # changes up to this version are (at least partly) no longer in the buffer
+        self.dropped_through = version
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def append(self, version: int, events: Sequence[Dict[str, Any]]) -> None:
+        with self.lock:
+            for event in events:
+                if len(self.events) == self.events.maxlen:
+                    self.dropped_through = max(self.dropped_through, self.events[0]["version"])
+                self.events.append(event)
+            self.version = version
+            waiters = list(self._waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    def read(self, since: Optional[int], limit: int) -> Tuple[bool, List[Dict[str, Any]], int]:
+        """(reset, events newer than `since`, version to resume from).
+
+        At most `limit` events, but never a partial version: all events of one
+        bump are returned together.
+        """
+        with self.lock:
+            if since is None or since < self.dropped_through or since > self.version:
+                return True, [], self.version
+            newer: List[Dict[str, Any]] = []
+            for event in reversed(self.events):
+                if event["version"] <= since:
+                    break
+                newer.append(event)
+            newer.reverse()
+            if len(newer) <= limit:
+                return False, newer, self.version
+            end = limit
+            while end < len(newer) and newer[end]["version"] == newer[end - 1]["version"]:
+                end += 1
+            return False, newer[:end], newer[end - 1]["version"]
+
+    def subscribe(self) -> asyncio.Event:
+        waiter = asyncio.Event()
+        with self.lock:
+            self._waiters.append((asyncio.get_running_loop(), waiter))
+        return waiter
+
+    def unsubscribe(self, waiter: asyncio.Event) -> None:
+        with self.lock:
+            self._waiters = [(loop, w) for loop, w in self._waiters if w is not waiter]
+
+
+def _feed_for_state(state: BindState) -> ChangeFeed:
+    with state.lock:
+        feed = state.cache.get(_CACHE_KEY)
+        if feed is None:
+            feed = state.cache[_CACHE_KEY] = ChangeFeed(state.counter)
+        return feed
+
+
+def get_change_feed(db: Session) -> ChangeFeed:
+    return _feed_for_state(state_for(db))
+
+
+def _on_change(
+    state: BindState,
+    previous: int,
+    version: int,
+    tables: Tuple[str, ...],
+    changes: Optional[Sequence[Change]],
+) -> None:
+    feed = state.cache.get(_CACHE_KEY)
+    if feed is None:
+        feed = state.cache[_CACHE_KEY] = ChangeFeed(previous)
+    if changes is None:
+        events = [{"version": version, "entity": t, "op": "bulk", "id": None, "fields": None, "values": None}
+                  for t in tables]
+    else:
+        events = [change_event(version, ch) for ch in changes]
+    feed.append(version, events)
+
+
+add_listener(_on_change)
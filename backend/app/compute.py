@@ -0,0 +1,232 @@
+"""Process pool and admission control for CPU-bound experiment work.
+
+DOE sampling and random-search scoring run in a shared process pool
+(COMPUTE_WORKERS processes, see settings.py), so they neither hold the GIL
+of the API process nor delay cheap requests served by the same worker.
+Each endpoint has a Limiter: at most `max_concurrent` computations run and
+at most `max_queue` wait for a slot; anything beyond is rejected at once
+with Saturated (-> 429 + Retry-After) instead of piling up in the request
+threadpool. Waiting requests block their threadpool thread, so the number
+of threads the experiment endpoints can hold is bounded by the limits.
+
+A worker that dies (e.g. killed for memory on a huge request) breaks the
+whole ProcessPoolExecutor. The broken pool is replaced and the computation
+retried once on the new one; a second loss raises WorkerLost (-> 503).
+run_limited() is what the routers call: it maps both to HTTPException.
+
+Timings are split into queue wait (admission to start of the computation,
+including time queued in the pool) and compute time (inside the worker),
+kept per endpoint for /experiments/metrics and the Server-Timing header.
+"""
+from __future__ import annotations
+
+import math
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, Response, status
+
+from .settings import compute_settings
+
+
+# timings kept per endpoint for percentiles
+TIMING_WINDOW = 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class Saturated(Exception):
+    """Both the running slots and the queue of an endpoint are full."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+class WorkerLost(Exception):
+    """The worker process running the computation died, also on the retry."""
+
+
+@dataclass
+class Timing:
+    queue_wait: float
+    compute: float
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (milliseconds)."""
+        return f"queue;dur={self.queue_wait * 1000:.1f}, compute;dur={self.compute * 1000:.1f}"
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared process pool, created on first use; None when COMPUTE_WORKERS=0.
+
+    Lives as long as the process (concurrent.futures shuts it down at exit).
+    """
+    global _pool
+    if compute_settings.workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs server threads is not safe
+            _pool = ProcessPoolExecutor(compute_settings.workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(broken: ProcessPoolExecutor) -> None:
+    """Forget `broken` so get_pool() starts a new pool (no-op when it was already replaced)."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[float, float, Any]:
+    pool = get_pool()
+    if pool is None:
+        return _timed(fn, args)
+    for attempt in (1, 2):
+        try:
+            return pool.submit(_timed, fn, args).result()
+        except BrokenProcessPool:
+            # another request's crash breaks our future too: one retry on a fresh pool
+            _discard_pool(pool)
+            if attempt == 2:
+                raise WorkerLost("compute worker died") from None
+            pool = get_pool()
+    raise AssertionError("unreachable")
+
+
+def _timed(fn: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[float, float, Any]:
+    # runs in the worker: (wall clock at start, compute seconds, result)
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return started, time.perf_counter() - t0, result
+
+
+class Limiter:
+    """Concurrency limit + bounded queue of one endpoint, with timing stats."""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int) -> None:
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self._queue_wait: Deque[float] = deque(maxlen=TIMING_WINDOW)
+        self._compute: Deque[float] = deque(maxlen=TIMING_WINDOW)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queued work / slots x mean compute time."""
+        mean = float(np.mean(self._compute)) if self._compute else 1.0
+        return max(1, math.ceil(mean * (self.running + self.waiting) / self.max_concurrent))
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Tuple[Any, Timing]:
+        """fn(*args) in the process pool (or inline without one) once a slot is free.
+
+        `fn` and `args` must be picklable. Raises Saturated when the queue is full and
+        WorkerLost when the worker process died twice.
+        """
+        admitted_at = time.time()
+        with self._cond:
+            if self.running + self.waiting >= self.max_concurrent + self.max_queue:
+                self.rejected += 1
+                raise Saturated(self.retry_after())
+            self.admitted += 1
+            self.waiting += 1
+            try:
+                while self.running >= self.max_concurrent:
+                    self._cond.wait()
+            finally:
+                self.waiting -= 1
+            self.running += 1
+        try:
+            started, compute, result = _run(fn, args)
+        except BaseException:
+            with self._cond:
+                self.failed += 1
+            raise
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._cond.notify()
+        timing = Timing(queue_wait=max(0.0, started - admitted_at), compute=compute)
+        with self._cond:
+            self._queue_wait.append(timing.queue_wait)
+            self._compute.append(timing.compute)
+        return result, timing
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queue_wait, compute = list(self._queue_wait), list(self._compute)
+            counters = {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "failed": self.failed,
+            }
+        return {**counters, "queue_wait_ms": _summary(queue_wait), "compute_ms": _summary(compute)}
+
+
+def _summary(values: list) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000
+    p50, p95 = np.percentile(ms, [50, 95])
+    return {"count": int(ms.size), "mean": float(ms.mean()), "p50": float(p50), "p95": float(p95), "max": float(ms.max())}
+
+
+_limiters: Dict[str, Limiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(name: str) -> Limiter:
+    """The limiter of endpoint `name`, sized from COMPUTE_MAX_CONCURRENT / COMPUTE_MAX_QUEUE."""
+    with _limiters_lock:
+        found = _limiters.get(name)
+        if found is None:
+            found = _limiters[name] = Limiter(name, compute_settings.max_concurrent, compute_settings.max_queue)
+        return found
+
+
+def run_limited(endpoint: str, response: Response, fn: Callable[..., Any], *args: Any) -> Any:
+    """fn(*args) in the compute pool under the endpoint's limiter.
+
+    Full queue -> 429 + Retry-After; worker process died (twice) -> 503.
+    """
+    try:
+        result, timing = limiter(endpoint).run(fn, *args)
+    except Saturated as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"reason": f"too many concurrent {endpoint} requests", "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except WorkerLost:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"reason": f"the {endpoint} computation was aborted (worker process died); try a smaller request"},
+        )
+    response.headers["Server-Timing"] = timing.server_timing()
+    return result
+
+def metrics() -> Dict[str, Any]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {"workers": compute_settings.workers, "endpoints": {lim.name: lim.stats() for lim in limiters}}
@@ -1,3 +1,19 @@
+from sqlalchemy import Table
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
+
+
+def is_unique_violation(exc: IntegrityError, table: Table, index_name: str) -> bool:
+    """True when `exc` comes from the unique index `index_name` of `table`.
+
+    PostgreSQL reports the constraint name; SQLite only the indexed columns.
+    """
+    diag = getattr(exc.orig, "diag", None)
+    constraint = getattr(diag, "constraint_name", None)
+    if constraint:
+        return constraint == index_name
+    index = next(i for i in table.indexes if i.name == index_name)
+    columns = ", ".join(f"{table.name}.{c.name}" for c in index.columns)
+    return f"UNIQUE constraint failed: {columns}" in str(exc.orig)
@@ -1,9 +1,46 @@
-from .database import SessionLocal
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from . import database
+from .settings import database_settings
+from .versions import written_within
 
 
 def get_db():
-    db = SessionLocal()
+    db = database.SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """AsyncSession on the primary database (async endpoints)."""
+    async with database.async_sessionmaker_for()() as db:
+        yield db
+
+
+def get_read_db(db: Session = Depends(get_db)):
+    """Session for read-only endpoints: the read replica when configured.
+
+    Reads stay on the primary for DB_READ_AFTER_WRITE_SECONDS after this process
+    committed a write, so a client sees its own changes despite replication lag.
+    The primary session is only created, not connected, when the replica is used.
+    """
+    if database.ReadSessionLocal is None or written_within(db, database_settings.read_after_write_seconds):
+        yield db
+        return
+    replica = database.ReadSessionLocal()
+    try:
+        yield replica
+    finally:
+        replica.close()
+
+
+async def get_async_read_db(db=Depends(get_async_db)):
+    """Async counterpart of get_read_db."""
+    if database.ReadSessionLocal is None or written_within(db, database_settings.read_after_write_seconds):
+        yield db
+        return
+    async with database.async_sessionmaker_for(read=True)() as replica:
+        yield replica
@@ -0,0 +1,85 @@
+"""CPU-bound parts of the DOE and optimize endpoints.
+
+Plain functions of picklable arguments, executed in the compute process
+pool (compute.py). Results are identical to computing in the request: same
+samplers, seeds and floating point operations, so stored seeded runs stay
+reusable.
+"""
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+Bounds = Sequence[Tuple[float, float]]
+
+
+def doe_points(method: str, bounds: Bounds, n_points: int, seed: Optional[int]) -> np.ndarray:
+    """n_points x len(bounds) matrix of Sobol / Latin hypercube points scaled to `bounds`."""
+    from scipy.stats import qmc
+
+    d = len(bounds)
+    if method == "sobol":
+        # SciPy Sobol supports arbitrary n via .random()
+        sampler = qmc.Sobol(d=d, scramble=True, seed=seed)
+    elif method == "lhs":
+        sampler = qmc.LatinHypercube(d=d, seed=seed)
+    else:
+        raise ValueError(f"Unknown DOE method {method!r}")
+    unit = sampler.random(n=n_points)
+    lo = np.array([b[0] for b in bounds], dtype=float)
+    hi = np.array([b[1] for b in bounds], dtype=float)
+    return lo + (hi - lo) * unit
+
+
+def point_rows(keys: Sequence[str], values: np.ndarray) -> List[Dict[str, float]]:
+    """Matrix rows as {key: value} dicts (the stored / default response layout)."""
+    return [dict(zip(keys, row)) for row in values.tolist()]
+
+
+def random_search(
+    keys: Sequence[str],
+    bounds: Bounds,
+    n_iter: int,
+    seed: Optional[int],
+    objective: Any,
+    initial_points: Sequence[Dict[str, float]],
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], float]:
+    """(history, best point, best score): initial points first, then `n_iter` uniform random points.
+
+    `initial_points` must already be validated against `bounds`.
+    """
+    from .api.objectives import ObjectiveKind, score_point as score_by_objective
+
+    bounds_by_key = dict(zip(keys, bounds))
+
+    def score_point(p: Dict[str, Any]) -> float:
+        if objective.kind == ObjectiveKind.linear and objective.normalize == "domain":
+            # normalize x to [0,1] using the strict domain bounds
+            p_norm: Dict[str, Any] = dict(p)
+            for t in objective.terms:
+                key = str(t.variable_id)
+                lo, hi = bounds_by_key[key]
+                # hi==lo shouldn't happen due to safe domain, but avoid div-by-zero
+                p_norm[key] = 0.0 if hi == lo else (float(p[key]) - lo) / (hi - lo)
+            return float(score_by_objective(p_norm, objective))
+        return float(score_by_objective(p, objective))
+
+    rng = random.Random(seed)
+    history: List[Dict[str, Any]] = []
+    best_score = float("-inf")
+    best_point: Dict[str, Any] = {}
+    for p in initial_points:
+        history.append(p)
+        s = score_point(p)
+        if s > best_score:
+            best_score, best_point = s, p
+    for _ in range(n_iter):
+        p = {key: (lo + (hi - lo) * rng.random()) for key, (lo, hi) in zip(keys, bounds)}
+        history.append(p)
+        s = score_point(p)
+        if s > best_score:
+            best_score, best_point = s, p
+    return history, best_point, best_score
@@ -0,0 +1,667 @@
+"""In-process adjacency index of the active relationship graph.
+
+Edges are stored in slot-indexed attribute arrays (source/target node, type,
+direction, shape, confidence, alive flag) with CSR offsets for outgoing and
+incoming edges. The index is built lazily from the database, tagged with the
+graph version (see versions.py) and updated in place by a version listener
+for single-row writes; edges added since the last compaction live in small
+per-node overflow lists until the next compaction. Bulk writes (no row-level
+changes) leave the index stale, and it is rebuilt on the next access.
+
+For causal edge types (CAUSAL_TYPES) the index also keeps a topological order
+of the active variables, maintained with the Pearce-Kelly algorithm: adding an
+edge x -> y only reorders the variables between y and x in the current order,
+so checking an insert for cycles touches just that region. Once the graph is
+cyclic (edges added without enforcement) the order is dropped and checks fall
+back to a reachability search until removals make a fresh order possible.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import ChainMap
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, MutableMapping, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models.relationship import Relationship, RelationshipDirection, RelationshipShape, RelationshipType
+from .models.variable import Variable
+from .versions import (
+    GRAPH_TABLES,
+    RELATIONSHIPS,
+    VARIABLES,
+    BindState,
+    Change,
+    add_listener,
+    current_version,
+    primary_session,
+    state_for,
+    sync_session,
+)
+
+
+RELATIONSHIP_TYPES = list(RelationshipType)
+DIRECTIONS = list(RelationshipDirection)
+SHAPES = list(RelationshipShape)
+_TYPE_CODE = {e: i for i, e in enumerate(RELATIONSHIP_TYPES)}
+_DIRECTION_CODE = {e: i for i, e in enumerate(DIRECTIONS)}
+_SHAPE_CODE = {e: i for i, e in enumerate(SHAPES)}
+
+# directed relationship types that must not form cycles when enforcement is requested
+CAUSAL_TYPES = (RelationshipType.DRIVES, RelationshipType.INFLUENCES)
+_CAUSAL = np.zeros(len(RELATIONSHIP_TYPES), dtype=bool)
+_CAUSAL[[_TYPE_CODE[t] for t in CAUSAL_TYPES]] = True
+
+# compact when overflow edges exceed max(MIN_DELTA, DELTA_RATIO * edges)
+MIN_DELTA = 256
+DELTA_RATIO = 0.1
+
+# how often an async writer retries the acyclic guard held by another writer
+GUARD_POLL_SECONDS = 0.005
+
+_CACHE_KEY = "graph_index"
+_BUILD_LOCK_KEY = "graph_index_build_lock"
+_GUARD_KEY = "graph_acyclic_guard"
+
+
+class GraphIndex:
+    """CSR adjacency + edge attribute arrays for active relationships."""
+
+    def __init__(self, version: int, active_variable_ids: Iterable[int], records: Sequence[Dict[str, Any]]) -> None:
+        self.lock = threading.RLock()
+        self.version = version
+        self.active_variables = set(active_variable_ids)
+
+        self.node_ids: List[int] = []
+        self.node_of: Dict[int, int] = {}
+
+        self.records: Dict[int, Dict[str, Any]] = {}
+        self.slot_of: Dict[int, int] = {}
+        self.m = 0
+
+        # topological position of variables over causal edges; None = cyclic (or not computed yet)
+        self._order: Optional[Dict[int, int]] = None
+        self._order_stale = True
+        self._next_pos = 0
+        self._alloc(max(16, len(records)))
+        for rec in records:
+            self._append(rec)
+        self._compact()
+
+    # ---------- storage ----------
+
+    def _alloc(self, capacity: int) -> None:
+        self.edge_id = np.zeros(capacity, dtype=np.int64)
+        self.src = np.zeros(capacity, dtype=np.int64)
+        self.dst = np.zeros(capacity, dtype=np.int64)
+        self.rtype = np.zeros(capacity, dtype=np.int8)
+        self.direction = np.zeros(capacity, dtype=np.int8)
+        self.shape = np.zeros(capacity, dtype=np.int8)
+        self.confidence = np.zeros(capacity, dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        capacity = max(16, 2 * self.edge_id.size)
+        for name in ("edge_id", "src", "dst", "rtype", "direction", "shape", "confidence", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: old.size] = old
+            setattr(self, name, new)
+
+    def _node(self, variable_id: int) -> int:
+        node = self.node_of.get(variable_id)
+        if node is None:
+            node = len(self.node_ids)
+            self.node_ids.append(variable_id)
+            self.node_of[variable_id] = node
+        return node
+
+    def _set_attrs(self, slot: int, rec: Dict[str, Any]) -> None:
+        self.rtype[slot] = _TYPE_CODE[RelationshipType(rec["relationship_type"])]
+        self.direction[slot] = _DIRECTION_CODE[RelationshipDirection(rec["direction"])]
+        self.shape[slot] = _SHAPE_CODE[RelationshipShape(rec["shape"])]
+        self.confidence[slot] = float(rec["confidence"])
+
+    def _append(self, rec: Dict[str, Any]) -> int:
+        if self.m == self.edge_id.size:
+            self._grow()
+        slot = self.m
+        self.m += 1
+        self.edge_id[slot] = rec["id"]
+        self.src[slot] = self._node(rec["source_variable_id"])
+        self.dst[slot] = self._node(rec["target_variable_id"])
+        self._set_attrs(slot, rec)
+        self.alive[slot] = True
+        self.slot_of[rec["id"]] = slot
+        self.records[rec["id"]] = dict(rec)
+        return slot
+
+    def _compact(self) -> None:
+        """Drop dead slots and rebuild the CSR offsets (no database access)."""
+        keep = np.flatnonzero(self.alive[: self.m])
+        if keep.size != self.m:
+            for name in ("edge_id", "src", "dst", "rtype", "direction", "shape", "confidence", "alive"):
+                arr = getattr(self, name)
+                new = np.zeros(max(16, keep.size * 2), dtype=arr.dtype)
+                new[: keep.size] = arr[keep]
+                setattr(self, name, new)
+            self.m = keep.size
+            self.slot_of = {int(eid): slot for slot, eid in enumerate(self.edge_id[: self.m])}
+
+        n = len(self.node_ids)
+        src, dst = self.src[: self.m], self.dst[: self.m]
+        self.out_slots = np.argsort(src, kind="stable")
+        self.in_slots = np.argsort(dst, kind="stable")
+        self.out_ptr = np.zeros(n + 1, dtype=np.int64)
+        self.in_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.out_ptr[1:])
+        np.cumsum(np.bincount(dst, minlength=n), out=self.in_ptr[1:])
+        self._base_nodes = n
+        self._base_edges = self.m
+        self._extra_out: Dict[int, List[int]] = {}
+        self._extra_in: Dict[int, List[int]] = {}
+
+    # ---------- incremental updates ----------
+
+    def _kill(self, slot: int) -> None:
+        self.alive[slot] = False
+        self.records.pop(int(self.edge_id[slot]), None)
+        if _CAUSAL[self.rtype[slot]]:
+            self._causal_removed()
+
+    def apply_relationship(self, rec: Dict[str, Any]) -> None:
+        rel_id = rec["id"]
+        slot = self.slot_of.get(rel_id)
+        if slot is not None and not self.alive[slot]:
+            slot = None
+
+        if not rec.get("is_active", True):
+            if slot is not None:
+                self._kill(slot)
+            return
+
+        if slot is not None:
+            same_ends = (
+                self.node_ids[self.src[slot]] == rec["source_variable_id"]
+                and self.node_ids[self.dst[slot]] == rec["target_variable_id"]
+            )
+            if same_ends:
+                was_causal = _CAUSAL[self.rtype[slot]]
+                self._set_attrs(slot, rec)
+                self.records[rel_id] = dict(rec)
+                if _CAUSAL[self.rtype[slot]] and not was_causal:
+                    self._causal_added(rec["source_variable_id"], rec["target_variable_id"])
+                elif was_causal and not _CAUSAL[self.rtype[slot]]:
+                    self._causal_removed()
+                return
+            self._kill(slot)
+
+        slot = self._append(rec)
+        self._extra_out.setdefault(int(self.src[slot]), []).append(slot)
+        self._extra_in.setdefault(int(self.dst[slot]), []).append(slot)
+        if _CAUSAL[self.rtype[slot]]:
+            self._causal_added(rec["source_variable_id"], rec["target_variable_id"])
+        if self.m - self._base_edges > max(MIN_DELTA, DELTA_RATIO * self._base_edges):
+            self._compact()
+
+    def remove_relationship(self, rel_id: int) -> None:
+        slot = self.slot_of.get(rel_id)
+        if slot is not None and self.alive[slot]:
+            self._kill(slot)
+
+    def apply_variable(self, variable_id: int, is_active: bool) -> None:
+        if is_active:
+            if variable_id not in self.active_variables:
+                # its edges come back into the causal graph at once
+                self._order_stale = True
+            self.active_variables.add(variable_id)
+        else:
+            self.active_variables.discard(variable_id)
+            self._causal_removed()
+
+    def purge_variable(self, variable_id: int) -> None:
+        """Hard delete: the database cascades to the variable's relationships."""
+        self.active_variables.discard(variable_id)
+        node = self.node_of.get(variable_id)
+        if node is None:
+            return
+        for slot in np.concatenate([self._slots(node, out=True), self._slots(node, out=False)]):
+            self._kill(int(slot))
+
+    # ---------- queries ----------
+
+    def _slots(self, node: int, out: bool) -> np.ndarray:
+        ptr, slots, extra = (
+            (self.out_ptr, self.out_slots, self._extra_out) if out else (self.in_ptr, self.in_slots, self._extra_in)
+        )
+        base = slots[ptr[node]:ptr[node + 1]] if node < self._base_nodes else slots[:0]
+        more = extra.get(node)
+        if more:
+            base = np.concatenate([base, np.asarray(more, dtype=np.int64)])
+        return base[self.alive[base]]
+
+    def edge_slots(self, variable_id: int, out: bool) -> np.ndarray:
+        """Live edge slots of a variable. Slots are renumbered by _compact(): resolve them
+        (relationship_records) under the same hold of `lock`."""
+        with self.lock:
+            node = self.node_of.get(variable_id)
+            if node is None:
+                return np.empty(0, dtype=np.int64)
+            return self._slots(node, out)
+
+    def is_active_variable(self, variable_id: int) -> bool:
+        return variable_id in self.active_variables
+
+    def relationship_records(self, slots: Iterable[int]) -> List[Dict[str, Any]]:
+        """RelationshipRead-compatible rows for edge slots, ordered by relationship id."""
+        with self.lock:
+            ids = sorted({int(self.edge_id[s]) for s in slots})
+            return [self.records[i] for i in ids if i in self.records]
+
+    def records_by_id(self, relationship_ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """RelationshipRead-compatible rows in the given order (ids no longer indexed are skipped)."""
+        with self.lock:
+            return [self.records[i] for i in relationship_ids if i in self.records]
+
+    # slots and their records are read under one hold of the (reentrant) lock
+    def outgoing(self, variable_id: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            return self.relationship_records(self.edge_slots(variable_id, out=True))
+
+    def incoming(self, variable_id: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            return self.relationship_records(self.edge_slots(variable_id, out=False))
+
+    def incident(self, variable_id: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            slots = np.concatenate([self.edge_slots(variable_id, out=True), self.edge_slots(variable_id, out=False)])
+            return self.relationship_records(slots)
+
+    def type_mask(self, relationship_types: Optional[Iterable[Any]]) -> Optional[np.ndarray]:
+        """Boolean mask over type codes (None = all types)."""
+        if not relationship_types:
+            return None
+        mask = np.zeros(len(RELATIONSHIP_TYPES), dtype=bool)
+        for t in relationship_types:
+            mask[_TYPE_CODE[RelationshipType(t)]] = True
+        return mask
+
+    def traverse(
+        self,
+        variable_id: int,
+        upstream: bool,
+        max_depth: int,
+        relationship_types: Optional[Iterable[Any]] = None,
+    ) -> Tuple[Dict[int, int], List[int]]:
+        """Level-synchronous BFS from `variable_id` against (upstream) or along edge direction.
+
+        Returns ({variable_id: hops}, edge slots between reached variables). Inactive
+        variables are neither reported nor expanded.
+        """
+        mask = self.type_mask(relationship_types)
+        with self.lock:
+            root = self.node_of.get(variable_id)
+            depth: Dict[int, int] = {variable_id: 0}
+            if root is None:
+                return depth, []
+            far = self.src if upstream else self.dst
+            edges: List[np.ndarray] = []
+            frontier = [root]
+            for level in range(1, max_depth + 1):
+                if not frontier:
+                    break
+                parts = [self._slots(n, out=not upstream) for n in frontier]
+                slots = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+                if mask is not None:
+                    slots = slots[mask[self.rtype[slots]]]
+                next_frontier: List[int] = []
+                kept: List[int] = []
+                for slot, node in zip(slots.tolist(), far[slots].tolist()):
+                    vid = self.node_ids[node]
+                    if vid not in self.active_variables:
+                        continue
+                    kept.append(slot)
+                    if vid not in depth:
+                        depth[vid] = level
+                        next_frontier.append(node)
+                edges.append(np.asarray(kept, dtype=np.int64))
+                frontier = next_frontier
+            all_edges = np.unique(np.concatenate(edges)) if edges else np.empty(0, dtype=np.int64)
+            return depth, all_edges.tolist()
+
+    # ---------- causal order (Pearce-Kelly) ----------
+
+    def _causal_added(self, source_id: int, target_id: int) -> None:
+        if self._order_stale or self._order is None:
+            return  # recomputed lazily / already cyclic
+        if source_id not in self.active_variables or target_id not in self.active_variables:
+            return
+        if self._insert_order(self._order, source_id, target_id) is not None:
+            self._order = None
+
+    def _causal_removed(self) -> None:
+        # removals keep an order valid, but may make a cyclic graph acyclic again
+        if self._order is None:
+            self._order_stale = True
+
+    def _causal_slots(self) -> np.ndarray:
+        """Live causal edge slots whose both ends are active variables."""
+        return self._active_slots(_CAUSAL)
+
+    def _active_slots(self, type_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        alive = self.alive[: self.m]
+        if type_mask is not None:
+            alive = alive & type_mask[self.rtype[: self.m]]
+        slots = np.flatnonzero(alive)
+        active = np.fromiter(
+            (v in self.active_variables for v in self.node_ids), dtype=bool, count=len(self.node_ids)
+        )
+        return slots[active[self.src[slots]] & active[self.dst[slots]]] if slots.size else slots
+
+    def _causal_neighbors(self, variable_id: int, out: bool) -> List[int]:
+        node = self.node_of.get(variable_id)
+        if node is None:
+            return []
+        slots = self._slots(node, out)
+        far = (self.dst if out else self.src)[slots[_CAUSAL[self.rtype[slots]]]]
+        return [v for v in (self.node_ids[n] for n in far.tolist()) if v in self.active_variables]
+
+    def _topological_order(self) -> Optional[Dict[int, int]]:
+        """Kahn's algorithm over the causal subgraph; None when it has a cycle."""
+        n = len(self.node_ids)
+        slots = self._causal_slots()
+        src, dst = self.src[slots], self.dst[slots]
+        by_src = np.argsort(src, kind="stable")
+        targets = dst[by_src]
+        ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+        indeg = np.bincount(dst, minlength=n)
+
+        active_nodes = [i for i, v in enumerate(self.node_ids) if v in self.active_variables]
+        ready = [i for i in active_nodes if indeg[i] == 0]
+        order: Dict[int, int] = {}
+        while ready:
+            u = ready.pop()
+            order[self.node_ids[u]] = len(order)
+            for w in targets[ptr[u]:ptr[u + 1]].tolist():
+                indeg[w] -= 1
+                if indeg[w] == 0:
+                    ready.append(w)
+        return order if len(order) == len(active_nodes) else None
+
+    def _ensure_order(self) -> Optional[Dict[int, int]]:
+        if self._order_stale:
+            self._order = self._topological_order()
+            self._order_stale = False
+            self._next_pos = len(self._order) if self._order is not None else 0
+        return self._order
+
+    def _pos(self, order: MutableMapping[int, int], variable_id: int) -> int:
+        pos = order.get(variable_id)
+        if pos is None:
+            # variables without causal edges can go anywhere; append them
+            pos = order[variable_id] = self._next_pos
+            self._next_pos += 1
+        return pos
+
+    def _find_path(
+        self,
+        start: int,
+        goal: int,
+        succ: Callable[[int], List[int]],
+        keep: Callable[[int], bool],
+    ) -> Tuple[Optional[List[int]], List[int]]:
+        """DFS from `start` over variables accepted by `keep`; (path to goal or None, visited)."""
+        parent: Dict[int, Optional[int]] = {start: None}
+        stack = [start]
+        while stack:
+            v = stack.pop()
+            for w in succ(v):
+                if w == goal:
+                    path = [goal, v]
+                    while parent[path[-1]] is not None:
+                        path.append(parent[path[-1]])
+                    return path[::-1], list(parent)
+                if w not in parent and keep(w):
+                    parent[w] = v
+                    stack.append(w)
+        return None, list(parent)
+
+    def _insert_order(
+        self,
+        order: MutableMapping[int, int],
+        x: int,
+        y: int,
+        extra_out: Optional[Dict[int, List[int]]] = None,
+        extra_in: Optional[Dict[int, List[int]]] = None,
+    ) -> Optional[List[int]]:
+        """Pearce-Kelly insert of x -> y into `order`; returns the cycle [x, y, ..., x] instead when it closes one.
+
+        Only variables positioned between y and x are visited and reordered.
+        """
+        extra_out = extra_out or {}
+        extra_in = extra_in or {}
+        lb, ub = self._pos(order, y), self._pos(order, x)
+        if ub < lb:
+            return None
+
+        def succ(v: int) -> List[int]:
+            return self._causal_neighbors(v, out=True) + extra_out.get(v, [])
+
+        def pred(v: int) -> List[int]:
+            return self._causal_neighbors(v, out=False) + extra_in.get(v, [])
+
+        path, forward = self._find_path(y, x, succ, lambda w: self._pos(order, w) < ub)
+        if path is not None:
+            return [x] + path
+        _, backward = self._find_path(x, y, pred, lambda w: self._pos(order, w) > lb)
+
+        moved = sorted(backward, key=order.__getitem__) + sorted(forward, key=order.__getitem__)
+        for v, pos in zip(moved, sorted(order[v] for v in moved)):
+            order[v] = pos
+        return None
+
+    def check_acyclic(self, edges: Sequence[Tuple[int, int]]) -> List[Optional[List[int]]]:
+        """For each proposed causal edge (source_id, target_id), the cycle it would close (None = allowed).
+
+        Edges are checked in sequence and every allowed one counts for the ones
+        after it. The index itself is not modified (changes go to an overlay).
+        """
+        with self.lock:
+            base = self._ensure_order()
+            order = ChainMap({}, base) if base is not None else None
+            extra_out: Dict[int, List[int]] = {}
+            extra_in: Dict[int, List[int]] = {}
+            result: List[Optional[List[int]]] = []
+            for x, y in edges:
+                if order is not None:
+                    cycle = self._insert_order(order, x, y, extra_out, extra_in)
+                else:
+                    path, _ = self._find_path(
+                        y, x, lambda v: self._causal_neighbors(v, out=True) + extra_out.get(v, []), lambda w: True
+                    )
+                    cycle = None if path is None else [x] + path
+                result.append(cycle)
+                if cycle is None:
+                    extra_out.setdefault(x, []).append(y)
+                    extra_in.setdefault(y, []).append(x)
+            return result
+
+    def cyclic_components(self) -> List[Tuple[List[int], List[int]]]:
+        """Strongly connected components with more than one variable in the causal subgraph.
+
+        Linear time (scipy's csgraph SCC). Returns (variable ids, relationship ids) per component.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        with self.lock:
+            n = len(self.node_ids)
+            slots = self._causal_slots()
+            if slots.size == 0:
+                return []
+            graph = csr_matrix((np.ones(slots.size), (self.src[slots], self.dst[slots])), shape=(n, n))
+            _, labels = connected_components(graph, directed=True, connection="strong")
+            sizes = np.bincount(labels)
+
+            members: Dict[int, List[int]] = {}
+            for node in np.flatnonzero(sizes[labels] > 1).tolist():
+                members.setdefault(int(labels[node]), []).append(self.node_ids[node])
+            edges: Dict[int, List[int]] = {}
+            inner = slots[labels[self.src[slots]] == labels[self.dst[slots]]]
+            for slot in inner.tolist():
+                edges.setdefault(int(labels[self.src[slot]]), []).append(int(self.edge_id[slot]))
+
+            components = [(sorted(vs), sorted(edges.get(label, []))) for label, vs in members.items()]
+            return sorted(components, key=lambda c: c[0][0])
+
+    def active_edges(self, relationship_types: Optional[Iterable[Any]] = None) -> Dict[str, np.ndarray]:
+        """Edges between active variables as parallel arrays (variable ids, type codes, confidence)."""
+        with self.lock:
+            slots = self._active_slots(self.type_mask(relationship_types))
+            node_ids = np.asarray(self.node_ids, dtype=np.int64)
+            return {
+                "id": self.edge_id[slots].copy(),
+                "source": node_ids[self.src[slots]] if slots.size else np.empty(0, dtype=np.int64),
+                "target": node_ids[self.dst[slots]] if slots.size else np.empty(0, dtype=np.int64),
+                "relationship_type": self.rtype[slots].copy(),
+                "direction": self.direction[slots].copy(),
+                "confidence": self.confidence[slots].copy(),
+            }
+
+    @property
+    def edge_count(self) -> int:
+        return int(self.alive[: self.m].sum())
+
+
+def build_graph_index(db: Session, version: int) -> GraphIndex:
+    active = db.scalars(select(Variable.id).where(Variable.is_active == True)).all()
+    records = [
+        dict(row)
+        for row in db.execute(
+            select(Relationship.__table__).where(Relationship.is_active == True).order_by(Relationship.id)
+        ).mappings()
+    ]
+    return GraphIndex(version, active, records)
+
+
+def get_graph_index(db: Session) -> GraphIndex:
+    """Index for the current graph version (built on first use or after a bulk write).
+
+    Always built from the primary database, also when `db` reads a replica.
+    """
+    state = state_for(db)
+    version = current_version(db, *GRAPH_TABLES)
+    idx = state.cache.get(_CACHE_KEY)
+    if idx is not None and idx.version == version:
+        return idx
+
+    with state.lock:
+        build_lock = state.cache.setdefault(_BUILD_LOCK_KEY, threading.Lock())
+    with build_lock:
+        idx = state.cache.get(_CACHE_KEY)
+        version = current_version(db, *GRAPH_TABLES)
+        if idx is not None and idx.version == version:
+            return idx
+        # version is read before the queries: a concurrent write makes the new index
+        # look stale (rebuilt again), never newer than its data
+        with primary_session(db) as source:
+            idx = build_graph_index(source, version)
+        with state.lock:
+            current = state.cache.get(_CACHE_KEY)
+            if current is None or current.version <= idx.version:
+                state.cache[_CACHE_KEY] = idx
+        return idx
+
+
+@contextmanager
+def acyclic_guard(db: Session, enabled: bool = True) -> Iterator[Optional[GraphIndex]]:
+    """Serialize cycle-checked writes: the check, commit and bump run under one per-database lock.
+
+    Yields the current index (None when `enabled` is false and nothing is locked).
+    """
+    if not enabled:
+        yield None
+        return
+    with _guard(db):
+        yield get_graph_index(db)
+
+
+def _guard(db: Any) -> threading.Lock:
+    state = state_for(db)
+    with state.lock:
+        return state.cache.setdefault(_GUARD_KEY, threading.Lock())
+
+
+def _index_in_sync_session(db: Any) -> GraphIndex:
+    with sync_session(db) as session:
+        return get_graph_index(session)
+
+
+async def get_graph_index_async(db: Any) -> GraphIndex:
+    """get_graph_index for async endpoints (AsyncSession).
+
+    A current index is returned at once. A build (build lock, queries, CPU) runs in the
+    threadpool on a sync session of the same database, so it never blocks the event loop.
+    """
+    idx = state_for(db).cache.get(_CACHE_KEY)
+    if idx is not None and idx.version == current_version(db, *GRAPH_TABLES):
+        return idx
+    return await run_in_threadpool(_index_in_sync_session, db)
+
+
+@asynccontextmanager
+async def acyclic_guard_async(db: Any, enabled: bool = True) -> AsyncIterator[Optional[GraphIndex]]:
+    """acyclic_guard for async endpoints; the lock is the one sync writers take.
+
+    It is polled instead of waited on (a blocking acquire would stall the event loop),
+    so holding it across the awaits of the commit cannot deadlock other coroutines.
+    """
+    if not enabled:
+        yield None
+        return
+    guard = _guard(db)
+    while not guard.acquire(blocking=False):
+        await asyncio.sleep(GUARD_POLL_SECONDS)
+    try:
+        yield await get_graph_index_async(db)
+    finally:
+        guard.release()
+
+
+def _on_change(
+    state: BindState,
+    previous: int,
+    version: int,
+    tables: Tuple[str, ...],
+    changes: Optional[Sequence[Change]],
+) -> None:
+    idx: Optional[GraphIndex] = state.cache.get(_CACHE_KEY)
+    if idx is None or idx.version != previous:
+        return
+    if not set(tables) & set(GRAPH_TABLES):
+        idx.version = version
+        return
+    if changes is None:
+        return  # bulk write: leave stale, rebuilt lazily
+
+    with idx.lock:
+        for ch in changes:
+            if ch.table == RELATIONSHIPS:
+                if ch.op == "purge":
+                    idx.remove_relationship(ch.id)
+                else:
+                    idx.apply_relationship(ch.values or {})
+            elif ch.table == VARIABLES:
+                if ch.op == "purge":
+                    idx.purge_variable(ch.id)
+                else:
+                    idx.apply_variable(ch.id, bool((ch.values or {}).get("is_active", True)))
+        idx.version = version
+
+
+add_listener(_on_change)
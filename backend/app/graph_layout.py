@@ -0,0 +1,220 @@
+"""Layered (Sugiyama-style) layout of the active variable graph.
+
+Rows follow `layer_level` (dense-ranked, so unused levels take no space).
+The order inside each layer comes from damped barycenter sweeps: every
+sweep moves each variable towards the mean position of its neighbours
+(A @ x / degree on a scipy.sparse adjacency matrix, even and odd layers in
+turn) and then re-ranks the layer, which pulls connected variables together and
+reduces edge crossings. Wide layers wrap into several rows of `max_row`.
+
+Layouts are cached per graph version. After a small edit the previous
+order is reused as the starting point and only a couple of sweeps run, so
+the layout is cheap to update and existing nodes barely move.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .graph_index import get_graph_index
+from .models.variable import Variable
+from .versions import GRAPH_TABLES, current_version, state_for
+
+
+SWEEPS = 12
+INCREMENTAL_SWEEPS = 2
+# weight of the previous position in each sweep
+DAMPING = 0.25
+# warm start when at most this share of nodes + edges changed
+INCREMENTAL_RATIO = 0.05
+INCREMENTAL_MIN = 10
+
+_CACHE_KEY = "graph_layout"
+_BUILD_LOCK_KEY = "graph_layout_build_lock"
+
+
+@dataclass
+class LayoutState:
+    """Inputs and result of one layout (kept to update it incrementally)."""
+    version: int
+    ids: np.ndarray
+    layers: np.ndarray
+    edge_codes: np.ndarray
+    order_key: np.ndarray
+    layer: np.ndarray
+    incremental: bool
+    # serialized responses per (x_gap, y_gap, max_row)
+    bodies: Dict[Tuple[Any, ...], bytes] = field(default_factory=dict)
+
+
+def edge_codes(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Sorted unique int64 codes of undirected variable pairs (for cheap set differences)."""
+    lo, hi = np.minimum(source, target), np.maximum(source, target)
+    return np.unique((lo.astype(np.int64) << 32) | hi.astype(np.int64))
+
+
+def _centered_ranks(key: np.ndarray, layer: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Rank of each node inside its layer by `key` (ties by id), centered around 0."""
+    n = key.size
+    order = np.lexsort((ids, key, layer))
+    counts = np.bincount(layer)
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(n)
+    rank[order] = np.arange(n) - starts[layer[order]]
+    return rank - (counts[layer] - 1) / 2.0
+
+
+def _sweep(x: np.ndarray, adjacency: Any, degree: np.ndarray, layer: np.ndarray, ids: np.ndarray, sweeps: int) -> np.ndarray:
+    # even and odd layers take turns (red-black order): moving both ends of an
+    # edge at once makes neighbouring layers swap back and forth forever
+    has_neighbours = degree > 0
+    odd = (layer % 2).astype(bool)
+    for _ in range(sweeps):
+        for moving in (~odd, odd):
+            bary = np.where(has_neighbours & moving, (adjacency @ x) / np.maximum(degree, 1), x)
+            x = _centered_ranks(DAMPING * x + (1 - DAMPING) * bary, layer, ids)
+    return x
+
+
+def layered_layout(
+    ids: np.ndarray,
+    layer_levels: np.ndarray,
+    source: np.ndarray,
+    target: np.ndarray,
+    previous: Optional[LayoutState] = None,
+) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """Order key per variable inside its layer, dense layer index, and whether the previous layout was reused.
+
+    `ids` must be sorted; `source`/`target` are variable ids of edges between them.
+    """
+    from scipy.sparse import csr_matrix
+
+    n = ids.size
+    _, layer = np.unique(layer_levels, return_inverse=True)
+    if n == 0:
+        return np.empty(0), layer, False
+
+    src = np.searchsorted(ids, source)
+    dst = np.searchsorted(ids, target)
+    adjacency = csr_matrix((np.ones(src.size), (src, dst)), shape=(n, n))
+    adjacency = adjacency + adjacency.T
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+
+    changed = None if previous is None else _changed(previous, ids, layer_levels, edge_codes(source, target))
+    if changed == 0:
+        # e.g. only names or confidences were edited: keep the layout as it is
+        return previous.order_key, layer, True
+    incremental = changed is not None and changed <= max(INCREMENTAL_MIN, INCREMENTAL_RATIO * (n + source.size))
+    if incremental:
+        x = np.zeros(n)
+        pos = np.searchsorted(previous.ids, ids).clip(max=max(previous.ids.size - 1, 0))
+        known = (previous.ids.size > 0) & (previous.ids[pos] == ids) & (previous.layers[pos] == layer_levels)
+        x[known] = previous.order_key[pos[known]]
+        # new (or moved) variables start at their neighbours' mean, or at the end of the layer
+        filled = np.where(known, x, 0.0)
+        neighbour_mean = (adjacency @ filled) / np.maximum(adjacency @ known.astype(float), 1)
+        has_known_neighbour = (adjacency @ known.astype(float)) > 0
+        x = np.where(known, x, np.where(has_known_neighbour, neighbour_mean, np.inf))
+        x = _centered_ranks(x, layer, ids)
+        x = _sweep(x, adjacency, degree, layer, ids, INCREMENTAL_SWEEPS)
+    else:
+        x = _centered_ranks(ids.astype(float), layer, ids)
+        x = _sweep(x, adjacency, degree, layer, ids, SWEEPS)
+    return x, layer, incremental
+
+
+def _changed(previous: LayoutState, ids: np.ndarray, layers: np.ndarray, codes: np.ndarray) -> int:
+    """Number of variables added, removed or moved to another layer, plus edges added or removed."""
+    changed = np.setxor1d(previous.ids, ids, assume_unique=True).size
+    _, a, b = np.intersect1d(previous.ids, ids, assume_unique=True, return_indices=True)
+    changed += int(np.count_nonzero(previous.layers[a] != layers[b]))
+    return changed + np.setxor1d(previous.edge_codes, codes, assume_unique=True).size
+
+
+def positions(
+    order_key: np.ndarray,
+    layer: np.ndarray,
+    x_gap: float,
+    y_gap: float,
+    max_row: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pixel coordinates: layers stacked top-down, each wrapped into rows of at most `max_row` nodes."""
+    n = order_key.size
+    if n == 0:
+        return np.empty(0), np.empty(0)
+    counts = np.bincount(layer)
+    rank = np.rint(order_key + (counts[layer] - 1) / 2.0).astype(np.int64)
+    rows_per_layer = np.maximum(1, -(-counts // max_row))
+    row_start = np.cumsum(rows_per_layer) - rows_per_layer
+    row = row_start[layer] + rank // max_row
+    col = rank % max_row
+    # nodes in a row, to center short (last) rows
+    in_row = np.minimum(max_row, counts[layer] - (rank // max_row) * max_row)
+    width = min(int(counts.max()), max_row)
+    x = (col - (in_row - 1) / 2.0 + (width - 1) / 2.0) * x_gap
+    y = row * y_gap
+    return x, y
+
+
+def layout_payload(layout: LayoutState, x_gap: float, y_gap: float, max_row: int) -> Dict[str, Any]:
+    x, y = positions(layout.order_key, layout.layer, x_gap, y_gap, max_row)
+    return {
+        "version": layout.version,
+        "incremental": layout.incremental,
+        "width": float(x.max()) if x.size else 0.0,
+        "height": float(y.max()) if y.size else 0.0,
+        "nodes": [
+            {"id": i, "x": px, "y": py, "layer_level": lv}
+            for i, px, py, lv in zip(layout.ids.tolist(), x.tolist(), y.tolist(), layout.layers.tolist())
+        ],
+    }
+
+
+def build_layout(db: Session, version: int, previous: Optional[LayoutState]) -> LayoutState:
+    rows = db.execute(
+        select(Variable.id, Variable.layer_level).where(Variable.is_active == True).order_by(Variable.id)
+    ).all()
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    layers = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    edges = get_graph_index(db).active_edges()
+    # edges of variables activated after the query was run are left out
+    keep = np.isin(edges["source"], ids) & np.isin(edges["target"], ids)
+    source, target = edges["source"][keep], edges["target"][keep]
+    order_key, layer, incremental = layered_layout(ids, layers, source, target, previous)
+    return LayoutState(
+        version=version,
+        ids=ids,
+        layers=layers,
+        edge_codes=edge_codes(source, target),
+        order_key=order_key,
+        layer=layer,
+        incremental=incremental,
+    )
+
+
+def get_layout(db: Session) -> LayoutState:
+    """Layout of the current graph version, warm-started from the last one after small edits."""
+    state = state_for(db)
+    version = current_version(db, *GRAPH_TABLES)
+    layout = state.cache.get(_CACHE_KEY)
+    if layout is not None and layout.version == version:
+        return layout
+
+    with state.lock:
+        build_lock = state.cache.setdefault(_BUILD_LOCK_KEY, threading.Lock())
+    with build_lock:
+        layout = state.cache.get(_CACHE_KEY)
+        version = current_version(db, *GRAPH_TABLES)
+        if layout is not None and layout.version == version:
+            return layout
+        layout = build_layout(db, version, layout)
+        with state.lock:
+            current = state.cache.get(_CACHE_KEY)
+            if current is None or current.version <= layout.version:
+                state.cache[_CACHE_KEY] = layout
+        return layout
@@ -0,0 +1,155 @@
+"""Most credible causal chains between two variables.
+
+The credibility of a chain is the product of its relationship confidences,
+so the best chain is the shortest path with edge cost -log(confidence).
+A weighted CSR graph of the active relationships (parallel relationships
+collapsed to the most confident one) is cached per graph version and
+relationship-type filter; single-source searches run in
+scipy.sparse.csgraph.dijkstra, and Yen's algorithm on top of it yields the
+k best simple chains. Spur searches are cut off at the cost of the worst
+candidate still needed, which keeps most of them local.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .graph_index import CAUSAL_TYPES, RELATIONSHIP_TYPES, GraphIndex, get_graph_index
+from .graph_rankings import UNDIRECTED_TYPES
+from .models.relationship import RelationshipType
+from .versions import state_for
+
+
+_CACHE_KEY = "graph_paths"
+
+_UNDIRECTED = np.array([t in UNDIRECTED_TYPES for t in RELATIONSHIP_TYPES])
+
+# (confidence, variable ids, relationship ids)
+Chain = Tuple[float, List[int], List[int]]
+
+
+class PathGraph:
+    """Active relationships as a CSR matrix of -log(confidence) costs."""
+
+    def __init__(self, index: GraphIndex, relationship_types: Sequence[Any]) -> None:
+        from scipy.sparse import csr_matrix
+
+        edges = index.active_edges(relationship_types)
+        with index.lock:
+            self.ids = np.array(sorted(index.active_variables), dtype=np.int64)
+        n = self.ids.size
+        keep = np.isin(edges["source"], self.ids) & np.isin(edges["target"], self.ids) & (edges["confidence"] > 0)
+        src = np.searchsorted(self.ids, edges["source"][keep])
+        dst = np.searchsorted(self.ids, edges["target"][keep])
+        cost = -np.log(np.minimum(edges["confidence"][keep], 1.0))
+        rel = edges["id"][keep]
+        both = _UNDIRECTED[edges["relationship_type"][keep]]
+        src, dst = np.concatenate([src, dst[both]]), np.concatenate([dst, src[both]])
+        cost, rel = np.concatenate([cost, cost[both]]), np.concatenate([rel, rel[both]])
+
+        # sorted by (source, target, cost): the first entry of each pair is the most confident
+        order = np.lexsort((cost, dst, src))
+        src, dst, cost, rel = src[order], dst[order], cost[order], rel[order]
+        first = np.ones(src.size, dtype=bool)
+        first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        self.targets, self.cost, self.rel = dst[first], cost[first], rel[first]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(src[first], minlength=n))])
+        self.matrix = csr_matrix((self.cost, self.targets, self.indptr), shape=(n, n))
+
+    def node(self, variable_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.ids, variable_id))
+        return i if i < self.ids.size and self.ids[i] == variable_id else None
+
+    def edge(self, u: int, v: int) -> int:
+        lo, hi = self.indptr[u], self.indptr[u + 1]
+        return int(lo + np.searchsorted(self.targets[lo:hi], v))
+
+    def shortest(
+        self,
+        start: int,
+        goal: int,
+        banned_nodes: Sequence[int] = (),
+        banned_edges: Sequence[int] = (),
+        limit: float = math.inf,
+    ) -> Optional[Tuple[float, List[int]]]:
+        """(cost, nodes) of the cheapest path avoiding the banned nodes/edges, or None."""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        matrix = self.matrix
+        if len(banned_nodes) or len(banned_edges):
+            data = self.cost.copy()
+            for n in banned_nodes:
+                data[self.indptr[n]:self.indptr[n + 1]] = math.inf
+            data[list(banned_edges)] = math.inf
+            matrix = csr_matrix((data, self.targets, self.indptr), shape=matrix.shape)
+        dist, pred = dijkstra(matrix, indices=start, return_predecessors=True, limit=limit)
+        if not math.isfinite(dist[goal]):
+            return None
+        nodes = [goal]
+        while nodes[-1] != start:
+            nodes.append(int(pred[nodes[-1]]))
+        return float(dist[goal]), nodes[::-1]
+
+    def chains(self, source_id: int, target_id: int, k: int) -> List[Chain]:
+        """Up to `k` simple chains source -> target with the highest confidence product, best first (Yen)."""
+        start, goal = self.node(source_id), self.node(target_id)
+        if start is None or goal is None or start == goal:
+            return []
+        first = self.shortest(start, goal)
+        if first is None:
+            return []
+        found = [first]
+        seen: Set[Tuple[int, ...]] = {tuple(first[1])}
+        candidates: List[Tuple[float, List[int]]] = []
+        while len(found) < k:
+            _, nodes = found[-1]
+            root_cost = 0.0
+            for i in range(len(nodes) - 1):
+                root = nodes[: i + 1]
+                banned_edges = [self.edge(nodes[i], p[1][i + 1]) for p in found if p[1][: i + 1] == root]
+                # only chains cheaper than the worst candidate still needed can make the cut
+                needed = k - len(found)
+                limit = math.inf
+                if len(candidates) >= needed:
+                    limit = heapq.nsmallest(needed, candidates)[-1][0] - root_cost
+                spur = self.shortest(nodes[i], goal, root[:-1], banned_edges, limit)
+                if spur is not None:
+                    path = root[:-1] + spur[1]
+                    if tuple(path) not in seen:
+                        seen.add(tuple(path))
+                        heapq.heappush(candidates, (root_cost + spur[0], path))
+                root_cost += self.cost[self.edge(nodes[i], nodes[i + 1])]
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates))
+        return [
+            (
+                math.exp(-cost),
+                self.ids[nodes].tolist(),
+                [int(self.rel[self.edge(u, v)]) for u, v in zip(nodes, nodes[1:])],
+            )
+            for cost, nodes in found
+        ]
+
+
+def get_path_graph(db: Session, relationship_types: Optional[Sequence[Any]] = None) -> Tuple[GraphIndex, PathGraph]:
+    """(graph index, path graph) for the current version; default types are CAUSAL_TYPES."""
+    index = get_graph_index(db)
+    version = index.version
+    types = tuple(sorted({RelationshipType(t).value for t in relationship_types or CAUSAL_TYPES}))
+    state = state_for(db)
+    with state.lock:
+        cache = state.cache.get(_CACHE_KEY)
+        if cache is None or cache[0] != version:
+            cache = state.cache[_CACHE_KEY] = (version, {})
+        graph = cache[1].get(types)
+    if graph is None:
+        graph = PathGraph(index, types)
+        with state.lock:
+            cache[1][types] = graph
+    return index, graph
@@ -8,6 +8,8 @@ from .api.relationships import router as relationship_router
 from .api.experiments import router as experiments_router
 from .api.optimize import router as optimize_router
 from .api.runs import router as runs_router
+from .api.graph import router as graph_router
+from .api.changes import router as changes_router
 from .database import init_db
 
 @asynccontextmanager
@@ -42,6 +44,8 @@ app.include_router(relationship_router)
 app.include_router(experiments_router)
 app.include_router(optimize_router)
 app.include_router(runs_router)
+app.include_router(graph_router)
+app.include_router(changes_router)
 
 
 @app.get("/")
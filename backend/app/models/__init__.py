@@ -1,6 +1,6 @@
 from .variable import Variable, VariableType, VariableSource
 from .relationship import Relationship, RelationshipType, RelationshipDirection, RelationshipShape
-from .experiment_run import ExperimentRun, ExperimentRunType
+from .experiment_run import ExperimentRun, ExperimentRunType, ExperimentRunVariable
 
 __all__ = [
     "Variable",
@@ -12,4 +12,5 @@ __all__ = [
     "RelationshipShape",
     "ExperimentRun",
     "ExperimentRunType",
+    "ExperimentRunVariable",
 ]
@@ -4,9 +4,9 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Any, Optional
 
-from sqlalchemy import Boolean, DateTime, Enum, Integer, String
-from sqlalchemy import JSON
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Boolean, DateTime, Enum, Float, ForeignKey, Index, Integer, String
+from sqlalchemy import JSON, false as sa_false
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..db_base import Base
 
@@ -35,6 +35,22 @@ class ExperimentRun(Base):
     request_json: Mapped[dict[str, Any]] = mapped_column(JSON, nullable=False, default=dict)
     response_json: Mapped[dict[str, Any]] = mapped_column(JSON, nullable=False, default=dict)
 
+    # content addressing: request_hash identifies the computation (canonical request +
+    # variable bounds), content_hash the stored body; both are sha256 hex digests.
+    request_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+
+    # computed by /experiments/* in this deployment (persist=true); only these runs are
+    # served again for an identical request. Runs posted to POST /runs are client data.
+    computed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=sa_false())
+
+    # client supplied Idempotency-Key (retries of POST /runs resolve to the same row)
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, unique=True)
+
+    # indexed projections of the JSON snapshots (for filtering/sorting without reading JSON)
+    objective_kind: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    best_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
 
     created_at: Mapped[datetime] = mapped_column(
@@ -44,5 +60,41 @@ class ExperimentRun(Base):
         DateTime(timezone=True), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    variable_links: Mapped[list["ExperimentRunVariable"]] = relationship(
+        "ExperimentRunVariable",
+        back_populates="run",
+        cascade="all, delete-orphan",
+    )
+
+    __table_args__ = (
+        Index("ix_experiment_runs_objective_kind_best_score", "objective_kind", "best_score"),
+        Index("ix_experiment_runs_best_score", "best_score"),
+        # default history listing: active runs of a type, newest first
+        Index("ix_experiment_runs_active_type_created", "is_active", "run_type", "created_at"),
+    )
+
     def __repr__(self) -> str:
         return f"<ExperimentRun(id={self.id}, type={self.run_type.value})>"
+
+
+class ExperimentRunVariable(Base):
+    """Variables included in a run (projection of request/response variable_ids).
+
+    A plain link table instead of a JSON containment index keeps "runs that
+    include variable X" an index lookup on both PostgreSQL and SQLite.
+    """
+    __tablename__ = "experiment_run_variables"
+
+    run_id: Mapped[int] = mapped_column(
+        ForeignKey("experiment_runs.id", ondelete="CASCADE"), primary_key=True
+    )
+    variable_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    run: Mapped[ExperimentRun] = relationship("ExperimentRun", back_populates="variable_links")
+
+    __table_args__ = (
+        Index("ix_experiment_run_variables_variable_id_run_id", "variable_id", "run_id"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ExperimentRunVariable(run_id={self.run_id}, variable_id={self.variable_id})>"
@@ -2,12 +2,15 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Optional
 
-from sqlalchemy import ForeignKey, String, Float, Integer, Boolean, DateTime, Enum, CheckConstraint
+from sqlalchemy import ForeignKey, String, Float, Integer, Boolean, DateTime, Enum, CheckConstraint, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..db_base import Base
 
 
+ACTIVE_PAIR_INDEX = "ux_relationships_active_pair"
+
+
 class RelationshipType(str, PyEnum):
     """Typ relacji między zmiennymi."""
     DRIVES = "drives"  # Jedna zmienna bezpośrednio napędza drugą
@@ -128,8 +131,14 @@ class Relationship(Base):
             "confidence >= 0 AND confidence <= 1",
             name="check_rel_confidence_range"
         ),
-        # Unikalność: jedna relacja danego typu między tymi samymi zmiennymi
-        # (zapobiega duplikatom)
+        # Unikalność: jedna aktywna relacja między tymi samymi zmiennymi (source -> target)
+        Index(
+            ACTIVE_PAIR_INDEX, "source_variable_id", "target_variable_id",
+            unique=True, postgresql_where=text("is_active"), sqlite_where=text("is_active"),
+        ),
+        # Listy aktywnych relacji zmiennej (filtr is_active + source/target)
+        Index("ix_relationships_active_source", "is_active", "source_variable_id"),
+        Index("ix_relationships_active_target", "is_active", "target_variable_id"),
     )
 
     def __repr__(self) -> str:
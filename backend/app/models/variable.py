@@ -2,12 +2,15 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Optional
 
-from sqlalchemy import ForeignKey, String, Float, Integer, Boolean, DateTime, Enum, CheckConstraint
+from sqlalchemy import DDL, ForeignKey, String, Float, Integer, Boolean, DateTime, Enum, CheckConstraint, Index, event, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..db_base import Base
 
 
+ACTIVE_NAME_INDEX = "ux_variables_name_active"
+
+
 class VariableType(str, PyEnum):
     """Typ zmiennej - określa kategorię zmiennej w systemie."""
     PHYSICAL_CONSTANT = "physical_constant"
@@ -35,7 +38,8 @@ class Variable(Base):
 
     # Podstawowe pola
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    name: Mapped[str] = mapped_column(String(255), unique=True, index=True, nullable=False)
+    # Unikalna wśród aktywnych zmiennych (indeks częściowy ACTIVE_NAME_INDEX)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
     description: Mapped[Optional[str]] = mapped_column(String(1000), nullable=True)
     symbol: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
 
@@ -68,7 +72,8 @@ class Variable(Base):
     layer_level: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     parent_variable_id: Mapped[Optional[int]] = mapped_column(
         ForeignKey("variables.id", ondelete="SET NULL"),
-        nullable=True
+        nullable=True,
+        index=True
     )
 
     # Soft delete flag
@@ -127,7 +132,36 @@ class Variable(Base):
             "layer_level >= 0",
             name="check_layer_level_positive"
         ),
+        # Unikalność nazwy tylko wśród aktywnych (nazwę usuniętej zmiennej można użyć ponownie)
+        Index(
+            ACTIVE_NAME_INDEX, "name",
+            unique=True, postgresql_where=text("is_active"), sqlite_where=text("is_active"),
+        ),
     )
 
     def __repr__(self) -> str:
         return f"<Variable(id={self.id}, name='{self.name}', type={self.variable_type.value})>"
+
+
+# Wyszukiwanie pełnotekstowe/rozmyte (tylko PostgreSQL): pg_trgm + unaccent + indeksy GIN.
+# Wyrażenia muszą być identyczne z używanymi w zapytaniu (app/variable_search.py).
+# unaccent() jest STABLE, a wyrażenie indeksu musi być IMMUTABLE - stąd opakowanie
+# ze słownikiem podanym wprost (rozszerzenie zainstalowane w schemacie public).
+PG_UNACCENT_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+    "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$"
+)
+PG_SEARCH_DOCUMENT = (
+    "immutable_unaccent(coalesce(name, '') || ' ' || coalesce(symbol, '') || ' ' || coalesce(description, ''))"
+)
+PG_SEARCH_TSVECTOR = f"to_tsvector('simple', {PG_SEARCH_DOCUMENT})"
+
+for _ddl in ("CREATE EXTENSION IF NOT EXISTS pg_trgm", "CREATE EXTENSION IF NOT EXISTS unaccent", PG_UNACCENT_FUNCTION):
+    event.listen(Variable.__table__, "before_create", DDL(_ddl).execute_if(dialect="postgresql"))
+for _ddl in (
+    "CREATE INDEX IF NOT EXISTS ix_variables_name_trgm ON variables USING gin (immutable_unaccent(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_variables_symbol_trgm ON variables USING gin (immutable_unaccent(symbol) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_variables_search_tsv ON variables USING gin ({PG_SEARCH_TSVECTOR})",
+):
+    event.listen(Variable.__table__, "after_create", DDL(_ddl).execute_if(dialect="postgresql"))
@@ -0,0 +1,315 @@
+"""Ranked text search over active variables (name, symbol, description).
+
+On PostgreSQL the query runs in the database against pg_trgm and full-text
+GIN indexes (see models/variable.py). Other databases use an in-process
+inverted index: normalized tokens (lowercase, accents folded) map to posting
+dicts {variable_id: field weight}, and a sorted term list gives prefix lookup
+by bisection, so typeahead queries only touch the terms sharing the prefix.
+Tokens with no exact or prefix match fall back to trigram similarity over
+the vocabulary (like pg_trgm), which tolerates typos.
+
+The in-process index is tagged with the graph version and kept in sync by a
+version listener, like the graph index; bulk writes leave it stale and it is
+rebuilt on the next search.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import String, case, func, literal_column, or_, select
+from sqlalchemy.orm import Session
+
+from .models.variable import PG_SEARCH_TSVECTOR, Variable
+from .versions import GRAPH_TABLES, VARIABLES, BindState, Change, add_listener, current_version, primary_session, state_for
+
+
+FIELD_WEIGHTS = {"name": 3.0, "symbol": 2.0, "description": 1.0}
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.5
+FUZZY_MIN_LENGTH = 3
+FUZZY_THRESHOLD = 0.3
+FUZZY_MAX_TERMS = 8
+# one-letter prefixes match a large part of the vocabulary; they only expand over name/symbol terms
+SHORT_PREFIX = 2
+# bonus when the whole normalized query starts / equals the variable name
+NAME_PREFIX_BONUS = 2.0
+NAME_EXACT_BONUS = 4.0
+
+_CACHE_KEY = "variable_search"
+_BUILD_LOCK_KEY = "variable_search_build_lock"
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_FOLD = str.maketrans({"ł": "l", "Ł": "L", "ß": "ss", "ø": "o", "Ø": "O", "đ": "d", "Đ": "D"})
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase with diacritics removed ("Ciśnienie" -> "cisnienie")."""
+    decomposed = unicodedata.normalize("NFKD", (text or "").translate(_FOLD))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VariableSearchIndex:
+    """Inverted index of active variables with prefix and trigram lookup."""
+
+    def __init__(self, version: int, records: Sequence[Dict[str, Any]]) -> None:
+        self.lock = threading.RLock()
+        self.version = version
+        self.records: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        # postings restricted to name/symbol terms
+        self.head_postings: Dict[str, Dict[int, float]] = {}
+        self.terms: List[str] = []
+        self.term_trigrams: Dict[str, Set[str]] = {}
+        self.doc_terms: Dict[int, Dict[str, float]] = {}
+        self.doc_names: Dict[int, str] = {}
+
+        # initial load: sort the vocabulary once instead of inserting term by term
+        self._loading = True
+        for rec in records:
+            self.add(rec)
+        self._loading = False
+        self.terms = sorted(self.postings)
+        for term in self.terms:
+            for tri in trigrams(term):
+                self.term_trigrams.setdefault(tri, set()).add(term)
+
+    # ---------- updates ----------
+
+    def _add_term(self, term: str) -> None:
+        if self._loading:
+            return
+        insort(self.terms, term)
+        for tri in trigrams(term):
+            self.term_trigrams.setdefault(tri, set()).add(term)
+
+    def _drop_term(self, term: str) -> None:
+        i = bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            del self.terms[i]
+        for tri in trigrams(term):
+            bucket = self.term_trigrams.get(tri)
+            if bucket is not None:
+                bucket.discard(term)
+                if not bucket:
+                    del self.term_trigrams[tri]
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        var_id = rec["id"]
+        self.remove(var_id)
+        if not rec.get("is_active", True):
+            return
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(rec.get(field)):
+                weights[term] = max(weights.get(term, 0.0), weight)
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                self._add_term(term)
+            posting[var_id] = weight
+            if weight > FIELD_WEIGHTS["description"]:
+                self.head_postings.setdefault(term, {})[var_id] = weight
+        self.doc_terms[var_id] = weights
+        self.doc_names[var_id] = " ".join(tokenize(rec.get("name")))
+        self.records[var_id] = dict(rec)
+
+    def remove(self, var_id: int) -> None:
+        weights = self.doc_terms.pop(var_id, None)
+        if weights is None:
+            return
+        for term in weights:
+            posting = self.postings[term]
+            posting.pop(var_id, None)
+            if not posting:
+                del self.postings[term]
+                self._drop_term(term)
+            head = self.head_postings.get(term)
+            if head is not None:
+                head.pop(var_id, None)
+                if not head:
+                    del self.head_postings[term]
+        self.doc_names.pop(var_id, None)
+        self.records.pop(var_id, None)
+
+    # ---------- queries ----------
+
+    def _prefixed(self, token: str) -> List[str]:
+        return self.terms[bisect_left(self.terms, token):bisect_left(self.terms, token + "\U0010ffff")]
+
+    def _similar(self, token: str) -> List[Tuple[str, float]]:
+        """Vocabulary terms with trigram (Jaccard) similarity >= FUZZY_THRESHOLD."""
+        grams = trigrams(token)
+        shared = Counter(term for tri in grams for term in self.term_trigrams.get(tri, ()))
+        scored = []
+        for term, common in shared.items():
+            sim = common / (len(grams) + len(trigrams(term)) - common)
+            if sim >= FUZZY_THRESHOLD:
+                scored.append((term, sim))
+        return heapq.nlargest(FUZZY_MAX_TERMS, scored, key=lambda ts: ts[1])
+
+    def _token_scores(self, token: str, fuzzy: bool) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        short = len(token) < SHORT_PREFIX
+        for term in self._prefixed(token):
+            if term == token:
+                factor, posting = 1.0, self.postings[term]
+            else:
+                factor = PREFIX_FACTOR * len(token) / len(term)
+                posting = self.head_postings.get(term, {}) if short else self.postings[term]
+            for var_id, weight in posting.items():
+                score = weight * factor
+                if score > scores.get(var_id, 0.0):
+                    scores[var_id] = score
+        if not scores and fuzzy and len(token) >= FUZZY_MIN_LENGTH:
+            for term, sim in self._similar(token):
+                for var_id, weight in self.postings[term].items():
+                    score = weight * FUZZY_FACTOR * sim
+                    if score > scores.get(var_id, 0.0):
+                        scores[var_id] = score
+        return scores
+
+    def search(self, query: str, limit: int = 20, fuzzy: bool = True) -> List[Tuple[Dict[str, Any], float]]:
+        """Top `limit` (record, score); every query token must match (exact, prefix or fuzzy)."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            # most selective tokens first, so the running intersection stays small
+            per_token = sorted((self._token_scores(t, fuzzy) for t in dict.fromkeys(tokens)), key=len)
+            scores = per_token[0]
+            for more in per_token[1:]:
+                scores = {v: s + more[v] for v, s in scores.items() if v in more}
+                if not scores:
+                    return []
+
+            phrase = " ".join(tokens)
+            for var_id in scores:
+                name = self.doc_names[var_id]
+                if name == phrase:
+                    scores[var_id] += NAME_EXACT_BONUS
+                elif name.startswith(phrase):
+                    scores[var_id] += NAME_PREFIX_BONUS
+
+            top = heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+            return [(self.records[var_id], score) for var_id, score in top]
+
+
+def build_search_index(db: Session, version: int) -> VariableSearchIndex:
+    records = [
+        dict(row)
+        for row in db.execute(select(Variable.__table__).where(Variable.is_active == True)).mappings()
+    ]
+    return VariableSearchIndex(version, records)
+
+
+def get_search_index(db: Session) -> VariableSearchIndex:
+    """Index for the current graph version (built on first use or after a bulk write).
+
+    Always built from the primary database, also when `db` reads a replica.
+    """
+    state = state_for(db)
+    version = current_version(db, *GRAPH_TABLES)
+    idx = state.cache.get(_CACHE_KEY)
+    if idx is not None and idx.version == version:
+        return idx
+
+    with state.lock:
+        build_lock = state.cache.setdefault(_BUILD_LOCK_KEY, threading.Lock())
+    with build_lock:
+        idx = state.cache.get(_CACHE_KEY)
+        version = current_version(db, *GRAPH_TABLES)
+        if idx is not None and idx.version == version:
+            return idx
+        with primary_session(db) as source:
+            idx = build_search_index(source, version)
+        with state.lock:
+            current = state.cache.get(_CACHE_KEY)
+            if current is None or current.version <= idx.version:
+                state.cache[_CACHE_KEY] = idx
+        return idx
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def pg_search(db: Session, query: str, limit: int = 20, fuzzy: bool = True) -> List[Tuple[Variable, float]]:
+    """Ranked search in PostgreSQL: prefix full-text match, ILIKE prefix and trigram similarity (GIN indexes).
+
+    Columns go through immutable_unaccent() (the indexed expressions) and the query through
+    normalize(), so accents fold the same way as in the in-process index.
+    """
+    folded = normalize(query).strip()
+    tokens = _TOKEN_RE.findall(folded)
+    if not tokens:
+        return []
+    tsv = literal_column(PG_SEARCH_TSVECTOR)
+    tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{t}:*" for t in tokens))
+    prefix = _escape_like(folded) + "%"
+    name = func.immutable_unaccent(Variable.name, type_=String)
+    symbol = func.immutable_unaccent(Variable.symbol, type_=String)
+
+    name_prefix = name.ilike(prefix, escape="\\")
+    score = (
+        func.ts_rank(tsv, tsquery)
+        + func.similarity(name, folded)
+        + case((func.lower(name) == folded, NAME_EXACT_BONUS), else_=0.0)
+        + case((name_prefix, NAME_PREFIX_BONUS), else_=0.0)
+    )
+    matches = [tsv.op("@@")(tsquery), name_prefix, symbol.ilike(prefix, escape="\\")]
+    if fuzzy:
+        matches.append(name.op("%")(folded))
+
+    rows = db.execute(
+        select(Variable, score.label("score"))
+        .where(Variable.is_active == True, or_(*matches))
+        .order_by(score.desc(), Variable.id)
+        .limit(limit)
+    ).all()
+    return [(var, float(s)) for var, s in rows]
+
+
+def _on_change(
+    state: BindState,
+    previous: int,
+    version: int,
+    tables: Tuple[str, ...],
+    changes: Optional[Sequence[Change]],
+) -> None:
+    idx: Optional[VariableSearchIndex] = state.cache.get(_CACHE_KEY)
+    if idx is None or idx.version != previous:
+        return
+    if VARIABLES not in tables:
+        idx.version = version
+        return
+    if changes is None:
+        return  # bulk write: leave stale, rebuilt lazily
+
+    with idx.lock:
+        for ch in changes:
+            if ch.table != VARIABLES:
+                continue
+            if ch.op == "purge":
+                idx.remove(ch.id)
+            else:
+                idx.add(ch.values or {"id": ch.id, "is_active": False})
+        idx.version = version
+
+
+add_listener(_on_change)
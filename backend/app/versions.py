@@ -0,0 +1,215 @@
+"""In-process change versions for the variable/relationship tables.
+
+Every write handler bumps the version of the table(s) it changed after the
+commit. Versions are monotonic per database bind (engine), so each configured
+database - and each test database - has independent counters, and they are
+used as ETags and as keys of in-process caches built from those tables.
+
+Versions live in process memory: the API runs as a single uvicorn worker (see
+docs/RUNBOOK.md). BOOT_ID is part of every ETag, so a restarted process never
+confirms an ETag handed out by a previous one.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+VARIABLES = "variables"
+RELATIONSHIPS = "relationships"
+GRAPH_TABLES = (VARIABLES, RELATIONSHIPS)
+
+
+@dataclass
+class Change:
+    """One committed row change, passed to listeners so derived indexes can update in place.
+
+    op: "create" | "update" | "delete" (soft) | "restore" | "purge" (hard delete)
+    values: column values after the write (None for purge)
+    fields: columns changed by an update (None = not tracked / whole row)
+    """
+    table: str
+    op: str
+    id: int
+    values: Optional[Dict[str, Any]] = None
+    fields: Optional[List[str]] = None
+
+
+def row_values(obj: Any) -> Dict[str, Any]:
+    """Column values of a loaded ORM instance (call before commit or after refresh)."""
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+
+class BindState:
+    """Versions and derived caches of one database."""
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.counter = 0
+        self.tables: Dict[str, int] = {}
+        self.modified_at: Dict[str, datetime] = {}
+        self.started_at = datetime.now(timezone.utc).replace(microsecond=0)
+        # time.monotonic() of the last commit through this process (any table)
+        self.last_write = 0.0
+        # free-form slots for caches derived from the versioned tables
+        self.cache: Dict[str, Any] = {}
+
+
+_states: "WeakKeyDictionary[Any, BindState]" = WeakKeyDictionary()
+# replica engine -> sync engine of its primary database
+_primaries: "WeakKeyDictionary[Any, Any]" = WeakKeyDictionary()
+# engine of an async driver (AsyncEngine.sync_engine) -> sync engine of the same database
+_sync_engines: "WeakKeyDictionary[Any, Any]" = WeakKeyDictionary()
+_states_lock = threading.Lock()
+
+# fn(state, previous_version, new_version, tables, changes); called under state.lock
+Listener = Callable[[BindState, int, int, Tuple[str, ...], Optional[Sequence[Change]]], None]
+_listeners: List[Listener] = []
+
+
+def add_listener(fn: Listener) -> Listener:
+    """Register a callback run atomically with every version bump."""
+    _listeners.append(fn)
+    return fn
+
+
+def _state_of(bind: Any) -> BindState:
+    with _states_lock:
+        state = _states.get(bind)
+        if state is None:
+            state = BindState()
+            _states[bind] = state
+        return state
+
+
+def state_for(db: Session) -> BindState:
+    """State of the database behind `db` (does not open a connection)."""
+    return _state_of(db.get_bind())
+
+
+def share_state(engine: Any, source: Any, replica: bool = False) -> None:
+    """Make sessions on `engine` use the versions and caches of the engine `source`.
+
+    `replica`: `engine` reads a (lagging) replica of the database of `source`.
+    An engine sharing with a replica engine is a replica as well.
+    """
+    state = _state_of(source)
+    with _states_lock:
+        _states[engine] = state
+        primary = source if replica else _primaries.get(source)
+        if primary is not None:
+            _primaries[engine] = primary
+
+
+def share_async_state(engine: Any, sync_engine: Any) -> None:
+    """`engine` (AsyncEngine.sync_engine) reaches the database of `sync_engine` through an async driver."""
+    share_state(engine, sync_engine)
+    with _states_lock:
+        _sync_engines[engine] = sync_engine
+
+
+def is_replica(db: Any) -> bool:
+    """True when `db` (Session or AsyncSession) reads a replica.
+
+    Replica data may lag behind the version counters, so it must not be
+    cached or labelled with them (ETag, Last-Modified).
+    """
+    return db.get_bind() in _primaries
+
+
+@contextmanager
+def primary_session(db: Session) -> Iterator[Session]:
+    """`db`, or a short-lived session on the primary when `db` reads a replica.
+
+    For building caches keyed by versions: their data must be as new as the version.
+    """
+    primary = _primaries.get(db.get_bind())
+    if primary is None:
+        yield db
+        return
+    with Session(bind=primary) as session:
+        yield session
+
+
+@contextmanager
+def sync_session(db: Any) -> Iterator[Session]:
+    """A short-lived Session on the sync engine of the database behind `db` (e.g. an AsyncSession).
+
+    For work handed to the threadpool (graph index build, lock waits): the connection of
+    an AsyncSession must not be used from another thread.
+    """
+    bind = db.get_bind()
+    with Session(bind=_sync_engines.get(bind, bind)) as session:
+        yield session
+
+
+def written_within(db: Session, seconds: float) -> bool:
+    """True when this process committed to the database behind `db` in the last `seconds`."""
+    state = state_for(db)
+    with state.lock:
+        return state.last_write > 0 and time.monotonic() - state.last_write < seconds
+
+
+@event.listens_for(Session, "after_commit")
+def _note_write(session: Session) -> None:
+    state = state_for(session)
+    with state.lock:
+        state.last_write = time.monotonic()
+
+
+def current_version(db: Session, *tables: str) -> int:
+    state = state_for(db)
+    with state.lock:
+        return max((state.tables.get(t, 0) for t in tables or GRAPH_TABLES), default=0)
+
+
+def last_modified(db: Session, *tables: str) -> datetime:
+    state = state_for(db)
+    with state.lock:
+        stamps = [state.modified_at[t] for t in tables or GRAPH_TABLES if t in state.modified_at]
+        return max(stamps, default=state.started_at)
+
+
+def bump(db: Session, *tables: str, changes: Optional[Sequence[Change]] = None) -> int:
+    """Record a committed write to `tables`; returns the new version.
+
+    `changes` describes the write row by row. Without it (bulk writes) listeners
+    must treat their derived state as stale.
+    """
+    state = state_for(db)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    with state.lock:
+        previous = state.counter
+        state.counter += 1
+        for t in tables:
+            state.tables[t] = state.counter
+            state.modified_at[t] = now
+        for fn in _listeners:
+            fn(state, previous, state.counter, tables, changes)
+        return state.counter
+
+
+def make_etag(kind: str, version: int, variant: Optional[str] = None) -> str:
+    suffix = f"-{variant}" if variant else ""
+    return f'"{BOOT_ID}-{kind}-{version}{suffix}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 7232 weak comparison of an If-None-Match header against `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c.removeprefix("W/") == etag.removeprefix("W/") for c in candidates)
@@ -0,0 +1,145 @@
+"""baseline: schema as created by init_db() before migrations were introduced
+
+Databases created earlier by the app itself: `alembic stamp 0001_baseline`.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001_baseline"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLAlchemy stores enum member names
+variable_type_enum = sa.Enum(
+    "PHYSICAL_CONSTANT", "ENGINEERING_PROCESS_METRIC", "BUSINESS_KPI", "SUBJECTIVE_FACTOR", name="variable_type_enum"
+)
+variable_source_enum = sa.Enum("HARD_DATA", "USER_INPUT", "AI_SUGGESTION", "MIXED", name="variable_source_enum")
+relationship_type_enum = sa.Enum("DRIVES", "INFLUENCES", "CORRELATES_WITH", name="relationship_type_enum")
+relationship_direction_enum = sa.Enum("POSITIVE", "NEGATIVE", "UNKNOWN", name="relationship_direction_enum")
+relationship_shape_enum = sa.Enum("LINEAR", "NONLINEAR", "THRESHOLD", "UNKNOWN", name="relationship_shape_enum")
+experiment_run_type_enum = sa.Enum("DOE", "OPTIMIZE", name="experiment_run_type_enum")
+
+PG_SEARCH_TSVECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(symbol, '') || ' ' || coalesce(description, ''))"
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "variables",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=255), nullable=False),
+        sa.Column("description", sa.String(length=1000), nullable=True),
+        sa.Column("symbol", sa.String(length=50), nullable=True),
+        sa.Column("variable_type", variable_type_enum, nullable=False),
+        sa.Column("min_value", sa.Float(), nullable=True),
+        sa.Column("max_value", sa.Float(), nullable=True),
+        sa.Column("unit", sa.String(length=50), nullable=True),
+        sa.Column("source", variable_source_enum, nullable=False),
+        sa.Column("confidence", sa.Float(), nullable=False),
+        sa.Column("source_description", sa.String(length=1000), nullable=True),
+        sa.Column("layer_level", sa.Integer(), nullable=False),
+        sa.Column("parent_variable_id", sa.Integer(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint(
+            "(min_value IS NULL OR max_value IS NULL OR min_value < max_value)", name="check_min_max_values"
+        ),
+        sa.CheckConstraint("confidence >= 0 AND confidence <= 1", name="check_confidence_range"),
+        sa.CheckConstraint("layer_level >= 0", name="check_layer_level_positive"),
+        sa.ForeignKeyConstraint(["parent_variable_id"], ["variables.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_variables_id", "variables", ["id"])
+    op.create_index("ix_variables_name", "variables", ["name"], unique=True)
+    op.create_index("ix_variables_parent_variable_id", "variables", ["parent_variable_id"])
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_variables_name_trgm ON variables USING gin (name gin_trgm_ops)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_variables_symbol_trgm ON variables USING gin (symbol gin_trgm_ops)")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_variables_search_tsv ON variables USING gin ({PG_SEARCH_TSVECTOR})")
+
+    op.create_table(
+        "relationships",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("source_variable_id", sa.Integer(), nullable=False),
+        sa.Column("target_variable_id", sa.Integer(), nullable=False),
+        sa.Column("relationship_type", relationship_type_enum, nullable=False),
+        sa.Column("direction", relationship_direction_enum, nullable=False),
+        sa.Column("shape", relationship_shape_enum, nullable=False),
+        sa.Column("confidence", sa.Float(), nullable=False),
+        sa.Column("provenance_source", sa.String(length=500), nullable=True),
+        sa.Column("description", sa.String(length=1000), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint("source_variable_id != target_variable_id", name="check_no_self_reference"),
+        sa.CheckConstraint("confidence >= 0 AND confidence <= 1", name="check_rel_confidence_range"),
+        sa.ForeignKeyConstraint(["source_variable_id"], ["variables.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["target_variable_id"], ["variables.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_relationships_id", "relationships", ["id"])
+    op.create_index("ix_relationships_source_variable_id", "relationships", ["source_variable_id"])
+    op.create_index("ix_relationships_target_variable_id", "relationships", ["target_variable_id"])
+
+    op.create_table(
+        "experiment_runs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("run_type", experiment_run_type_enum, nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=True),
+        sa.Column("request_json", sa.JSON(), nullable=False),
+        sa.Column("response_json", sa.JSON(), nullable=False),
+        sa.Column("request_hash", sa.String(length=64), nullable=True),
+        sa.Column("content_hash", sa.String(length=64), nullable=True),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=True),
+        sa.Column("objective_kind", sa.String(length=32), nullable=True),
+        sa.Column("best_score", sa.Float(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("idempotency_key"),
+    )
+    op.create_index("ix_experiment_runs_id", "experiment_runs", ["id"])
+    op.create_index("ix_experiment_runs_run_type", "experiment_runs", ["run_type"])
+    op.create_index("ix_experiment_runs_request_hash", "experiment_runs", ["request_hash"])
+    op.create_index("ix_experiment_runs_content_hash", "experiment_runs", ["content_hash"])
+    op.create_index(
+        "ix_experiment_runs_objective_kind_best_score", "experiment_runs", ["objective_kind", "best_score"]
+    )
+    op.create_index("ix_experiment_runs_best_score", "experiment_runs", ["best_score"])
+
+    op.create_table(
+        "experiment_run_variables",
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.Column("variable_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["run_id"], ["experiment_runs.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("run_id", "variable_id"),
+    )
+    op.create_index(
+        "ix_experiment_run_variables_variable_id_run_id", "experiment_run_variables", ["variable_id", "run_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("experiment_run_variables")
+    op.drop_table("experiment_runs")
+    op.drop_table("relationships")
+    op.drop_table("variables")
+    bind = op.get_bind()
+    for enum in (
+        experiment_run_type_enum, relationship_shape_enum, relationship_direction_enum, relationship_type_enum,
+        variable_source_enum, variable_type_enum,
+    ):
+        enum.drop(bind, checkfirst=True)
@@ -0,0 +1,58 @@
+"""unique active names / relationship pairs, composite indexes for is_active filters
+
+Fails on databases that already hold duplicate active rows; find them with
+
+    SELECT name FROM variables WHERE is_active GROUP BY name HAVING count(*) > 1;
+    SELECT source_variable_id, target_variable_id FROM relationships
+    WHERE is_active GROUP BY 1, 2 HAVING count(*) > 1;
+
+and soft-delete the extra rows first.
+
+Revision ID: 0002_active_row_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002_active_row_indexes"
+down_revision: Union[str, None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("is_active")
+
+
+def upgrade() -> None:
+    # names only have to be unique among active variables (a deleted name can be reused)
+    op.drop_index("ix_variables_name", table_name="variables", if_exists=True)
+    op.create_index(
+        "ux_variables_name_active", "variables", ["name"],
+        unique=True, postgresql_where=ACTIVE, sqlite_where=ACTIVE, if_not_exists=True,
+    )
+    op.create_index(
+        "ux_relationships_active_pair", "relationships", ["source_variable_id", "target_variable_id"],
+        unique=True, postgresql_where=ACTIVE, sqlite_where=ACTIVE, if_not_exists=True,
+    )
+    op.create_index(
+        "ix_relationships_active_source", "relationships", ["is_active", "source_variable_id"], if_not_exists=True
+    )
+    op.create_index(
+        "ix_relationships_active_target", "relationships", ["is_active", "target_variable_id"], if_not_exists=True
+    )
+    op.create_index(
+        "ix_experiment_runs_active_type_created", "experiment_runs", ["is_active", "run_type", "created_at"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_experiment_runs_active_type_created", table_name="experiment_runs")
+    op.drop_index("ix_relationships_active_target", table_name="relationships")
+    op.drop_index("ix_relationships_active_source", table_name="relationships")
+    op.drop_index("ux_relationships_active_pair", table_name="relationships")
+    op.drop_index("ux_variables_name_active", table_name="variables")
+    op.create_index("ix_variables_name", "variables", ["name"], unique=True)
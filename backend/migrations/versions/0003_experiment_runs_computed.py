@@ -0,0 +1,32 @@
+"""experiment_runs.computed: only server-computed runs are reused
+
+Runs posted to POST /runs used to get a request_hash derived from their own
+request/response bodies, so a seeded /experiments/* request could be answered
+with client data. Existing rows cannot be told apart and all start as not
+computed; their request_hash is cleared.
+
+Revision ID: 0003_experiment_runs_computed
+Revises: 0002_active_row_indexes
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003_experiment_runs_computed"
+down_revision: Union[str, None] = "0002_active_row_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "experiment_runs", sa.Column("computed", sa.Boolean(), nullable=False, server_default=sa.false())
+    )
+    op.execute("UPDATE experiment_runs SET request_hash = NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("experiment_runs", "computed")
@@ -0,0 +1,53 @@
+"""variable search folds accents on PostgreSQL (unaccent)
+
+The in-process search index folds diacritics ("cisnienie" finds
+"Ciśnienie"); the trigram and full-text GIN indexes now index
+immutable_unaccent(...) so the PostgreSQL path matches. No-op elsewhere.
+
+Revision ID: 0004_search_unaccent
+Revises: 0003_experiment_runs_computed
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "0004_search_unaccent"
+down_revision: Union[str, None] = "0003_experiment_runs_computed"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# unaccent() is only STABLE; index expressions need an IMMUTABLE wrapper with the dictionary spelled out
+UNACCENT_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+    "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$"
+)
+DOCUMENT = "coalesce(name, '') || ' ' || coalesce(symbol, '') || ' ' || coalesce(description, '')"
+SEARCH_INDEXES = ("ix_variables_name_trgm", "ix_variables_symbol_trgm", "ix_variables_search_tsv")
+
+
+def _create_indexes(fold: str) -> None:
+    op.execute(f"CREATE INDEX ix_variables_name_trgm ON variables USING gin ({fold.format('name')} gin_trgm_ops)")
+    op.execute(f"CREATE INDEX ix_variables_symbol_trgm ON variables USING gin ({fold.format('symbol')} gin_trgm_ops)")
+    op.execute(f"CREATE INDEX ix_variables_search_tsv ON variables USING gin (to_tsvector('simple', {fold.format(DOCUMENT)}))")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute(UNACCENT_FUNCTION)
+    for name in SEARCH_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    _create_indexes("immutable_unaccent({})")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for name in SEARCH_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    _create_indexes("{}")
+    op.execute("DROP FUNCTION IF EXISTS immutable_unaccent(text)")
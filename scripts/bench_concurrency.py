@@ -0,0 +1,96 @@
+"""Mixed read/write load test against a running API.
+
+    python scripts/bench_concurrency.py --url http://localhost:8000 --concurrency 64 --requests 4000
+
+Seeds `--variables` variables and a few runs, then keeps `--concurrency`
+requests in flight: reads (GET /variables/{id}, /variables/{id}/children,
+/runs?variable_id=..., /relationships?source_variable_id=...) and `--writes`
+(default 20%) writes (PATCH /variables/{id}). Reports throughput and latency percentiles. Run it
+against one uvicorn worker to compare request concurrency per worker.
+
+The async-vs-threadpool comparison only means something against a networked
+PostgreSQL (asyncpg here vs psycopg2 on the 40-thread pool in the commit
+before the async handlers), with --concurrency above 40 and DB_POOL_SIZE above
+--concurrency. Run this client on another host: httpx costs more CPU per
+request than the API does. Results so far are in docs/RUNBOOK.md (Async endpoints).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def seed(client: httpx.AsyncClient, n: int) -> list:
+    prefix = uuid.uuid4().hex[:6]
+    items = [{"name": f"bench-{prefix}-{i}", "min_value": 0, "max_value": 100} for i in range(n)]
+    r = await client.post("/variables/bulk", json={"items": items})
+    r.raise_for_status()
+    ids = r.json()["created_ids"]
+    for vid in ids[:10]:
+        run = {"run_type": "doe", "title": "bench", "request_json": {"v": vid}, "response_json": {"variable_ids": [vid]}}
+        (await client.post("/runs", json=run)).raise_for_status()
+    return ids
+
+
+async def one(client: httpx.AsyncClient, ids: list, rng: random.Random, writes: float) -> str:
+    vid = rng.choice(ids)
+    if rng.random() < writes:
+        r = await client.patch(f"/variables/{vid}", json={"confidence": round(rng.random(), 3)})
+        r.raise_for_status()
+        return "write"
+    roll = rng.random()
+    if roll < 0.25:
+        r = await client.get(f"/variables/{vid}/children")
+    elif roll < 0.5:
+        r = await client.get("/runs", params={"variable_id": vid})
+    elif roll < 0.75:
+        r = await client.get("/relationships", params={"source_variable_id": vid, "skip": rng.randrange(5)})
+    else:
+        r = await client.get(f"/variables/{vid}")
+    r.raise_for_status()
+    return "read"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--variables", type=int, default=500)
+    parser.add_argument("--writes", type=float, default=0.2, help="share of write requests")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        ids = await seed(client, args.variables)
+        rng = random.Random(0)
+        latencies = {"read": [], "write": []}
+        remaining = args.requests
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                kind = await one(client, ids, rng, args.writes)
+                latencies[kind].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.0f} req/s")
+    for kind, values in latencies.items():
+        if values:
+            q = statistics.quantiles(values, n=100)
+            print(f"  {kind:5s} n={len(values):5d}  p50={q[49] * 1000:.1f} ms  p95={q[94] * 1000:.1f} ms  p99={q[98] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
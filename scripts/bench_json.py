@@ -0,0 +1,72 @@
+"""Serialization cost of a large DOE response, old path vs fast_json.
+
+    python scripts/bench_json.py --points 5000 --variables 8
+
+Old path: build DoEResponse, let FastAPI re-validate it against the
+response_model and run jsonable_encoder + json.dumps (what a handler
+returning the model did). New path: the plain dict payload through
+fast_json.dumps, in the rows and the columns layout. No server involved;
+this measures only the part of the request the change affects.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from backend.app.api.experiments import DoEResponse  # noqa: E402
+from backend.app.api.fast_json import dumps, orjson  # noqa: E402
+from backend.app.experiment_compute import doe_points, point_rows  # noqa: E402
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--variables", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ids = list(range(1, args.variables + 1))
+    keys = [str(i) for i in ids]
+    bounds = [(0.0, float(i)) for i in ids]
+    values = doe_points("sobol", bounds, args.points, 0)
+    meta = {"variable_order": ids, "domain": {k: {"min": lo, "max": hi} for k, (lo, hi) in zip(keys, bounds)}}
+
+    def old() -> bytes:
+        model = DoEResponse(method="sobol", n_points=args.points, variable_ids=ids, points=point_rows(keys, values), meta=meta)
+        # FastAPI's serialize_response: validate against response_model, then encode
+        validated = DoEResponse.model_validate(model.model_dump())
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    def rows() -> bytes:
+        payload = {"method": "sobol", "n_points": args.points, "variable_ids": ids, "meta": meta}
+        return dumps({**payload, "points": point_rows(keys, values)})
+
+    def columns() -> bytes:
+        payload = {"method": "sobol", "n_points": args.points, "variable_ids": ids, "meta": meta, "points": []}
+        return dumps({**payload, "columns": {"variable_ids": ids, "values": values}})
+
+    print(f"{args.points} points x {args.variables} variables, serializer: {'orjson' if orjson else 'pydantic-core'}")
+    baseline = best_of(old, args.repeat)
+    for name, fn in (("model + jsonable_encoder", old), ("fast_json rows", rows), ("fast_json columns", columns)):
+        elapsed = best_of(fn, args.repeat) if fn is not old else baseline
+        print(f"  {name:26s} {elapsed * 1000:8.1f} ms  {len(fn()) / 1024:8.0f} KiB  x{baseline / elapsed:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from backend.app.main import app
+from backend.app.db_base import Base
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
+
+
+@pytest.fixture
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    from backend.app.models import variable as _variable  # noqa: F401
+    from backend.app.models import relationship as _relationship  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as c:
+        yield c
+
+    Base.metadata.drop_all(bind=engine)
+    app.dependency_overrides.clear()
+
+
+
+
+def test_change_feed_cursor_and_events(client: TestClient):
+    cursor = client.get("/changes").json()["cursor"]
+
+    var_id = client.post("/variables", json={"name": "feed", "unit": "s"}).json()["id"]
+    client.patch(f"/variables/{var_id}", json={"unit": "ms", "name": "feed"})
+    other = client.post("/variables", json={"name": "feed2"}).json()["id"]
+    rel_id = client.post("/relationships", json={"source_variable_id": var_id, "target_variable_id": other}).json()["id"]
+    client.delete(f"/relationships/{rel_id}")
+    client.post("/variables/bulk", json={"items": [{"name": "feed3"}]})
+
+    data = client.get("/changes", params={"since": cursor}).json()
+    assert data["reset"] is False
+    ops = [(e["entity"], e["op"], e["id"]) for e in data["events"]]
+    assert ops == [
+        ("variables", "create", var_id),
+        ("variables", "update", var_id),
+        ("variables", "create", other),
+        ("relationships", "create", rel_id),
+        ("relationships", "delete", rel_id),
+        ("variables", "bulk", None),
+    ]
+    update = data["events"][1]
+    assert update["fields"] == ["unit"]
+    assert update["values"]["unit"] == "ms" and "name" not in update["values"]
+    versions = [e["version"] for e in data["events"]]
+    assert versions == sorted(versions)
+
+    # resume from the returned cursor: nothing new
+    assert client.get("/changes", params={"since": data["cursor"]}).json()["events"] == []
+    # paging keeps versions whole
+    page = client.get("/changes", params={"since": cursor, "limit": 2}).json()
+    assert len(page["events"]) == 2
+    rest = client.get("/changes", params={"since": page["cursor"]}).json()
+    assert len(rest["events"]) == 4
+
+    # cursors of another process (or garbage) ask the client to reload
+    assert client.get("/changes", params={"since": "deadbeef-3"}).json()["reset"] is True
+
+
+def test_change_feed_ring_buffer_and_stream():
+    import asyncio
+
+    from backend.app.api.changes import stream_changes
+    from backend.app.change_feed import ChangeFeed
+
+    feed = ChangeFeed(0, size=3)
+    for v in range(1, 6):
+        feed.append(v, [{"version": v, "entity": "variables", "op": "create", "id": v}])
+    assert feed.read(1, 10)[0] is True  # version 2 was dropped
+    reset, events, version = feed.read(2, 10)
+    assert not reset and [e["id"] for e in events] == [3, 4, 5] and version == 5
+
+    async def collect():
+        calls = 0
+
+        async def disconnected():
+            nonlocal calls
+            calls += 1
+            return calls > 2
+
+        messages = []
+        gen = stream_changes(feed, 4, disconnected, keepalive=0.05)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, feed.append, 6, [{"version": 6, "entity": "variables", "op": "delete", "id": 6}])
+        async for message in gen:
+            messages.append(message)
+        return messages
+
+    messages = asyncio.run(collect())
+    changes = [m for m in messages if m.startswith("id:")]
+    assert len(changes) == 2
+    assert "event: change" in changes[0] and '"id":5' in changes[0]
+    assert '"op":"delete"' in changes[1]
+    assert feed._waiters == []
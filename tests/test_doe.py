@@ -1,21 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from backend.app.main import app
 from backend.app.db_base import Base
-from backend.app.deps import get_db
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
 
 
 @pytest.fixture
-def client():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # Import models so tables exist
@@ -31,7 +33,12 @@ def client():
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
         yield c
 
@@ -83,3 +90,124 @@ def test_doe_rejects_missing_domain(client: TestClient):
         json={"variable_ids": [vid], "n_points": 4, "method": "sobol"},
     )
     assert resp.status_code == 422
+
+
+def test_doe_selection_picks_upstream_inputs(client: TestClient):
+    kpi = client.post("/variables", json={"name": "kpi", "variable_type": "business_kpi"}).json()["id"]
+    a = _create_var(client, "a", 0.0, 1.0)
+    b = _create_var(client, "b", 0.0, 2.0)
+    c = _create_var(client, "c", 0.0, 3.0)
+    unsafe = client.post("/variables", json={"name": "no_domain"}).json()["id"]
+    const = client.post(
+        "/variables", json={"name": "g", "variable_type": "physical_constant", "min_value": 9.0, "max_value": 10.0}
+    ).json()["id"]
+    far = _create_var(client, "far", 0.0, 1.0)
+    items = [
+        {"source_variable_id": s, "target_variable_id": t, "relationship_type": "drives", "confidence": conf}
+        for s, t, conf in [(a, kpi, 0.9), (b, kpi, 0.3), (c, a, 0.9), (unsafe, kpi, 0.9), (const, kpi, 0.9), (far, c, 0.9)]
+    ]
+    assert client.post("/relationships/bulk", json={"items": items}).json()["errors"] == []
+
+    selection = {"target_id": kpi, "max_depth": 2, "max_variables": 5}
+    resp = client.post("/experiments/doe", json={"selection": selection, "n_points": 4, "seed": 1})
+    assert resp.status_code == 200
+    data = resp.json()
+    # physical constants and variables without a domain are not inputs; `far` is 3 hops away
+    assert data["variable_ids"][0] == a
+    assert set(data["variable_ids"]) == {a, b, c}
+    assert data["meta"]["selection"]["skipped_unsafe_ids"] == [unsafe]
+    assert all(set(p) == {str(a), str(b), str(c)} for p in data["points"])
+
+    resp = client.post("/experiments/doe", json={"selection": {**selection, "max_variables": 1}, "n_points": 4})
+    assert resp.json()["variable_ids"] == [a]
+
+    # a target without usable inputs, and both variable_ids and selection at once
+    assert client.post("/experiments/doe", json={"selection": {"target_id": far}}).status_code == 422
+    assert client.post("/experiments/doe", json={"selection": selection, "variable_ids": [a]}).status_code == 422
+    assert client.post("/experiments/doe", json={"selection": {"target_id": 9999}}).status_code == 404
+
+
+def test_doe_admission_control(client: TestClient, monkeypatch):
+    from backend.app import compute
+
+    v1 = _create_var(client, "adm", 0.0, 1.0)
+    body = {"variable_ids": [v1], "n_points": 4, "method": "lhs"}
+    resp = client.post("/experiments/doe", json=body)
+    assert resp.status_code == 200
+    assert resp.headers["Server-Timing"].startswith("queue;dur=")
+
+    # one slot, no queue, and the slot is taken
+    busy = compute.Limiter("doe", max_concurrent=1, max_queue=0)
+    busy.running = 1
+    monkeypatch.setitem(compute._limiters, "doe", busy)
+    resp = client.post("/experiments/doe", json=body)
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+
+    stats = client.get("/experiments/metrics").json()["endpoints"]["doe"]
+    assert stats["rejected"] == 1 and stats["admitted"] == 0
+
+
+def test_doe_columns_layout_matches_rows(client: TestClient):
+    v1 = _create_var(client, "c1", 0.0, 10.0)
+    v2 = _create_var(client, "c2", -5.0, 5.0)
+    body = {"variable_ids": [v1, v2], "n_points": 16, "method": "sobol", "seed": 7}
+
+    rows = client.post("/experiments/doe", json=body, params={"reuse": "false"}).json()
+    resp = client.post("/experiments/doe", json=body, params={"reuse": "false", "layout": "columns"})
+    assert resp.status_code == 200
+    assert resp.headers["Server-Timing"].startswith("queue;dur=")
+    data = resp.json()
+    assert data["points"] == []
+    assert data["columns"]["variable_ids"] == [v1, v2]
+    assert data["columns"]["values"] == [[p[str(v1)], p[str(v2)]] for p in rows["points"]]
+
+    # a stored run comes back in the requested layout too
+    assert client.post("/experiments/doe", json=body, params={"persist": "true"}).status_code == 200
+    reused = client.post("/experiments/doe", json=body, params={"layout": "columns"})
+    assert "X-Run-Reused" in reused.headers
+    assert reused.json()["columns"] == data["columns"]
+
+
+def test_compute_pool_recovers_from_worker_crash(client: TestClient, monkeypatch):
+    import os
+
+    from backend.app import compute
+
+    if compute.get_pool() is None:
+        pytest.skip("COMPUTE_WORKERS=0: computations run in the test process")
+    lim = compute.Limiter("crash", max_concurrent=1, max_queue=0)
+    with pytest.raises(compute.WorkerLost):
+        lim.run(os._exit, 1)
+    assert lim.stats()["failed"] == 1
+    # the broken pool was replaced: later requests work again
+    assert lim.run(abs, -3)[0] == 3
+    v1 = _create_var(client, "after_crash", 0.0, 1.0)
+    assert client.post("/experiments/doe", json={"variable_ids": [v1], "n_points": 4, "method": "lhs"}).status_code == 200
+
+    def lost(self, fn, *args):
+        raise compute.WorkerLost("compute worker died")
+
+    monkeypatch.setattr(compute.Limiter, "run", lost)
+    assert client.post("/experiments/doe", json={"variable_ids": [v1], "n_points": 4, "method": "lhs"}).status_code == 503
+
+
+def test_doe_invalid_stored_run_is_recomputed(client: TestClient):
+    from backend.app.models.experiment_run import ExperimentRun
+
+    v1 = _create_var(client, "stored1", 0.0, 1.0)
+    v2 = _create_var(client, "stored2", 0.0, 1.0)
+    body = {"variable_ids": [v1, v2], "n_points": 4, "method": "sobol", "seed": 3}
+    run_id = client.post("/experiments/doe", json=body, params={"persist": "true"}).json()["run_id"]
+
+    # a stored point lost a variable: validated on reuse, so the result is recomputed
+    db = next(app.dependency_overrides[get_db]())
+    run = db.get(ExperimentRun, run_id)
+    run.response_json = {**run.response_json, "points": [{str(v1): 0.5}] * 4}
+    db.commit()
+    db.close()
+
+    resp = client.post("/experiments/doe", json=body, params={"layout": "columns"})
+    assert resp.status_code == 200
+    assert "X-Run-Reused" not in resp.headers
+    assert len(resp.json()["columns"]["values"]) == 4
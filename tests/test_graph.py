@@ -0,0 +1,234 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from backend.app.main import app
+from backend.app.db_base import Base
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
+
+
+@pytest.fixture
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    from backend.app.models import variable as _variable  # noqa: F401
+    from backend.app.models import relationship as _relationship  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as c:
+        yield c
+
+    Base.metadata.drop_all(bind=engine)
+    app.dependency_overrides.clear()
+
+
+def _create_vars(client: TestClient, n: int, prefix: str = "g") -> list:
+    r = client.post("/variables/bulk", json={"items": [{"name": f"{prefix}{i}", "layer_level": i % 3} for i in range(n)]})
+    assert r.status_code == 200
+    return r.json()["created_ids"]
+
+
+def _link(client: TestClient, edges, **extra) -> list:
+    items = [{"source_variable_id": s, "target_variable_id": t, **extra} for s, t in edges]
+    r = client.post("/relationships/bulk", json={"items": items})
+    assert r.json()["errors"] == []
+    return r.json()["created_ids"]
+
+
+def test_graph_snapshot_and_etag(client: TestClient):
+    ids = _create_vars(client, 3)
+    _link(client, [(ids[0], ids[1]), (ids[1], ids[2])], relationship_type="drives")
+
+    r = client.get("/graph")
+    assert r.status_code == 200
+    data = r.json()
+    etag = r.headers["ETag"]
+    assert len(data["variables"]["rows"]) == 3
+    assert len(data["relationships"]["rows"]) == 2
+    type_col = data["relationships"]["columns"].index("relationship_type")
+    assert data["enums"]["relationship_type"][data["relationships"]["rows"][0][type_col]] == "drives"
+
+    r = client.get("/graph", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+    # any variable write bumps the graph version
+    client.delete(f"/variables/{ids[2]}")
+    r = client.get("/graph", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    data = r.json()
+    assert len(data["variables"]["rows"]) == 2
+    assert len(data["relationships"]["rows"]) == 1
+    assert data["version"] > 0
+
+
+def test_upstream_downstream_reachability(client: TestClient):
+    a, b, c, d, e = _create_vars(client, 5)
+    _link(client, [(a, b), (b, c), (c, d)], relationship_type="drives")
+    _link(client, [(e, c)], relationship_type="correlates_with")
+
+    r = client.get(f"/graph/variables/{d}/upstream", params={"max_depth": 2})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["direction"] == "upstream"
+    assert [(n["id"], n["depth"]) for n in data["nodes"]] == [(d, 0), (c, 1), (b, 2), (e, 2)]
+    assert len(data["relationships"]) == 3
+
+    r = client.get(f"/graph/variables/{d}/upstream", params={"max_depth": 5, "relationship_type": "drives"})
+    assert [n["id"] for n in r.json()["nodes"]] == [d, c, b, a]
+
+    r = client.get(f"/graph/variables/{a}/downstream")
+    assert [(n["id"], n["depth"]) for n in r.json()["nodes"]] == [(a, 0), (b, 1), (c, 2), (d, 3)]
+
+    # soft-deleted variables cut the traversal
+    client.delete(f"/variables/{b}")
+    r = client.get(f"/graph/variables/{a}/downstream")
+    assert [n["id"] for n in r.json()["nodes"]] == [a]
+    assert r.json()["relationships"] == []
+
+    assert client.get(f"/graph/variables/{b}/downstream").status_code == 404
+
+
+def test_graph_layout_layers_and_incremental(client: TestClient):
+    ids = _create_vars(client, 6)  # layer_level 0, 1, 2, 0, 1, 2
+    # two chains ids[0] -> ids[4] -> ids[2] and ids[3] -> ids[1] -> ids[5]; by id they cross twice
+    _link(client, [(ids[0], ids[4]), (ids[4], ids[2]), (ids[3], ids[1]), (ids[1], ids[5])], relationship_type="drives")
+
+    r = client.get("/graph/layout", params={"x_gap": 100, "y_gap": 50})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["incremental"] is False
+    pos = {n["id"]: (n["x"], n["y"]) for n in data["nodes"]}
+    assert [pos[i][1] for i in ids] == [0, 50, 100, 0, 50, 100]
+    assert len({pos[i] for i in ids}) == 6
+    # the barycenter sweeps remove the crossings: both chains keep one side in every layer
+    left = pos[ids[0]][0] < pos[ids[3]][0]
+    assert (pos[ids[4]][0] < pos[ids[1]][0]) == left
+    assert (pos[ids[2]][0] < pos[ids[5]][0]) == left
+
+    etag = r.headers["ETag"]
+    assert client.get("/graph/layout", params={"x_gap": 100, "y_gap": 50}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/graph/layout", headers={"If-None-Match": etag}).status_code == 200
+
+    # edits that do not touch the structure keep the layout as it is
+    client.patch(f"/variables/{ids[0]}", json={"name": "renamed"})
+    r = client.get("/graph/layout", params={"x_gap": 100, "y_gap": 50})
+    assert r.headers["ETag"] != etag
+    assert r.json()["incremental"] is True
+    assert {n["id"]: (n["x"], n["y"]) for n in r.json()["nodes"]} == pos
+
+    # small structural edits are warm-started from the previous layout
+    new = _create_vars(client, 1, prefix="extra")[0]
+    r = client.get("/graph/layout")
+    assert r.json()["incremental"] is True
+    assert {n["id"] for n in r.json()["nodes"]} == set(ids) | {new}
+
+    # wide layers wrap into rows of max_row nodes
+    r = client.get("/graph/layout", params={"max_row": 1, "y_gap": 10})
+    ys = sorted({n["y"] for n in r.json()["nodes"]})
+    assert ys == [0, 10, 20, 30, 40, 50, 60]
+
+
+def test_graph_rankings_towards_kpi(client: TestClient):
+    a, b, c, kpi, other, lone = _create_vars(client, 6)
+    _link(client, [(a, b), (b, kpi)], relationship_type="drives", confidence=0.9, direction="positive")
+    _link(client, [(c, kpi)], relationship_type="influences", confidence=0.2, direction="unknown")
+    _link(client, [(other, a)], relationship_type="influences", confidence=0.5, direction="negative")
+
+    r = client.get("/graph/rankings", params={"target_id": kpi})
+    assert r.status_code == 200
+    # only the requested metrics are computed
+    assert {item["reach"] for item in r.json()["items"]} == {None}
+    r = client.get("/graph/rankings", params={"target_id": kpi, "include": ["reach", "betweenness"]})
+    data = r.json()
+    ranked = [item["id"] for item in data["items"]]
+    # strong direct cause first; the weak unknown-sign edge counts least
+    assert ranked[0] == b
+    assert set(ranked) == {a, b, c, other}
+    assert ranked.index(a) < ranked.index(c)
+    assert lone not in ranked and kpi not in ranked
+
+    items = {item["id"]: item for item in data["items"]}
+    assert items[a]["out_degree"] == 0.9
+    assert items[other]["reach"] == 3
+    # b lies on both a -> kpi and other -> kpi shortest paths
+    assert items[b]["betweenness"] > items[c]["betweenness"] == 0
+
+    r = client.get("/graph/rankings", params={"sort": "reach", "limit": 2})
+    assert [item["id"] for item in r.json()["items"]] == [other, a]
+    assert r.json()["total"] == 6
+    assert r.json()["items"][0]["betweenness"] is None
+
+    assert client.get("/graph/rankings", params={"target_id": 10**6}).status_code == 404
+
+
+def test_reach_estimate_tracks_exact_reach():
+    from scipy.sparse import random as sparse_random
+
+    from backend.app.graph_rankings import reach, reach_estimate
+
+    adjacency = sparse_random(3000, 3000, density=3 / 1000, format="csr", random_state=1)
+    exact = reach(adjacency[:500, :500] + adjacency[500:1000, 500:1000], 4)
+    estimate = reach_estimate(adjacency[:500, :500] + adjacency[500:1000, 500:1000], 4)
+    big = exact > 200
+    assert big.any()
+    assert np.median(np.abs(estimate[big] - exact[big]) / exact[big]) < 0.15
+    assert np.abs(estimate[exact <= 5] - exact[exact <= 5]).max() <= 2
+    assert reach(adjacency, 4).shape == (3000,)
+
+
+def test_strongest_paths_by_confidence(client: TestClient):
+    a, b, c, d, e = _create_vars(client, 5)
+    # a -> b -> d: 0.9 * 0.9 = 0.81; a -> d: 0.7; a -> c -> d: 0.8 * 0.5 = 0.4
+    direct = _link(client, [(a, d)], relationship_type="drives", confidence=0.7)
+    chain = _link(client, [(a, b), (b, d)], relationship_type="influences", confidence=0.9)
+    _link(client, [(a, c)], relationship_type="drives", confidence=0.8)
+    _link(client, [(c, d)], relationship_type="drives", confidence=0.5)
+    _link(client, [(e, d)], relationship_type="correlates_with", confidence=1.0)
+
+    r = client.get("/graph/paths", params={"source_id": a, "target_id": d, "k": 5})
+    assert r.status_code == 200
+    paths = r.json()["paths"]
+    assert [p["variable_ids"] for p in paths] == [[a, b, d], [a, d], [a, c, d]]
+    assert [round(p["confidence"], 6) for p in paths] == [0.81, 0.7, 0.4]
+    assert [rel["id"] for rel in paths[0]["relationships"]] == chain
+    assert [rel["id"] for rel in paths[1]["relationships"]] == direct
+
+    # correlations are only used when asked for, and then in both directions
+    r = client.get("/graph/paths", params={"source_id": a, "target_id": e})
+    assert r.json()["paths"] == []
+    r = client.get(
+        "/graph/paths",
+        params={"source_id": a, "target_id": e, "k": 1, "relationship_type": ["drives", "influences", "correlates_with"]},
+    )
+    assert r.json()["paths"][0]["variable_ids"] == [a, b, d, e]
+
+    # soft-deleted variables break chains
+    client.delete(f"/variables/{b}")
+    r = client.get("/graph/paths", params={"source_id": a, "target_id": d})
+    assert [p["variable_ids"] for p in r.json()["paths"]] == [[a, d], [a, c, d]]
+    assert client.get("/graph/paths", params={"source_id": b, "target_id": d}).status_code == 404
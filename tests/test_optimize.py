@@ -1,21 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from backend.app.main import app
 from backend.app.db_base import Base
-from backend.app.deps import get_db
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
 
 
 @pytest.fixture
-def client():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     from backend.app.models import variable as _variable  # noqa: F401
@@ -30,7 +32,12 @@ def client():
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
         yield c
 
@@ -186,3 +193,28 @@ def test_optimize_rejects_invalid_linear_normalize(client: TestClient):
         },
     )
     assert resp.status_code == 422
+
+
+def test_optimize_selection_adds_objective_variable(client: TestClient):
+    kpi = _create_var(client, "kpi", 0.0, 100.0)
+    a = _create_var(client, "s1", 0.0, 1.0)
+    b = _create_var(client, "s2", 0.0, 1.0)
+    items = [
+        {"source_variable_id": s, "target_variable_id": kpi, "relationship_type": "influences", "confidence": conf}
+        for s, conf in [(a, 0.4), (b, 0.8)]
+    ]
+    assert client.post("/relationships/bulk", json={"items": items}).json()["errors"] == []
+
+    resp = client.post(
+        "/experiments/optimize",
+        json={
+            "selection": {"target_id": kpi},
+            "n_iter": 3,
+            "seed": 7,
+            "objective": {"kind": "maximize_variable", "variable_id": kpi},
+        },
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["variable_ids"] == [b, a, kpi]
+    assert [s["id"] for s in data["meta"]["selection"]["selected"]] == [b, a]
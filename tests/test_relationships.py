@@ -0,0 +1,306 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from backend.app.main import app
+from backend.app.db_base import Base
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
+
+
+@pytest.fixture
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    from backend.app.models import variable as _variable  # noqa: F401
+    from backend.app.models import relationship as _relationship  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as c:
+        yield c
+
+    Base.metadata.drop_all(bind=engine)
+    app.dependency_overrides.clear()
+
+
+def _create_vars(client: TestClient, n: int, prefix: str = "v") -> list:
+    r = client.post("/variables/bulk", json={"items": [{"name": f"{prefix}{i}"} for i in range(n)]})
+    assert r.status_code == 200
+    return r.json()["created_ids"]
+
+
+def test_bulk_relationships_set_based_validation(client: TestClient):
+    ids = _create_vars(client, 5)
+    r = client.post("/relationships", json={"source_variable_id": ids[0], "target_variable_id": ids[1]})
+    assert r.status_code == 201
+    client.delete(f"/variables/{ids[4]}")
+
+    items = [
+        {"source_variable_id": ids[1], "target_variable_id": ids[2], "confidence": 0.9},
+        {"source_variable_id": ids[2], "target_variable_id": ids[3], "relationship_type": "drives"},
+        {"source_variable_id": ids[0], "target_variable_id": ids[1]},  # exists already
+        {"source_variable_id": ids[1], "target_variable_id": ids[2]},  # duplicate within batch
+        {"source_variable_id": ids[3], "target_variable_id": ids[3]},  # self reference
+        {"source_variable_id": ids[3], "target_variable_id": ids[4]},  # inactive target
+        {"source_variable_id": ids[3], "target_variable_id": 99999},  # missing target
+    ]
+    r = client.post("/relationships/bulk", json={"items": items})
+    assert r.status_code == 200
+    data = r.json()
+    assert len(data["created_ids"]) == 2
+    assert [e["row"] for e in data["errors"]] == [2, 3, 4, 5, 6]
+
+    listed = client.get("/relationships").json()
+    assert listed["total"] == 3
+
+
+def test_bulk_relationships_all_or_nothing(client: TestClient):
+    ids = _create_vars(client, 3)
+    items = [
+        {"source_variable_id": ids[0], "target_variable_id": ids[1]},
+        {"source_variable_id": ids[1], "target_variable_id": 12345},
+    ]
+    r = client.post("/relationships/bulk", json={"items": items, "all_or_nothing": True})
+    assert r.json()["created_ids"] == []
+    assert client.get("/relationships").json()["total"] == 0
+
+
+def test_variable_relationship_lists_follow_writes(client: TestClient):
+    ids = _create_vars(client, 4)
+    r1 = client.post("/relationships", json={"source_variable_id": ids[0], "target_variable_id": ids[1]}).json()
+    # first read builds the index
+    assert [r["id"] for r in client.get(f"/relationships/variable/{ids[0]}/outgoing").json()] == [r1["id"]]
+
+    # single-row writes update the index in place
+    r2 = client.post("/relationships", json={"source_variable_id": ids[2], "target_variable_id": ids[0]}).json()
+    client.patch(f"/relationships/{r1['id']}", json={"confidence": 0.9})
+    out = client.get(f"/relationships/variable/{ids[0]}/outgoing").json()
+    assert out[0]["confidence"] == 0.9
+    assert [r["id"] for r in client.get(f"/relationships/variable/{ids[0]}/incoming").json()] == [r2["id"]]
+    assert [r["id"] for r in client.get(f"/relationships/variable/{ids[0]}/all").json()] == [r1["id"], r2["id"]]
+
+    client.delete(f"/relationships/{r1['id']}")
+    assert client.get(f"/relationships/variable/{ids[0]}/outgoing").json() == []
+    inactive = client.get(f"/relationships/variable/{ids[0]}/outgoing?include_inactive=true").json()
+    assert [r["id"] for r in inactive] == [r1["id"]]
+    client.post(f"/relationships/{r1['id']}/restore")
+    assert len(client.get(f"/relationships/variable/{ids[0]}/outgoing").json()) == 1
+
+    # bulk writes invalidate the index, which is rebuilt on the next read
+    client.post("/relationships/bulk", json={"items": [{"source_variable_id": ids[0], "target_variable_id": ids[3]}]})
+    assert len(client.get(f"/relationships/variable/{ids[0]}/outgoing").json()) == 2
+
+    client.delete(f"/variables/{ids[3]}")
+    assert client.get(f"/relationships/variable/{ids[3]}/incoming").status_code == 404
+
+
+def test_duplicate_relationship_rejected_by_index(client: TestClient):
+    a = client.post("/variables", json={"name": "dup_a"}).json()["id"]
+    b = client.post("/variables", json={"name": "dup_b"}).json()["id"]
+    first = client.post("/relationships", json={"source_variable_id": a, "target_variable_id": b})
+    assert first.status_code == 201
+    r = client.post("/relationships", json={"source_variable_id": a, "target_variable_id": b})
+    assert r.status_code == 409
+    assert r.json()["detail"] == f"Relationship from variable {a} to {b} already exists"
+    assert client.post("/relationships", json={"source_variable_id": a, "target_variable_id": 10**6}).status_code == 404
+
+    client.delete(f"/relationships/{first.json()['id']}")
+    assert client.post("/relationships", json={"source_variable_id": a, "target_variable_id": b}).status_code == 201
+    assert client.post(f"/relationships/{first.json()['id']}/restore").status_code == 409
+
+
+def test_graph_index_compaction():
+    from backend.app.graph_index import GraphIndex
+
+    def rec(rid, s, t):
+        return {
+            "id": rid, "source_variable_id": s, "target_variable_id": t, "relationship_type": "drives",
+            "direction": "positive", "shape": "linear", "confidence": 0.5, "is_active": True,
+        }
+
+    idx = GraphIndex(1, range(1, 1000), [rec(1, 1, 2)])
+    for i in range(2, 600):
+        idx.apply_relationship(rec(i, 1, i + 1))
+    idx.apply_relationship({**rec(5, 1, 6), "is_active": False})
+    assert idx.edge_count == 598
+    assert len(idx.outgoing(1)) == 598
+    assert [r["id"] for r in idx.incoming(7)] == [6]
+
+
+def test_enforce_acyclic_rejects_cycles(client: TestClient):
+    a, b, c, d = _create_vars(client, 4)
+    for s, t in [(a, b), (b, c)]:
+        r = client.post("/relationships", params={"enforce_acyclic": True},
+                        json={"source_variable_id": s, "target_variable_id": t, "relationship_type": "drives"})
+        assert r.status_code == 201
+
+    r = client.post("/relationships", params={"enforce_acyclic": True},
+                    json={"source_variable_id": c, "target_variable_id": a, "relationship_type": "influences"})
+    assert r.status_code == 409
+    assert r.json()["detail"]["reason"] == "cycle"
+    assert r.json()["detail"]["cycle"] == [c, a, b, c]
+
+    # correlations are undirected, and enforcement is opt-in
+    r = client.post("/relationships", params={"enforce_acyclic": True},
+                    json={"source_variable_id": c, "target_variable_id": a, "relationship_type": "correlates_with"})
+    assert r.status_code == 201
+    corr_id = r.json()["id"]
+    r = client.patch(f"/relationships/{corr_id}", params={"enforce_acyclic": True}, json={"relationship_type": "drives"})
+    assert r.status_code == 409
+
+    # bulk: earlier rows of the batch count for later ones
+    items = [
+        {"source_variable_id": c, "target_variable_id": d, "relationship_type": "drives"},
+        {"source_variable_id": d, "target_variable_id": b, "relationship_type": "drives"},
+        {"source_variable_id": d, "target_variable_id": a, "relationship_type": "correlates_with"},
+    ]
+    r = client.post("/relationships/bulk", json={"items": items, "enforce_acyclic": True})
+    data = r.json()
+    assert len(data["created_ids"]) == 2
+    assert [e["row"] for e in data["errors"]] == [1]
+    assert "cycle" in data["errors"][0]["errors"][0]
+
+    # without enforcement the cycle is stored, and validation reports it
+    r = client.post("/relationships", json={"source_variable_id": d, "target_variable_id": b, "relationship_type": "drives"})
+    assert r.status_code == 201
+    back_edge = r.json()["id"]
+    r = client.get("/graph/validate")
+    assert r.json()["acyclic"] is False
+    assert r.json()["cycles"][0]["variable_ids"] == sorted([b, c, d])
+
+    # once cyclic, checks fall back to plain reachability; removing the edge restores the order
+    r = client.post("/relationships", params={"enforce_acyclic": True},
+                    json={"source_variable_id": d, "target_variable_id": a, "relationship_type": "drives"})
+    assert r.status_code == 409
+    client.delete(f"/relationships/{back_edge}")
+    assert client.get("/graph/validate").json()["acyclic"] is True
+    r = client.post("/relationships", params={"enforce_acyclic": True},
+                    json={"source_variable_id": a, "target_variable_id": d, "relationship_type": "drives"})
+    assert r.status_code == 201
+
+
+def test_incremental_order_matches_reachability():
+    import random
+
+    from backend.app.graph_index import GraphIndex
+
+    def reaches(adj, start, goal):
+        seen, stack = {start}, [start]
+        while stack:
+            v = stack.pop()
+            if v == goal:
+                return True
+            for w in adj.get(v, ()):
+                if w not in seen:
+                    seen.add(w)
+                    stack.append(w)
+        return False
+
+    rng = random.Random(7)
+    n = 60
+    idx = GraphIndex(1, range(1, n + 1), [])
+    adj = {}
+    for rid in range(1, 400):
+        s, t = rng.sample(range(1, n + 1), 2)
+        if t in adj.get(s, ()):
+            continue
+        cycle = idx.check_acyclic([(s, t)])[0]
+        assert (cycle is not None) == reaches(adj, t, s)
+        if cycle is None:
+            idx.apply_relationship({
+                "id": rid, "source_variable_id": s, "target_variable_id": t, "relationship_type": "drives",
+                "direction": "positive", "shape": "linear", "confidence": 0.5, "is_active": True,
+            })
+            adj.setdefault(s, set()).add(t)
+        else:
+            assert cycle[0] == cycle[-1] == s and cycle[1] == t
+    assert idx.cyclic_components() == []
+
+
+def test_relationship_reads_include_variables_in_constant_queries(client: TestClient):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    r = client.post("/variables/bulk", json={"items": [
+        {"name": f"w{i}", "unit": "bar", "min_value": 0, "max_value": 10 + i} for i in range(12)
+    ]})
+    ids = r.json()["created_ids"]
+    items = [{"source_variable_id": ids[i], "target_variable_id": ids[i + 1]} for i in range(11)]
+    rel_ids = client.post("/relationships/bulk", json={"items": items}).json()["created_ids"]
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        r = client.get("/relationships", params={"include": "variables", "limit": 5})
+        page_queries = len(statements)
+        statements.clear()
+        detail = client.get(f"/relationships/{rel_ids[0]}").json()
+        detail_queries = len(statements)
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+
+    data = r.json()
+    assert data["total"] == 11 and len(data["items"]) == 5
+    first = data["items"][0]
+    assert first["source_variable_name"] == "w0" and first["target_variable_name"] == "w1"
+    assert first["target_variable_unit"] == "bar" and first["target_variable_max_value"] == 11
+    assert page_queries == 2  # count + page (with joined variables)
+    assert detail_queries == 1
+    assert detail["source_variable_min_value"] == 0
+
+    plain = client.get("/relationships", params={"limit": 5}).json()["items"][0]
+    assert "source_variable_name" not in plain
+
+
+def test_async_acyclic_guard_waits_for_a_sync_writer(client: TestClient):
+    import asyncio
+    import threading
+
+    from backend.app.graph_index import GraphIndex, _guard, acyclic_guard_async
+
+    async def scenario():
+        async for db in app.dependency_overrides[get_async_db]():
+            guard = _guard(db)
+            guard.acquire()  # a sync writer in the threadpool holds the guard
+            entered = asyncio.Event()
+
+            async def writer():
+                async with acyclic_guard_async(db) as index:
+                    assert isinstance(index, GraphIndex)
+                    entered.set()
+
+            task = asyncio.create_task(writer())
+            await asyncio.sleep(0.05)
+            # waiting does not block the event loop, and does not enter the guard
+            assert not entered.is_set()
+            threading.Thread(target=guard.release).start()
+            await asyncio.wait_for(task, 5)
+            assert entered.is_set() and not guard.locked()
+
+    asyncio.run(scenario())
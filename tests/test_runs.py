@@ -1,21 +1,24 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from backend.app.main import app
 from backend.app.db_base import Base
-from backend.app.deps import get_db
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
+from backend.app.versions import share_state
 
 
 @pytest.fixture
-def client():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     from backend.app.models import variable as _variable  # noqa: F401
@@ -31,7 +34,12 @@ def client():
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
         yield c
 
@@ -76,3 +84,255 @@ def test_runs_filter_by_type(client: TestClient):
     r = client.get("/runs?run_type=optimize")
     assert r.status_code == 200
     assert all(item["run_type"] == "optimize" for item in r.json()["items"])
+
+
+def test_runs_deduplicates_identical_bodies(client: TestClient):
+    body = {"run_type": "doe", "title": "same", "request_json": {"a": 1}, "response_json": {"b": [1, 2]}}
+    first = client.post("/runs", json=body).json()
+    second = client.post("/runs", json=body).json()
+    assert first["id"] == second["id"]
+
+    other = client.post("/runs", json={**body, "title": "renamed"}).json()
+    assert other["id"] != first["id"]
+
+
+def test_create_run_with_malformed_snapshots(client: TestClient):
+    body = {"run_type": "optimize", "request_json": {"variable_ids": "123", "objective": {"kind": 5}},
+            "response_json": {"meta": "x", "variable_ids": {"a": 1}}}
+    r = client.post("/runs", json=body)
+    assert r.status_code == 200
+    assert r.json()["objective_kind"] is None and r.json()["best_score"] is None
+    # nothing was indexed from the string of ids
+    for vid in (1, 2, 3, 123):
+        assert client.get("/runs", params={"variable_id": vid}).json()["total"] == 0
+
+
+def test_runs_idempotency_key(client: TestClient):
+    body = {"run_type": "optimize", "request_json": {"x": 1}, "response_json": {"y": 1}}
+    headers = {"Idempotency-Key": "retry-123"}
+    r1 = client.post("/runs", json=body, headers=headers)
+    r2 = client.post("/runs", json=body, headers=headers)
+    assert r1.status_code == 200 and r2.status_code == 200
+    assert r1.json()["id"] == r2.json()["id"]
+
+    r3 = client.post("/runs", json={**body, "response_json": {"y": 2}}, headers=headers)
+    assert r3.status_code == 409
+
+
+def test_runs_idempotency_key_on_deduplicated_and_deleted_runs(client: TestClient):
+    body = {"run_type": "doe", "request_json": {"x": 2}, "response_json": {"y": 2}}
+    plain = client.post("/runs", json=body).json()
+
+    # the body dedups to the existing run, which now carries the key
+    keyed = client.post("/runs", json=body, headers={"Idempotency-Key": "dedup-1"})
+    assert keyed.json()["id"] == plain["id"]
+    r = client.post("/runs", json={**body, "response_json": {"y": 3}}, headers={"Idempotency-Key": "dedup-1"})
+    assert r.status_code == 409 and r.json()["detail"]["run_id"] == plain["id"]
+
+    # a run that already holds another key is not shared: the new key gets its own row
+    other = client.post("/runs", json=body, headers={"Idempotency-Key": "dedup-2"}).json()
+    assert other["id"] != plain["id"]
+    assert client.post("/runs", json=body, headers={"Idempotency-Key": "dedup-2"}).json()["id"] == other["id"]
+
+    # retries with the key of a deleted run do not resurrect it
+    assert client.delete(f"/runs/{plain['id']}").status_code == 200
+    r = client.post("/runs", json=body, headers={"Idempotency-Key": "dedup-1"})
+    assert r.status_code == 409 and r.json()["detail"]["run_id"] == plain["id"]
+
+
+def test_seeded_doe_reuses_saved_run(client: TestClient):
+    vid = client.post("/variables", json={"name": "reuse_v", "min_value": 0.0, "max_value": 1.0}).json()["id"]
+    req = {"variable_ids": [vid], "n_points": 4, "method": "sobol", "seed": 7}
+
+    computed = client.post("/experiments/doe", json=req)
+    assert "X-Run-Reused" not in computed.headers
+    saved = client.post("/experiments/doe?persist=true", json=req).json()
+
+    again = client.post("/experiments/doe", json=req)
+    assert again.headers["X-Run-Reused"] == str(saved["run_id"])
+    assert again.json() == computed.json()
+
+    # changing the variable bounds changes the content address
+    client.patch(f"/variables/{vid}", json={"max_value": 2.0})
+    changed = client.post("/experiments/doe", json=req)
+    assert "X-Run-Reused" not in changed.headers
+
+
+def test_client_posted_run_is_never_reused(client: TestClient):
+    vid = client.post("/variables", json={"name": "planted_v", "min_value": 0.0, "max_value": 1.0}).json()["id"]
+    req = {"variable_ids": [vid], "n_points": 2, "method": "sobol", "seed": 11}
+    computed = client.post("/experiments/doe", json=req).json()
+    fake = {**computed, "points": [{str(vid): 0.5}, {str(vid): 0.5}]}
+    client.post("/runs", json={"run_type": "doe", "request_json": req, "response_json": fake})
+
+    again = client.post("/experiments/doe", json=req)
+    assert "X-Run-Reused" not in again.headers
+    assert again.json() == computed
+
+
+def test_doe_persist_returns_run_summary(client: TestClient):
+    vid = client.post("/variables", json={"name": "persist_v", "min_value": 0.0, "max_value": 1.0}).json()["id"]
+
+    r = client.post(
+        "/experiments/doe?persist=true&title=saved",
+        json={"variable_ids": [vid], "n_points": 5, "method": "lhs", "seed": 3},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert "points" not in data
+    assert data["run_type"] == "doe"
+    assert data["summary"]["n_points"] == 5
+
+    run = client.get(f"/runs/{data['run_id']}").json()
+    assert run["title"] == "saved"
+    assert len(run["response_json"]["points"]) == 5
+
+
+def test_optimize_persist_returns_run_summary(client: TestClient):
+    vid = client.post("/variables", json={"name": "persist_o", "min_value": 0.0, "max_value": 1.0}).json()["id"]
+
+    r = client.post(
+        "/experiments/optimize?persist=true",
+        json={
+            "variable_ids": [vid],
+            "n_iter": 4,
+            "seed": 1,
+            "objective": {"kind": "maximize_variable", "variable_id": vid},
+        },
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert "history" not in data
+    assert data["summary"]["history_length"] == 4
+    assert data["summary"]["best_score"] == data["summary"]["best_point"][str(vid)]
+
+
+def test_runs_compare_optimize_and_doe(client: TestClient):
+    v1 = client.post("/variables", json={"name": "cmp_a", "min_value": 0.0, "max_value": 1.0}).json()["id"]
+    v2 = client.post("/variables", json={"name": "cmp_b", "min_value": -1.0, "max_value": 1.0}).json()["id"]
+
+    opt_ids = []
+    for seed in (1, 2):
+        r = client.post(
+            "/experiments/optimize?persist=true",
+            json={
+                "variable_ids": [v1, v2],
+                "n_iter": 40,
+                "seed": seed,
+                "objective": {"kind": "maximize_variable", "variable_id": v1},
+            },
+        )
+        opt_ids.append(r.json()["run_id"])
+    doe_ids = []
+    for method in ("sobol", "lhs"):
+        r = client.post(
+            "/experiments/doe?persist=true",
+            json={"variable_ids": [v1, v2], "n_points": 16, "method": method, "seed": 5},
+        )
+        doe_ids.append(r.json()["run_id"])
+
+    ids = ",".join(str(i) for i in opt_ids + doe_ids)
+    r = client.get(f"/runs/compare?ids={ids}&curve_points=10")
+    assert r.status_code == 200
+    data = r.json()
+
+    opt = data["optimize"]
+    assert opt["baseline_id"] == opt_ids[0]
+    assert opt["best_score_delta"][str(opt_ids[0])] == 0.0
+    assert set(opt["best_point_delta"][str(opt_ids[1])]) == {str(v1), str(v2)}
+    curve = opt["convergence"][str(opt_ids[1])]
+    assert len(curve["best_so_far"]) == 10
+    assert curve["best_so_far"] == sorted(curve["best_so_far"])
+    assert curve["best_so_far"][-1] == opt["best_score"][str(opt_ids[1])]
+
+    shift = data["doe"]["shift"][str(doe_ids[1])][str(v1)]
+    assert 0.0 <= shift["ks_statistic"] <= 1.0
+    assert data["doe"]["shift"][str(doe_ids[0])][str(v1)]["mean_delta"] == 0.0
+
+
+def test_runs_compare_missing_run(client: TestClient):
+    r = client.post("/runs", json={"run_type": "doe", "request_json": {}, "response_json": {}})
+    r = client.get(f"/runs/compare?ids={r.json()['id']},9999")
+    assert r.status_code == 404
+
+
+@pytest.mark.parametrize("response_json, reason", [
+    ({"history": [{"1": 0.5}], "meta": {"objective": {"kind": "nope"}}}, "meta.objective"),
+    ({"variable_ids": [1], "history": [{"2": 0.5}]}, "missing variable 1"),
+    ({"variable_ids": [1], "best_point": {"1": "high"}}, "best_point.1"),
+    ({"meta": "x"}, "meta"),
+])
+def test_runs_compare_malformed_run(client: TestClient, response_json, reason):
+    ok = client.post("/runs", json={"run_type": "optimize", "response_json": {"variable_ids": [1]}}).json()["id"]
+    bad = client.post("/runs", json={"run_type": "optimize", "response_json": response_json}).json()["id"]
+    r = client.get(f"/runs/compare?ids={ok},{bad}")
+    assert r.status_code == 422
+    assert r.json()["detail"]["run_id"] == bad
+    assert reason in r.json()["detail"]["reason"]
+
+
+def test_runs_filter_by_variable_objective_and_score(client: TestClient):
+    def save(variable_ids, kind, best_score):
+        body = {
+            "run_type": "optimize",
+            "request_json": {"variable_ids": variable_ids, "objective": {"kind": kind}},
+            "response_json": {"variable_ids": variable_ids, "meta": {"best_score": best_score}},
+        }
+        return client.post("/runs", json=body).json()["id"]
+
+    a = save([17, 3], "linear", 0.5)
+    b = save([17], "linear", 2.0)
+    save([17], "maximize_variable", 9.0)
+    save([3], "linear", 5.0)
+
+    r = client.get("/runs?variable_id=17&objective_kind=linear&sort_by=best_score&order=desc")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["total"] == 2
+    assert [item["id"] for item in data["items"]] == [b, a]
+    assert data["items"][0]["best_score"] == 2.0
+
+    r = client.get("/runs?variable_id=17&variable_id=3")
+    assert [item["id"] for item in r.json()["items"]] == [a]
+
+    r = client.get("/runs?min_best_score=1&max_best_score=5&sort_by=best_score&order=asc")
+    assert [item["best_score"] for item in r.json()["items"]] == [2.0, 5.0]
+
+
+def test_get_endpoints_use_read_replica(client: TestClient, monkeypatch, tmp_path):
+    import dataclasses
+
+    from backend.app import database, deps
+
+    url = f"sqlite:///{tmp_path}/replica.db"
+    replica = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=replica)
+    db = next(app.dependency_overrides[get_db]())
+    primary = db.get_bind()
+    db.close()
+    # the replica engines share versions with the primary, as database.py sets them up
+    share_state(replica, primary, replica=True)
+    async_replica = create_async_engine_for(url, replica, poolclass=NullPool)
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=replica, autoflush=False))
+    monkeypatch.setitem(database._async_sessions, "read", async_sessionmaker(async_replica, expire_on_commit=False))
+
+    run = {"run_type": "doe", "title": "replicated", "request_json": {"x": 1}, "response_json": {"y": 2}}
+    run_id = client.post("/runs", json=run).json()["id"]
+    # right after a write, reads stay on the primary
+    assert client.get("/runs").json()["total"] == 1
+
+    # afterwards they go to the (here: empty, never replicated) replica; writes still hit the primary
+    monkeypatch.setattr(deps, "database_settings", dataclasses.replace(deps.database_settings, read_after_write_seconds=0))
+    assert client.get("/runs").json()["total"] == 0
+    assert client.get(f"/runs/{run_id}").status_code == 404
+    assert client.get("/runs/compare", params={"ids": f"{run_id},{run_id + 1}"}).status_code == 404
+    assert client.delete(f"/runs/{run_id}").status_code == 200
+
+    # replica pages are neither cached nor labelled with the (newer) version; indexes come from the primary
+    var_id = client.post("/variables", json={"name": "fresh"}).json()["id"]
+    stale = client.get("/variables")
+    assert stale.json()["total"] == 0 and "ETag" not in stale.headers
+    assert [h["id"] for h in client.get("/variables/search", params={"q": "fresh"}).json()["items"]] == [var_id]
+    assert client.get(f"/relationships/variable/{var_id}/all").status_code == 200
+    monkeypatch.setattr(database, "ReadSessionLocal", None)
+    assert client.get("/variables").json()["total"] == 1
@@ -1,21 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from backend.app.main import app
 from backend.app.db_base import Base
-from backend.app.deps import get_db
+from backend.app.database import create_async_engine_for
+from backend.app.deps import get_async_db, get_db
 
 
 @pytest.fixture
-def client():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def client(tmp_path):
+    # file-based: the sync and the async engine (async endpoints) share the database
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    async_engine = create_async_engine_for(url, engine, poolclass=NullPool)
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # Ensure models are imported so tables are registered on Base.metadata
@@ -31,7 +33,12 @@ def client():
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
@@ -56,6 +63,23 @@ def test_create_variable_duplicate(client):
     assert resp.status_code == 409
 
 
+def test_active_name_uniqueness_enforced_by_index(client):
+    first = client.post("/variables", json={"name": "reused"}).json()["id"]
+    other = client.post("/variables", json={"name": "other"}).json()["id"]
+    assert client.patch(f"/variables/{other}", json={"name": "reused"}).status_code == 409
+
+    # names of deleted variables can be taken again; restoring the old one then conflicts
+    client.delete(f"/variables/{first}")
+    resp = client.post("/variables", json={"name": "reused"})
+    assert resp.status_code == 201
+    assert client.post(f"/variables/{first}/restore").status_code == 409
+    assert client.get(f"/variables/{first}", params={"include_inactive": True}).json()["is_active"] is False
+
+    # bulk upsert only matches active names
+    r = client.post("/variables/bulk", json={"items": [{"name": "reused", "unit": "kg"}], "upsert": True})
+    assert r.json()["updated_ids"] == [resp.json()["id"]]
+
+
 def test_list_variables(client):
     client.post("/variables", json={"name": "a", "min_value": 0, "max_value": 2})
     client.post("/variables", json={"name": "b", "min_value": 1, "max_value": 3})
@@ -63,3 +87,336 @@ def test_list_variables(client):
     assert resp.status_code == 200
     data = resp.json()
     assert len(data["items"]) == 2
+
+
+def test_bulk_import_variables_reports_row_errors(client: TestClient):
+    parent = client.post("/variables", json={"name": "bulk_parent"}).json()["id"]
+    client.post("/variables", json={"name": "taken"})
+
+    items = [{"name": f"bulk_{i}", "min_value": 0, "max_value": i + 1, "parent_variable_id": parent} for i in range(250)]
+    items += [
+        {"name": "taken"},
+        {"name": "bulk_0"},
+        {"name": "bad_domain", "min_value": 5, "max_value": 1},
+        {"name": "orphan", "parent_variable_id": 99999},
+    ]
+    r = client.post("/variables/bulk", json={"items": items})
+    assert r.status_code == 200
+    data = r.json()
+    assert len(data["created_ids"]) == 250
+    assert [e["row"] for e in data["errors"]] == [250, 251, 252, 253]
+
+    listed = client.get("/variables", params={"parent_id": parent, "limit": 1000}).json()
+    assert listed["total"] == 250
+
+
+def test_bulk_import_variables_upsert_by_name(client: TestClient):
+    vid = client.post("/variables", json={"name": "calib", "min_value": 0, "max_value": 1, "unit": "mm"}).json()["id"]
+
+    r = client.post(
+        "/variables/bulk",
+        json={"upsert": True, "items": [{"name": "calib", "max_value": 5}, {"name": "fresh"}]},
+    )
+    data = r.json()
+    assert data["updated_ids"] == [vid]
+    assert len(data["created_ids"]) == 1
+
+    got = client.get(f"/variables/{vid}").json()
+    assert got["max_value"] == 5
+    assert got["unit"] == "mm"
+
+
+def test_bulk_import_all_or_nothing(client: TestClient):
+    r = client.post(
+        "/variables/bulk",
+        json={"all_or_nothing": True, "items": [{"name": "ok_row"}, {"name": ""}]},
+    )
+    assert r.json()["created_ids"] == []
+    assert client.get("/variables").json()["total"] == 0
+
+
+def test_bulk_upload_csv_and_ndjson(client: TestClient):
+    csv_body = "name,min_value,max_value,unit\ncsv_a,0,10,kg\ncsv_b,,,\n"
+    r = client.post("/variables/bulk/upload", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    assert len(r.json()["created_ids"]) == 2
+
+    ndjson_body = '{"name": "nd_a"}\n{"name": "nd_b", "confidence": 2}\n'
+    r = client.post("/variables/bulk/upload", content=ndjson_body, headers={"Content-Type": "application/x-ndjson"})
+    data = r.json()
+    assert len(data["created_ids"]) == 1
+    assert data["errors"][0]["row"] == 1
+
+
+
+def test_bulk_upload_stops_reading_at_row_limit(client: TestClient, monkeypatch):
+    import asyncio
+
+    from fastapi import HTTPException
+
+    from backend.app.api import variables
+
+    monkeypatch.setattr(variables, "BULK_MAX_ROWS", 3)
+    r = client.post("/variables/bulk/upload", content="name\na\nb\nc\nd\n", headers={"Content-Type": "text/csv"})
+    assert r.status_code == 413
+
+    class Body:
+        read = 0
+
+        async def stream(self):
+            for i in range(1000):
+                self.read += 1
+                yield f'{{"name": "row{i}"}}\n'.encode()
+
+    body = Body()
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(variables._body_rows(body, "application/x-ndjson"))
+    assert e.value.status_code == 413
+    # rejected at row BULK_MAX_ROWS, not after buffering the whole body
+    assert body.read == 4
+
+
+def test_variable_tree(client: TestClient):
+    def create(name, parent=None):
+        r = client.post("/variables", json={"name": name, "parent_variable_id": parent})
+        assert r.status_code == 201
+        return r.json()["id"]
+
+    root = create("root")
+    a = create("a", root)
+    b = create("b", a)
+    c = create("c", b)
+    a2 = create("a2", root)
+    lone = create("lone")
+
+    data = client.get("/variables/tree").json()
+    assert data["total"] == 6
+    assert [n["id"] for n in data["roots"]] == [root, lone]
+    top = data["roots"][0]
+    assert top["subtree_size"] == 5
+    assert [n["id"] for n in top["children"]] == [a, a2]
+    assert top["children"][0]["children"][0]["children"][0]["id"] == c
+    assert top["children"][0]["children"][0]["children"][0]["depth"] == 3
+
+    sub = client.get(f"/variables/{a}/tree", params={"max_depth": 1}).json()
+    assert sub["id"] == a and sub["subtree_size"] == 2
+    assert client.get("/variables/99999/tree").status_code == 404
+
+    # cycle checks walk all ancestors, not just the direct parent
+    r = client.patch(f"/variables/{root}", json={"parent_variable_id": c})
+    assert r.status_code == 422
+
+    # deleted parent -> orphaned subtree becomes a root
+    client.delete(f"/variables/{a}")
+    data = client.get("/variables/tree").json()
+    assert data["orphan_ids"] == [b]
+    assert [n["id"] for n in data["roots"]] == [root, b, lone]
+
+    # the API refuses to close a cycle, also through bulk upsert
+    r = client.post("/variables/bulk", json={"items": [{"name": "lone", "parent_variable_id": c}], "upsert": True})
+    assert r.json()["updated_ids"] == [lone]
+    r = client.post("/variables/bulk", json={"items": [{"name": "b", "parent_variable_id": lone}], "upsert": True})
+    assert r.json()["updated_ids"] == []
+    assert "cycle" in r.json()["errors"][0]["errors"][0]
+
+    # cycles stored by other writers are reported, not followed forever
+    from backend.app.models.variable import Variable
+    from backend.app.versions import VARIABLES, bump
+
+    db = next(app.dependency_overrides[get_db]())
+    db.get(Variable, b).parent_variable_id = lone
+    db.commit()
+    bump(db, VARIABLES)
+    db.close()
+    data = client.get("/variables/tree").json()
+    assert sorted(data["cyclic_ids"]) == sorted([b, c, lone])
+    assert client.get(f"/variables/{b}/tree").json()["subtree_size"] == 3
+
+
+def test_variable_search_ranked_and_synced(client: TestClient):
+    items = [
+        {"name": "Ciśnienie wtrysku", "symbol": "p_inj", "description": "pressure at injection"},
+        {"name": "Czas cyklu", "symbol": "t_cycle"},
+        {"name": "Temperatura formy", "description": "ciśnienie nie ma tu wpływu"},
+        {"name": "Cisnienie docisku"},
+    ]
+    ids = client.post("/variables/bulk", json={"items": items}).json()["created_ids"]
+
+    r = client.get("/variables/search", params={"q": "cisn"})
+    assert r.status_code == 200
+    hits = [h["id"] for h in r.json()["items"]]
+    # name matches rank above description matches; accents are folded
+    assert set(hits[:2]) == {ids[0], ids[3]}
+    assert hits[2] == ids[2]
+
+    assert [h["id"] for h in client.get("/variables/search", params={"q": "cisnienie wtr"}).json()["items"]] == [ids[0]]
+    assert client.get("/variables/search", params={"q": "t_cycle"}).json()["items"][0]["id"] == ids[1]
+    # typo tolerance
+    assert client.get("/variables/search", params={"q": "temperatra"}).json()["items"][0]["id"] == ids[2]
+    assert client.get("/variables/search", params={"q": "temperatra", "fuzzy": False}).json()["items"] == []
+
+    # single-row writes update the index in place
+    client.patch(f"/variables/{ids[1]}", json={"name": "Czas chłodzenia"})
+    assert client.get("/variables/search", params={"q": "chlodz"}).json()["items"][0]["id"] == ids[1]
+    assert client.get("/variables/search", params={"q": "cyklu"}).json()["items"] == []
+    client.delete(f"/variables/{ids[3]}")
+    assert ids[3] not in [h["id"] for h in client.get("/variables/search", params={"q": "cisn"}).json()["items"]]
+
+
+
+def test_pg_search_folds_accents_like_the_index():
+    """The PostgreSQL query compares folded text against the unaccented (indexed) expressions."""
+    from sqlalchemy.dialects import postgresql
+
+    from backend.app.models.variable import PG_SEARCH_TSVECTOR
+    from backend.app.variable_search import pg_search
+
+    class Recorder:
+        def execute(self, stmt):
+            self.sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+            return self
+
+        def all(self):
+            return []
+
+    db = Recorder()
+    assert pg_search(db, "  Ciśnienie Łuku ") == []
+    assert "immutable_unaccent" in PG_SEARCH_TSVECTOR
+    assert "immutable_unaccent(variables.name) ILIKE 'cisnienie luku%%'" in db.sql
+    assert "immutable_unaccent(variables.symbol) ILIKE" in db.sql
+    assert "'cisnienie:* & luku:*'" in db.sql
+    assert "similarity(immutable_unaccent(variables.name), 'cisnienie luku')" in db.sql
+    assert "Ciśnienie" not in db.sql
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable clock for write timestamps (versions) and Last-Modified (http_cache)."""
+    from datetime import datetime, timedelta, timezone
+
+    from backend.app import versions
+    from backend.app.api import http_cache
+
+    now = [datetime(2026, 10, 19, 12, 0, 0, 500000, tzinfo=timezone.utc)]
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now[0]
+
+    monkeypatch.setattr(versions, "datetime", Clock)
+    monkeypatch.setattr(http_cache, "datetime", Clock)
+
+    def advance(seconds: float) -> None:
+        now[0] += timedelta(seconds=seconds)
+
+    return advance
+
+
+def test_conditional_get_and_page_cache(client: TestClient, clock):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    var_id = client.post("/variables", json={"name": "cached"}).json()["id"]
+    clock(2)
+    r = client.get("/variables", params={"limit": 10})
+    etag, modified = r.headers["ETag"], r.headers["Last-Modified"]
+    assert r.json()["total"] == 1
+
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        assert client.get("/variables", params={"limit": 10}, headers={"If-None-Match": etag}).status_code == 304
+        assert client.get("/variables", params={"limit": 10}, headers={"If-Modified-Since": modified}).status_code == 304
+        # same page again without validators: served from the serialized page cache
+        again = client.get("/variables", params={"limit": 10})
+        assert again.status_code == 200 and again.json() == r.json()
+        assert statements == []
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+
+    detail = client.get(f"/variables/{var_id}")
+    assert client.get(f"/variables/{var_id}", headers={"If-None-Match": detail.headers["ETag"]}).status_code == 304
+    client.patch(f"/variables/{var_id}", json={"unit": "mm"})
+    r = client.get("/variables", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()["items"][0]["unit"] == "mm"
+
+    # a second write within the same second must not turn If-Modified-Since into a false 304
+    clock(2)
+    client.patch(f"/variables/{var_id}", json={"unit": "cm"})
+    modified = client.get("/variables", params={"limit": 10}).headers["Last-Modified"]
+    client.patch(f"/variables/{var_id}", json={"unit": "m"})
+    r = client.get("/variables", params={"limit": 10}, headers={"If-Modified-Since": modified})
+    assert r.status_code == 200 and r.json()["items"][0]["unit"] == "m"
+    clock(2)
+    modified = client.get("/variables", params={"limit": 10}).headers["Last-Modified"]
+    assert client.get("/variables", params={"limit": 10}, headers={"If-Modified-Since": modified}).status_code == 304
+
+    # relationship writes do not invalidate variable pages
+    other = client.post("/variables", json={"name": "other"}).json()["id"]
+    etag = client.get("/variables", params={"limit": 10}).headers["ETag"]
+    rel = client.post("/relationships", json={"source_variable_id": var_id, "target_variable_id": other})
+    assert rel.status_code == 201
+    assert client.get("/variables", params={"limit": 10}, headers={"If-None-Match": etag}).status_code == 304
+    rel_etag = client.get("/relationships").headers["ETag"]
+    client.delete(f"/relationships/{rel.json()['id']}")
+    assert client.get("/relationships", headers={"If-None-Match": rel_etag}).status_code == 200
+
+
+def test_batch_patch_variables(client: TestClient):
+    ids = client.post("/variables/bulk", json={"items": [
+        {"name": f"cal{i}", "min_value": 0, "max_value": 10, "confidence": 0.5} for i in range(4)
+    ]}).json()["created_ids"]
+    a, b, c, d = ids
+    client.patch(f"/variables/{b}", json={"parent_variable_id": a})
+    etag = client.get("/variables").headers["ETag"]
+
+    r = client.patch("/variables/batch", json={"items": [
+        {"id": a, "max_value": 20, "confidence": 0.9},
+        {"id": b, "min_value": 15},                      # 15 >= max 10
+        {"id": c, "name": "cal0"},                       # taken by a
+        {"id": d, "parent_variable_id": b, "unit": "kg"},
+        {"id": a, "unit": "g"},                          # duplicate id
+        {"id": 10**6, "unit": "g"},
+    ]})
+    assert r.status_code == 200
+    data = r.json()
+    assert [v["id"] for v in data["items"]] == [a, d]
+    assert data["items"][0]["max_value"] == 20 and data["items"][0]["confidence"] == 0.9
+    assert data["items"][1]["parent_variable_id"] == b and data["items"][1]["unit"] == "kg"
+    assert [e["row"] for e in data["errors"]] == [1, 2, 4, 5]
+    assert client.get("/variables", headers={"If-None-Match": etag}).status_code == 200
+
+    # a becoming a child of d would close a -> b -> d -> a; names held by other variables are taken
+    r = client.patch("/variables/batch", json={"items": [
+        {"id": a, "parent_variable_id": d},
+        {"id": b, "name": "cal2"},
+        {"id": c, "name": "renamed"},
+    ]})
+    assert [e["row"] for e in r.json()["errors"]] == [0, 1]
+    assert "cycle" in r.json()["errors"][0]["errors"][0]
+    assert [v["name"] for v in r.json()["items"]] == ["renamed"]
+    assert client.get(f"/variables/{a}").json()["parent_variable_id"] is None
+
+    r = client.patch("/variables/batch", json={"all_or_nothing": True, "items": [
+        {"id": a, "confidence": 0.1},
+        {"id": b, "parent_variable_id": b},
+    ]})
+    assert r.json()["items"] == []
+    assert client.get(f"/variables/{a}").json()["confidence"] == 0.9
+
+
+def test_hard_delete_variable_async(client):
+    parent = client.post("/variables", json={"name": "p"}).json()["id"]
+    child = client.post("/variables", json={"name": "c", "parent_variable_id": parent}).json()["id"]
+
+    assert client.delete(f"/variables/{parent}", params={"hard_delete": True}).status_code == 204
+    assert client.get(f"/variables/{parent}", params={"include_inactive": True}).status_code == 404
+    assert client.get(f"/variables/{child}").json()["parent_variable_id"] is None
+    assert client.get(f"/variables/{child}/children").json() == []